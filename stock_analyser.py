@@ -9,17 +9,34 @@ Jazyk: pouze čeština
 """
 
 import os
+import copy
+import sys
 import warnings
 warnings.filterwarnings('ignore', category=DeprecationWarning)
 warnings.filterwarnings('ignore', category=FutureWarning, module=r'google\.generativeai\..*')
 import requests
 import re
 import json
+import hashlib
+import hmac
+import pickle
+import sqlite3
+import zlib
 import math
+import random
+import threading
 import time
 import datetime as dt
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+import functools
+import inspect
+import contextvars
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
 
 import numpy as np
 import pandas as pd
@@ -27,26 +44,39 @@ import yfinance as yf
 import streamlit as st
 import streamlit.components.v1 as components
 
+# Copy-on-write (v pandas 3 default): sdílené cachované DataFrame se nikdy nezmění in-place
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
-# Page config must be the first Streamlit command
-st.set_page_config(
-    page_title="Stock Picker Pro",
-    page_icon="📈",
-    layout="wide",
-    initial_sidebar_state="expanded",
-)
+
+def _in_streamlit() -> bool:
+    """True při `streamlit run`; při importu z CLI/batch/testů se UI příkazy přeskočí."""
+    try:
+        from streamlit.runtime import exists
+        return bool(exists())
+    except Exception:
+        return False
 
 
-# --- Layout fix (full width on desktop) ---
-st.markdown(
-    """
-    <style>
-      .block-container { max-width: 100% !important; padding-left: 1.2rem; padding-right: 1.2rem; }
-      @media (max-width: 768px) { .block-container { padding-left: 0.8rem; padding-right: 0.8rem; } }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+if _in_streamlit():
+    # Page config must be the first Streamlit command
+    st.set_page_config(
+        page_title="Stock Picker Pro",
+        page_icon="📈",
+        layout="wide",
+        initial_sidebar_state="expanded",
+    )
+
+    # --- Layout fix (full width on desktop) ---
+    st.markdown(
+        """
+        <style>
+          .block-container { max-width: 100% !important; padding-left: 1.2rem; padding-right: 1.2rem; }
+          @media (max-width: 768px) { .block-container { padding-left: 0.8rem; padding-right: 0.8rem; } }
+        </style>
+        """,
+        unsafe_allow_html=True,
+    )
 # (duplicate CSS removed)
 
 
@@ -186,6 +216,31 @@ SEC_USER_AGENT = _get_secret("SEC_USER_AGENT", "StockPickerPro/1.0 (contact: you
 ALPHAVANTAGE_API_KEY = _get_secret("ALPHAVANTAGE_API_KEY", "")
 FINNHUB_API_KEY = _get_secret("FINNHUB_API_KEY", "")
 NINJAS_API_KEY = _get_secret("NINJAS_API_KEY", "") or _get_secret("Ninjas_API_KEY", "")
+ADMIN_TOKEN = _get_secret("ADMIN_TOKEN", "")  # ?admin=<token> otevře cache metriky; prázdný = admin stránka vypnutá
+
+
+def _mode_flag(name: str) -> bool:
+    """Režim zapnutý přes CLI (`streamlit run stock_analyser.py -- --offline`), env nebo secrets."""
+    if f"--{name.lower()}" in sys.argv:
+        return True
+    return (os.environ.get(name) or _get_secret(name, "0")) not in ("", "0", "false", "False")
+
+
+# Offline replay / record (viz "Offline / record snapshoty")
+OFFLINE_MODE = _mode_flag("OFFLINE")  # všechny provider cally se odpoví ze SNAPSHOT_DIR, žádná síť
+RECORD_MODE = _mode_flag("RECORD") and not OFFLINE_MODE  # živé cally se navíc uloží do SNAPSHOT_DIR
+
+
+def _use_offline_keys() -> None:
+    """Klíče nejsou součástí klíče snapshotu; offline stačí projít kontrolami "klíč je nastaven"."""
+    global GEMINI_API_KEY, FMP_API_KEY, ALPHAVANTAGE_API_KEY, FINNHUB_API_KEY, NINJAS_API_KEY
+    GEMINI_API_KEY, FMP_API_KEY, ALPHAVANTAGE_API_KEY, FINNHUB_API_KEY, NINJAS_API_KEY = (
+        k or "offline" for k in (GEMINI_API_KEY, FMP_API_KEY, ALPHAVANTAGE_API_KEY, FINNHUB_API_KEY, NINJAS_API_KEY)
+    )
+
+
+if OFFLINE_MODE:
+    _use_offline_keys()
 
 # PDF Export
 try:
@@ -196,6 +251,20 @@ try:
 except Exception:
     _HAS_PDF = False
 
+# Sdílená cache mezi replikami (volitelné)
+try:
+    import redis as _redis
+    _HAS_REDIS = True
+except Exception:
+    _redis = None
+    _HAS_REDIS = False
+
+# Zámek zápisu universe matice mezi procesy (jen POSIX; jinak stačí zámek ve vlákně)
+try:
+    import fcntl as _fcntl
+except Exception:
+    _fcntl = None
+
 # Constants
 APP_NAME = "Stock Picker Pro"
 APP_VERSION = "v7.0"
@@ -285,6 +354,48 @@ GURUS = {
 DATA_DIR = os.path.join(os.path.dirname(__file__), ".stock_picker_pro")
 WATCHLIST_PATH = os.path.join(DATA_DIR, "watchlist.json")
 MEMOS_PATH = os.path.join(DATA_DIR, "memos.json")
+# Offline / record běh nesmí plnit živé story a cache přehranými daty (ani chybami "chybí snapshot")
+SNAPSHOT_MODE = "offline" if OFFLINE_MODE else ("record" if RECORD_MODE else "")
+STORE_DIR = os.path.join(DATA_DIR, SNAPSHOT_MODE) if SNAPSHOT_MODE else DATA_DIR  # story, indexy a disková cache
+PRICE_STORE_DIR = os.path.join(STORE_DIR, "prices")  # Parquet per ticker (denní OHLCV)
+PRICE_STORE_REFRESH_S = 3600  # jak často se store ptá yfinance na nové bary
+ATH_INDEX_PATH = os.path.join(STORE_DIR, "ath_index.json")  # ticker -> ATH / drawdown
+INTRADAY_STORE_DIR = os.path.join(STORE_DIR, "intraday")  # Parquet per ticker a interval (1m / 5m / 1h)
+INTRADAY_REFRESH_S = 60  # při obchodování se intraday store dotahuje max. 1× za minutu
+INTRADAY_RETENTION_DAYS = {"1m": 7, "5m": 60, "1h": 730}  # starší bary se slučují do hrubšího intervalu / zahazují
+UNIVERSE_DIR = os.path.join(STORE_DIR, "universe")  # memmap matice close/volume (datum × ticker) pro cross-ticker analýzy
+UNIVERSE_HISTORY_YEARS = 20  # kolik let historie matice drží
+UNIVERSE_HEADROOM_ROWS = 260  # volné řádky (~1 rok) pro inkrementální append bez přestavby souborů
+STATEMENT_STORE_DIR = os.path.join(STORE_DIR, "statements")  # Parquet per ticker (výkazy, long formát)
+STATEMENT_INDEX_PATH = os.path.join(STORE_DIR, "statement_index.json")  # ticker -> kdy se znovu ptát
+STATEMENT_REPORT_LAG_DAYS = 45  # do kolika dní po konci kvartálu firmy obvykle reportují (10-Q)
+STATEMENT_RECHECK_S = 86400  # po termínu reportu se ptáme max. 1× denně, dokud nový kvartál nepřijde
+EARNINGS_DATES_PATH = os.path.join(STORE_DIR, "earnings_dates.json")  # ticker -> poslední / příští earnings
+TICKER_INDEX_PATH = os.path.join(STORE_DIR, "ticker_index.pkl.z")  # trie + trigramy nad SEC tickery a názvy firem
+TICKER_INDEX_MAX_AGE_S = 7 * 86400  # jak často se index přestaví z company_tickers.json
+EARNINGS_HOT_DAYS = 3  # kolik dní po earnings se fundamenty obnovují agresivně (po hodinách)
+FUNDAMENTALS_MAX_TTL = 14 * 86400  # horní mez cache fundamentů mimo earnings sezónu
+CACHE_BACKEND = "memory" if SNAPSHOT_MODE else _get_secret("CACHE_BACKEND", "tiered")  # tiered | memory | redis | streamlit
+CACHE_NAMESPACE = f"spp-{SNAPSHOT_MODE}" if SNAPSHOT_MODE else "spp"  # prefix klíčů (sdílený Redis může obsluhovat víc aplikací)
+CACHE_KEY_VERSION = 1  # zvýšit při změně tvaru cachovaných hodnot -> staré klíče se ignorují
+REDIS_URL = _get_secret("REDIS_URL", "")  # např. redis://cache:6379/0 (pro CACHE_BACKEND="redis")
+REDIS_HMAC_KEY = _get_secret("REDIS_HMAC_KEY", "")  # sdílený tajný klíč replik; podpis hodnot v Redis
+CACHE_DB_PATH = os.path.join(STORE_DIR, "cache.sqlite")
+CACHE_MEMORY_MAX_ENTRIES = 2048
+CACHE_MEMORY_MAX_BYTES = 256 * 1024 * 1024
+CACHE_DISK_MAX_BYTES = 1024 * 1024 * 1024
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR") or _get_secret("SNAPSHOT_DIR", "") or os.path.join(DATA_DIR, "snapshot")
+CACHE_SHARED_MAX_ENTRIES = 512  # sdílené (zero-copy) objekty v procesu, viz @cached(shared=True)
+
+# Tickery na uvítací obrazovce (a ve warming jobu)
+WELCOME_SAMPLE_TICKERS = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "META", "NFLX"]
+
+WARM_CACHES = _get_secret("WARM_CACHES", "1") not in ("0", "false", "False")
+WARM_INTERVAL_S = 1800  # jak často warming job běží (plus jednou hned po startu procesu)
+WARM_CONCURRENCY = 3  # kolik tickerů se zahřívá souběžně
+WARM_INSIDER = True  # insider data (FMP/Finnhub/Ninjas/SEC, bez Alpha Vantage) – nejdražší část warmingu
+PREFETCH = _get_secret("PREFETCH", "1") not in ("0", "false", "False")  # spekulativní prefetch po analýze
+PREFETCH_WATCHLIST_TOP = 5  # kolik prvních položek watchlistu se předehřeje po každé analýze
 
 # Sector to peers mapping (expand as needed)
 SECTOR_PEERS = {
@@ -369,21 +480,15 @@ def calculate_graham_number(info: Dict[str, Any]) -> Optional[float]:
         return None
 
 
-def calculate_piotroski_fscore(info: Dict[str, Any], income: pd.DataFrame, balance: pd.DataFrame, cashflow: pd.DataFrame) -> Tuple[int, Dict[str, int]]:
+def calculate_piotroski_fscore(info: Dict[str, Any], income: "StatementLike", balance: "StatementLike", cashflow: "StatementLike") -> Tuple[int, Dict[str, int]]:
     """
     Piotroski F-Score (0-9): 9-bodový fundamental quality check.
     Vyšší = lepší kvalita fundamentů.
+    Výkazy jako DataFrame (tvar yfinance) nebo už normalizované `CanonicalStatement`.
     """
     score = 0
     breakdown: Dict[str, int] = {}
-
-    def _row(df: pd.DataFrame, candidates: List[str]) -> Optional[pd.Series]:
-        if df is None or df.empty:
-            return None
-        for c in candidates:
-            if c in df.index:
-                return df.loc[c]
-        return None
+    income, balance = normalize_statement(income), normalize_statement(balance)
 
     try:
         # --- Profitabilita (4 body) ---
@@ -399,14 +504,12 @@ def calculate_piotroski_fscore(info: Dict[str, Any], income: pd.DataFrame, balan
 
         # Change in ROA (YoY) - from income statement
         if not income.empty and len(income.columns) >= 2:
-            ni_row = _row(income, ["Net Income", "Net Income Applicable To Common Shares"])
-            ta_row = _row(balance, ["Total Assets"]) if not balance.empty else None
-            if ni_row is not None and ta_row is not None:
+            if income.row("net_income") is not None and balance.row("total_assets") is not None:
                 try:
-                    ni_curr = safe_float(ni_row.iloc[0])
-                    ni_prev = safe_float(ni_row.iloc[1])
-                    ta_curr = safe_float(ta_row.iloc[0])
-                    ta_prev = safe_float(ta_row.iloc[1])
+                    ni_curr = income.value("net_income", 0)
+                    ni_prev = income.value("net_income", 1)
+                    ta_curr = balance.value("total_assets", 0)
+                    ta_prev = balance.value("total_assets", 1)
                     if all(v is not None and v != 0 for v in [ni_curr, ni_prev, ta_curr, ta_prev]):
                         roa_curr = ni_curr / ta_curr
                         roa_prev = ni_prev / ta_prev
@@ -466,8 +569,8 @@ def calculate_piotroski_fscore(info: Dict[str, Any], income: pd.DataFrame, balan
 
 def calculate_altman_zscore(
     info: Dict[str, Any],
-    income: Optional[pd.DataFrame] = None,
-    balance: Optional[pd.DataFrame] = None,
+    income: "StatementLike" = None,
+    balance: "StatementLike" = None,
     market_cap: Optional[float] = None,
 ) -> Tuple[Optional[float], str]:
     """
@@ -485,30 +588,16 @@ def calculate_altman_zscore(
         if "financial" in sector or any(k in industry for k in ["bank", "insurance", "capital markets"]):
             return None, "N/A pro finanční sektor"
 
-        def _df_value(df: Optional[pd.DataFrame], candidates: List[str]) -> Optional[float]:
-            if df is None or getattr(df, "empty", True):
-                return None
-            for c in candidates:
-                if c in df.index:
-                    try:
-                        return safe_float(df.loc[c].iloc[0])
-                    except Exception:
-                        continue
-            return None
-
+        income, balance = normalize_statement(income), normalize_statement(balance)
         missing = []
 
-        total_assets = safe_float(info.get("totalAssets")) or _df_value(balance, ["Total Assets"])
+        total_assets = safe_float(info.get("totalAssets")) or balance.value("total_assets")
         if not total_assets or total_assets <= 0:
             return None, "Data nedostupná"
 
         # Working capital = current assets - current liabilities
-        current_assets = safe_float(info.get("totalCurrentAssets")) or _df_value(
-            balance, ["Total Current Assets", "Current Assets"]
-        )
-        current_liab = safe_float(info.get("totalCurrentLiabilities")) or _df_value(
-            balance, ["Total Current Liabilities", "Current Liabilities"]
-        )
+        current_assets = safe_float(info.get("totalCurrentAssets")) or balance.value("current_assets")
+        current_liab = safe_float(info.get("totalCurrentLiabilities")) or balance.value("current_liabilities")
         if current_assets is None or current_liab is None:
             missing.append("WC")
         working_capital = (current_assets or 0) - (current_liab or 0)
@@ -516,14 +605,14 @@ def calculate_altman_zscore(
         # Retained earnings
         retained_earnings = (
             safe_float(info.get("retainedEarnings") or info.get("retainedEarningsAccumulatedDeficit"))
-            or _df_value(balance, ["Retained Earnings", "Retained Earnings (Accumulated Deficit)"])
+            or balance.value("retained_earnings")
             or 0
         )
         if retained_earnings == 0:
             missing.append("RE")
 
         # EBIT
-        ebit = safe_float(info.get("ebit")) or _df_value(income, ["Ebit", "EBIT", "Operating Income"]) or 0
+        ebit = safe_float(info.get("ebit")) or income.value("ebit") or 0
         if ebit == 0:
             # fallback to EBITDA if nothing else
             ebit = safe_float(info.get("ebitda")) or 0
@@ -531,7 +620,7 @@ def calculate_altman_zscore(
             missing.append("EBIT")
 
         # Revenue / Sales
-        revenue = safe_float(info.get("totalRevenue")) or _df_value(income, ["Total Revenue", "Operating Revenue"]) or 0
+        revenue = safe_float(info.get("totalRevenue")) or income.value("revenue") or 0
         if revenue == 0:
             missing.append("Sales")
 
@@ -548,25 +637,10 @@ def calculate_altman_zscore(
             missing.append("MVE")
 
         # Total liabilities (book) – NOT totalDebt
-        total_liabilities = safe_float(info.get("totalLiabilities")) or _df_value(
-            balance,
-            [
-                "Total Liab",
-                "Total Liabilities Net Minority Interest",
-                "Total Liabilities",
-            ],
-        )
+        total_liabilities = safe_float(info.get("totalLiabilities")) or balance.value("total_liabilities")
         if total_liabilities is None or total_liabilities <= 0:
             # try assets - equity
-            total_equity = _df_value(
-                balance,
-                [
-                    "Total Stockholder Equity",
-                    "Stockholders Equity",
-                    "Total Equity Gross Minority Interest",
-                    "Total Equity",
-                ],
-            )
+            total_equity = balance.value("total_equity")
             if total_equity is not None:
                 total_liabilities = total_assets - total_equity
 
@@ -742,12 +816,13 @@ def calculate_mean_reversion_pe(ticker: str) -> Tuple[Optional[float], Optional[
     """
     try:
         t = yf.Ticker(ticker)
-        hist = t.history(period="5y", interval="3mo", auto_adjust=False)
+        hist = _yf_call("history", ticker, lambda: t.history(period="5y", interval="3mo", auto_adjust=False),
+                        period="5y", interval="3mo")
         if hist.empty:
             return None, None
         # yfinance nevrací historické PE přímo - používáme cenu a EPS odhad
         # Jako proxy: porovnáme P/B nebo P/S přes dobu
-        info = t.info
+        info = _yf_call("info", ticker, lambda: t.info) or {}
         curr_pe = safe_float(info.get("trailingPE"))
         return curr_pe, None  # simplified - plná implementace by potřebovala historical EPS
     except Exception:
@@ -786,12 +861,14 @@ def simulate_investment(ticker: str, amount_czk: float, years_back: int = 5) ->
     try:
         period = f"{years_back}y"
         t = yf.Ticker(ticker)
-        hist = t.history(period=period, auto_adjust=True)
+        hist = _yf_call("history", ticker, lambda: t.history(period=period, auto_adjust=True),
+                        period=period, auto_adjust=True)
         if hist.empty or len(hist) < 10:
             return None
 
         spy = yf.Ticker("SPY")
-        spy_hist = spy.history(period=period, auto_adjust=True)
+        spy_hist = _yf_call("history", "SPY", lambda: spy.history(period=period, auto_adjust=True),
+                            period=period, auto_adjust=True)
 
         start_price = float(hist["Close"].iloc[0])
         end_price = float(hist["Close"].iloc[-1])
@@ -853,6 +930,57 @@ def save_json(path: str, obj: Any) -> None:
         json.dump(obj, f, ensure_ascii=False, indent=2)
 
 
+def _save_json_atomic(path: str, obj: Any) -> None:
+    """save_json přes tmp + os.replace (pro indexy, které čtou souběžné sessions)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exkluzivní zámek `<path>.lock` napříč procesy (repliky / workery sdílí DATA_DIR); bez fcntl no-op."""
+    if _fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "a") as fh:
+        _fcntl.flock(fh, _fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            _fcntl.flock(fh, _fcntl.LOCK_UN)
+
+
+def _file_version(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st_ = os.stat(path)
+        return st_.st_mtime_ns, st_.st_ino
+    except OSError:
+        return None
+
+
+def _shared_json_index(name: str, path: str) -> Dict[str, Any]:
+    """JSON index `path` držený v paměti procesu; znovu se načte, když ho přepsal jiný proces (mtime / inode)."""
+    version = _file_version(path)
+    cached = _PROCESS_STATE.get(name)
+    if not isinstance(cached, tuple) or cached[0] != version:
+        data = load_json(path, {})
+        cached = _PROCESS_STATE[name] = (version, data if isinstance(data, dict) else {})
+    return cached[1]
+
+
+def _update_json_index(name: str, path: str, update: Callable[[Dict[str, Any]], bool]) -> None:
+    """Read-merge-write pod zámkem souboru: `update` dostane aktuální obsah (včetně zápisů jiných procesů), True = uložit."""
+    with _file_lock(path):
+        index = _shared_json_index(name, path)
+        if update(index):
+            _save_json_atomic(path, index)
+            _PROCESS_STATE[name] = (_file_version(path), index)
+
+
 def safe_float(x: Any) -> Optional[float]:
     try:
         if x is None:
@@ -909,286 +1037,2901 @@ def clamp(v: Optional[float], lo: float, hi: float) -> Optional[float]:
 
 
 # ============================================================================
-# DATA FETCHING (CACHED)
+# STAV PROCESU (přežije rerun Streamlitu)
 # ============================================================================
+# Streamlit při každém rerunu spouští skript znovu v novém jmenném prostoru modulu, takže
+# obyčejné globály (cache backend, single-flight, rate limiter, warmer, fronty) by se
+# resetovaly. Sdílené objekty proto žijí v registru uloženém v sys.modules (jeden na proces).
 
-@st.cache_data(show_spinner=False, ttl=3600)
-def fetch_ticker_info(ticker: str) -> Dict[str, Any]:
-    """Fetch basic info from Yahoo Finance."""
-    try:
-        t = yf.Ticker(ticker)
-        return t.info or {}
-    except Exception:
-        return {}
+_PROCESS_STATE: Dict[str, Any] = sys.modules.setdefault(
+    "_stock_picker_pro_state", type(sys)("_stock_picker_pro_state")).__dict__
+_PROCESS_STATE_LOCK: threading.RLock = _PROCESS_STATE.setdefault("__lock__", threading.RLock())
 
 
-@st.cache_data(show_spinner=False, ttl=3600)
-def fetch_price_history(ticker: str, period: str = "1y") -> pd.DataFrame:
-    """Fetch historical price data."""
-    try:
-        t = yf.Ticker(ticker)
-        df = t.history(period=period, auto_adjust=False)
-        return df if not df.empty else pd.DataFrame()
-    except Exception:
-        return pd.DataFrame()
+def _process_state(name: str, factory: Callable[[], Any]) -> Any:
+    """Objekt `name` sdílený všemi reruny v procesu; při prvním přístupu ho vytvoří `factory()`."""
+    value = _PROCESS_STATE.get(name)
+    if value is None:
+        with _PROCESS_STATE_LOCK:
+            value = _PROCESS_STATE.get(name)
+            if value is None:
+                value = _PROCESS_STATE[name] = factory()
+    return value
 
 
-@st.cache_data(show_spinner=False, ttl=3600)
-def fetch_financials(ticker: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    """Fetch income statement, balance sheet, and cash flow."""
-    try:
-        t = yf.Ticker(ticker)
-        income = t.financials
-        balance = t.balance_sheet
-        cashflow = t.cashflow
-        return (
-            income if income is not None else pd.DataFrame(),
-            balance if balance is not None else pd.DataFrame(),
-            cashflow if cashflow is not None else pd.DataFrame()
-        )
-    except Exception:
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+# ============================================================================
+# CACHE BACKENDS (mimo Streamlit: CLI, batch, testy)
+# ============================================================================
+# `@cached(ttl=...)` nahrazuje @st.cache_data u fetch funkcí. Dvě vrstvy:
+#   1) MemoryLRUCache – v procesu, limit počtu položek i bajtů
+#   2) SQLiteCache    – na disku (DATA_DIR/cache.sqlite), přežije restart procesu
+# Hodnoty se ukládají jako pickle+zlib, takže hit vrací kopii (stejně jako st.cache_data).
+#   3) RedisCache     – volitelně místo disku, sdílená mezi replikami (REDIS_URL);
+#      payload je podepsaný HMAC-SHA256 (REDIS_HMAC_KEY) a před unpicklem se ověří,
+#      bez klíče se Redis nepoužije (unpickle dat ze sdíleného serveru = spuštění kódu)
+# CACHE_BACKEND = "tiered" (default) | "memory" | "redis" | "streamlit" (bajty v st.cache_resource,
+# maže je i "Clear cache" ve Streamlitu; cache_if / shared / metriky fungují stejně jako jinde).
+# Klíče: "<CACHE_NAMESPACE>:v<CACHE_KEY_VERSION>:<funkce>:<sha256 argumentů>".
+
+def _key_function(key: Any) -> str:
+    """Název cachované funkce z klíče backendu (ns:vN:funkce:hash)."""
+    parts = str(key).split(":")
+    return parts[2] if len(parts) >= 4 else str(key)
+
+
+class _CacheStats:
+    """Počítadla per funkce: hity (per vrstva), missy, latence missů, uložení, evikce, expirace.
+
+    Sdílí je @cached, backendy i swr_cached; čte je admin stránka (?admin=<ADMIN_TOKEN>) a JSON export.
+    """
 
+    LATENCY_SAMPLES = 200
 
-@st.cache_data(show_spinner=False, ttl=3600)
-def get_fcf_ttm_yfinance(ticker: str, market_cap: Optional[float] = None) -> Tuple[Optional[float], List[str]]:
-    """Robustně spočítá roční Free Cash Flow (TTM) z yfinance quarterly_cashflow.
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._fns: Dict[str, Dict[str, Any]] = {}
+        self.started_at = time.time()
 
-    Pravidla:
-    - Primárně sečte poslední 4 dostupné kvartály (TTM).
-    - Když chybí řádek 'Free Cash Flow', spočítá FCF jako Operating Cash Flow - |CapEx|.
-    - Pokud jsou dostupná jen 1-3 kvartální čísla, annualizuje průměrem ×4.
-    - Sanity check: pro obří firmy (MarketCap > $1T) a podezřele nízké FCF (< $30B)
-      aplikuje pojistku násobení 4× (typicky když provider vrátí jen 1 kvartál).
-    - Vrací (fcf_ttm, dbg) kde dbg je list informativních zpráv.
-    """
-    dbg: List[str] = []
-    try:
-        t = yf.Ticker(ticker)
-        qcf = getattr(t, "quarterly_cashflow", None)
-        if qcf is None or not isinstance(qcf, pd.DataFrame) or qcf.empty:
-            dbg.append("FCF: quarterly_cashflow není k dispozici (prázdné). Zkouším fallback.")
-            qcf = pd.DataFrame()
+    def _fn(self, fn: str) -> Dict[str, Any]:
+        d = self._fns.get(fn)
+        if d is None:
+            d = self._fns[fn] = {
+                "hits": 0, "misses": 0, "stores": 0, "stored_bytes": 0, "evictions": 0, "expired": 0,
+                "stale_hits": 0, "tier_hits": {}, "miss_ms": deque(maxlen=self.LATENCY_SAMPLES), "miss_ms_total": 0.0,
+            }
+        return d
+
+    def incr(self, fn: str, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self._fn(fn)[counter] += n
+
+    def tier_hit(self, fn: str, tier: str) -> None:
+        with self._lock:
+            th = self._fn(fn)["tier_hits"]
+            th[tier] = th.get(tier, 0) + 1
+
+    def miss(self, fn: str, elapsed_s: float) -> None:
+        with self._lock:
+            d = self._fn(fn)
+            d["misses"] += 1
+            d["miss_ms"].append(elapsed_s * 1000.0)
+            d["miss_ms_total"] += elapsed_s * 1000.0
+
+    def stored(self, fn: str, nbytes: int) -> None:
+        with self._lock:
+            d = self._fn(fn)
+            d["stores"] += 1
+            d["stored_bytes"] += nbytes
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for fn, d in self._fns.items():
+                lat = sorted(d["miss_ms"])
+                calls = d["hits"] + d["stale_hits"] + d["misses"]
+                out[fn] = {
+                    "hits": d["hits"],
+                    "stale_hits": d["stale_hits"],
+                    "misses": d["misses"],
+                    "hit_ratio": round((d["hits"] + d["stale_hits"]) / calls, 4) if calls else None,
+                    "tier_hits": dict(d["tier_hits"]),
+                    "stores": d["stores"],
+                    "avg_entry_bytes": int(d["stored_bytes"] / d["stores"]) if d["stores"] else None,
+                    "evictions": d["evictions"],
+                    "expired": d["expired"],
+                    "miss_ms_avg": round(d["miss_ms_total"] / d["misses"], 1) if d["misses"] else None,
+                    "miss_ms_p50": round(lat[len(lat) // 2], 1) if lat else None,
+                    "miss_ms_p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 1) if lat else None,
+                    "miss_ms_max": round(lat[-1], 1) if lat else None,
+                }
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._fns.clear()
+            self.started_at = time.time()
+
+
+CACHE_STATS = _process_state("cache_stats", _CacheStats)
+
+
+class CacheBackend:
+    """Rozhraní backendu: get -> (payload, expires_at) nebo None, set s TTL v sekundách (None = bez expirace)."""
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        raise NotImplementedError
+
+    def set(self, key: str, payload: bytes, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
 
-        def _pick_row(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
-            if df is None or df.empty:
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self, prefix: str = "") -> None:
+        raise NotImplementedError
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """{funkce: {"entries", "bytes"}} aktuálně uložených položek; {} = backend to neumí levně zjistit."""
+        return {}
+
+
+class MemoryLRUCache(CacheBackend):
+    name = "memory"
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
                 return None
-            idx = set(map(str, df.index))
-            for c in candidates:
-                if c in idx:
-                    return c
-            # zkus case-insensitive match
-            low_map = {str(i).strip().lower(): str(i) for i in df.index}
-            for c in candidates:
-                key = c.strip().lower()
-                if key in low_map:
-                    return low_map[key]
-            return None
+            if item[1] is not None and item[1] <= time.time():
+                self._pop(key)
+                CACHE_STATS.incr(_key_function(key), "expired")
+                return None
+            self._data.move_to_end(key)
+            return item
 
-        def _sorted_quarter_cols(df: pd.DataFrame) -> List[Any]:
-            cols = list(df.columns)
-            if not cols:
-                return []
-            dts = pd.to_datetime(cols, errors="coerce")
-            if dts.notna().any():
-                order = sorted(range(len(cols)), key=lambda i: dts[i], reverse=True)
-                return [cols[i] for i in order]
-            return cols  # fallback: keep original order
-
-        # 1) vyber poslední dostupné kvartály
-        cols_sorted = _sorted_quarter_cols(qcf)
-        cols_sel = cols_sorted[:4] if cols_sorted else []
-        if cols_sel:
-            dbg.append(f"FCF: Načítám kvartály: {', '.join([str(c) for c in cols_sel])}")
-        else:
-            dbg.append("FCF: Nenalezeny žádné kvartální sloupce v quarterly_cashflow.")
+    def set(self, key: str, payload: bytes, ttl: Optional[float] = None) -> None:
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (payload, time.time() + ttl if ttl is not None else None)
+            self._bytes += len(payload)
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                victim = next(iter(self._data))
+                self._pop(victim)
+                CACHE_STATS.incr(_key_function(victim), "evictions")
+
+    def _pop(self, key: str) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[0])
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            for k in [k for k in self._data if k.startswith(prefix)]:
+                self._pop(k)
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        out: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for k, (payload, _exp) in self._data.items():
+                u = out.setdefault(_key_function(k), {"entries": 0, "bytes": 0})
+                u["entries"] += 1
+                u["bytes"] += len(payload)
+        return out
+
+
+class SQLiteCache(CacheBackend):
+    """Perzistentní vrstva; při překročení `max_bytes` maže nejdéle nečtené položky."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+                " size INTEGER NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed_at)")
+            self._conn = conn
+        return self._conn
 
-        # 2) primárně: přímý řádek Free Cash Flow
-        fcf_row = _pick_row(qcf, ["Free Cash Flow", "FreeCashFlow", "Free cash flow"])
-        used_method = None
+    def get(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        try:
+            with self._lock:
+                db = self._db()
+                row = db.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                if row[1] is not None and row[1] <= now:
+                    db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    CACHE_STATS.incr(_key_function(key), "expired")
+                    return None
+                db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                return bytes(row[0]), row[1]
+        except sqlite3.Error:
+            return None
 
-        fcf_quarters = None
-        non_null = 0
+    def set(self, key: str, payload: bytes, ttl: Optional[float] = None) -> None:
+        if len(payload) > self.max_bytes:
+            return
+        try:
+            with self._lock:
+                db = self._db()
+                now = time.time()
+                db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, sqlite3.Binary(payload), len(payload), now + ttl if ttl is not None else None, now),
+                )
+                self._writes += 1
+                if self._writes % 50 == 1:
+                    self._evict(db, now)
+        except sqlite3.Error:
+            pass
 
-        if fcf_row and cols_sel:
-            s = pd.to_numeric(qcf.loc[fcf_row, cols_sel], errors="coerce")
-            non_null = int(s.notna().sum())
-            if non_null > 0:
-                fcf_quarters = s
-                used_method = f"quarterly row '{fcf_row}'"
-        # 3) fallback: OCF - |CapEx|
-        if fcf_quarters is None and cols_sel:
-            ocf_row = _pick_row(qcf, [
-                "Operating Cash Flow",
-                "Total Cash From Operating Activities",
-                "Total Cash From Operating Activities (Continuing Operations)",
-                "Cash Flow From Continuing Operating Activities",
-                "Net Cash Provided By Operating Activities",
-            ])
-            capex_row = _pick_row(qcf, [
-                "Capital Expenditures",
-                "Capital Expenditure",
-                "CapitalExpenditures",
-                "Purchase Of PPE",
-                "Purchase of Property Plant Equipment",
-            ])
-            if ocf_row and capex_row:
-                ocf = pd.to_numeric(qcf.loc[ocf_row, cols_sel], errors="coerce")
-                capex = pd.to_numeric(qcf.loc[capex_row, cols_sel], errors="coerce")
-                non_null = int((ocf.notna() & capex.notna()).sum())
-                if non_null > 0:
-                    # CapEx bývá záporný; chceme: FCF = OCF - |CapEx|
-                    fcf_quarters = ocf - capex.abs()
-                    used_method = f"computed: '{ocf_row}' - |'{capex_row}'|"
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Nejdéle nečtené položky, dokud nejsme na 90 % limitu
+        excess = total - int(self.max_bytes * 0.9)
+        freed = 0
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        db.executemany("DELETE FROM cache WHERE key = ?", victims)
+        for (key,) in victims:
+            CACHE_STATS.incr(_key_function(key), "evictions")
 
-        # 4) pokud pořád nic, fallback na annual cashflow / info
-        if fcf_quarters is None:
-            # annual cashflow
-            acf = getattr(t, "cashflow", None)
-            if isinstance(acf, pd.DataFrame) and not acf.empty:
-                acf_cols = _sorted_quarter_cols(acf)[:1]  # nejnovější rok
-                fcf_row_a = _pick_row(acf, ["Free Cash Flow", "FreeCashFlow", "Free cash flow"])
-                if fcf_row_a and acf_cols:
-                    v = safe_float(acf.loc[fcf_row_a, acf_cols[0]])
-                    if v is not None:
-                        dbg.append("FCF: Používám annual cashflow (nejnovější rok) – řádek Free Cash Flow.")
-                        used_method = "annual row 'Free Cash Flow'"
-                        fcf_ttm = float(v)
-                        msg = f"Použité roční FCF (TTM): ${fcf_ttm/1e9:.1f} miliard ({used_method})"
-                        dbg.append(msg)
-                        return fcf_ttm, dbg
+    def delete(self, key: str) -> None:
+        try:
+            with self._lock:
+                self._db().execute("DELETE FROM cache WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
 
-            # last resort: info['freeCashflow']
-            try:
-                info = getattr(t, "info", None) or {}
-            except Exception:
-                info = {}
-            v = safe_float(info.get("freeCashflow"))
-            if v is not None:
-                used_method = "info['freeCashflow'] (fallback)"
-                fcf_ttm = float(v)
-                msg = f"Použité roční FCF (TTM): ${fcf_ttm/1e9:.1f} miliard ({used_method})"
-                dbg.append(msg)
-                return fcf_ttm, dbg
+    def clear(self, prefix: str = "") -> None:
+        try:
+            with self._lock:
+                self._db().execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        except sqlite3.Error:
+            pass
 
-            dbg.append("FCF: Nepodařilo se získat FCF ani z quarterly ani z annual ani z info.")
-            return None, dbg
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        out: Dict[str, Dict[str, int]] = {}
+        try:
+            with self._lock:
+                rows = self._db().execute("SELECT key, size FROM cache").fetchall()
+        except sqlite3.Error:
+            return out
+        for k, size in rows:
+            u = out.setdefault(_key_function(k), {"entries": 0, "bytes": 0})
+            u["entries"] += 1
+            u["bytes"] += int(size)
+        return out
+
+
+class RedisCache(CacheBackend):
+    """Sdílená vrstva přes Redis protokol; `client` může být cokoliv s API redis-py (např. fakeredis).
+
+    Hodnota = HMAC-SHA256(secret, klíč + payload) + payload; nepodepsaná / podvržená hodnota je miss.
+    Při chybě spojení se backend na `backoff_s` vypne (miss místo čekání na timeout u každého volání).
+    """
 
-        # 5) TTM / extrapolace
-        fcf_vals = pd.to_numeric(fcf_quarters, errors="coerce").dropna()
-        n = int(fcf_vals.shape[0])
-        applied_extrap = False
-        used_sum4 = False
-
-        if n >= 4:
-            fcf_ttm = float(fcf_vals.iloc[:4].sum())
-            used_sum4 = True
-        elif n > 0:
-            # annualizace průměrem ×4
-            fcf_ttm = float(fcf_vals.mean() * 4.0)
-            applied_extrap = True
-        else:
-            dbg.append("FCF: kvartální hodnoty jsou všechny NaN.")
-            return None, dbg
+    name = "redis"
+    _MAC_LEN = 32
 
-        # 6) Sanity check (market cap > 1T & FCF < 30B) -> 4×
-        mc = safe_float(market_cap)
-        if (not applied_extrap) and used_sum4 and mc and mc > 1e12 and fcf_ttm < 30e9:
-            fcf_ttm *= 4.0
-            dbg.append("FCF: Sanity check aktivován (MarketCap > $1T a FCF < $30B) -> násobím 4× (podezření na 1 kvartál).")
+    def __init__(self, client: Any = None, url: str = "", backoff_s: float = 30.0, secret: str = ""):
+        if not secret:
+            raise RuntimeError("RedisCache vyžaduje REDIS_HMAC_KEY (podpis hodnot před unpicklem).")
+        self._secret = secret.encode("utf-8")
+        if client is None:
+            if not _HAS_REDIS:
+                raise RuntimeError("Balíček `redis` není nainstalován.")
+            client = _redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.client = client
+        self.backoff_s = backoff_s
+        self._down_until = 0.0
 
-        # 7) Debug zprávy
-        if used_method:
-            dbg.append(f"FCF metoda: {used_method}. Kvartály použity: {n}.")
-        if applied_extrap:
-            dbg.append(f"FCF: Extrapolace do roční báze (k dispozici {n} kvartály) -> průměr ×4.")
-        if used_sum4:
-            dbg.append("FCF: TTM = součet posledních 4 kvartálů.")
+    def _available(self) -> bool:
+        return time.time() >= self._down_until
 
-        msg = f"Použité roční FCF (TTM): ${fcf_ttm/1e9:.1f} miliard"
-        dbg.append(msg)
+    def _failed(self) -> None:
+        self._down_until = time.time() + self.backoff_s
 
-        return fcf_ttm, dbg
-    except Exception as e:
-        dbg.append(f"FCF: chyba při výpočtu TTM: {e}")
-        return None, dbg
-@st.cache_data(show_spinner=False, ttl=86400)  # ATH mění jednou denně max
-def get_all_time_high(ticker: str) -> Optional[float]:
-    """Get all-time high price."""
-    try:
-        t = yf.Ticker(ticker)
-        h = t.history(period="max", interval="1d", auto_adjust=False)
-        if h is None or h.empty:
+    def _mac(self, key: str, payload: bytes) -> bytes:
+        return hmac.new(self._secret, key.encode("utf-8") + b"\0" + payload, hashlib.sha256).digest()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        if not self._available():
+            return None
+        try:
+            pipe = self.client.pipeline()
+            pipe.get(key)
+            pipe.pttl(key)
+            payload, pttl = pipe.execute()
+        except Exception:
+            self._failed()
             return None
-        col = "High" if "High" in h.columns else ("Close" if "Close" in h.columns else None)
-        if not col:
+        if payload is None:
             return None
-        return float(pd.to_numeric(h[col], errors="coerce").max())
-    except Exception:
+        payload = bytes(payload)
+        mac, payload = payload[:self._MAC_LEN], payload[self._MAC_LEN:]
+        if not hmac.compare_digest(mac, self._mac(key, payload)):
+            return None
+        expires_at = time.time() + pttl / 1000.0 if pttl is not None and pttl > 0 else None
+        return payload, expires_at
+
+    def set(self, key: str, payload: bytes, ttl: Optional[float] = None) -> None:
+        if not self._available() or (ttl is not None and ttl <= 0):
+            return
+        payload = self._mac(key, payload) + payload
+        try:
+            if ttl is not None:
+                self.client.set(key, payload, px=max(1, int(ttl * 1000)))
+            else:
+                self.client.set(key, payload)
+        except Exception:
+            self._failed()
+
+    def delete(self, key: str) -> None:
+        try:
+            self.client.delete(key)
+        except Exception:
+            self._failed()
+
+    def clear(self, prefix: str = "") -> None:
+        try:
+            batch = []
+            for k in self.client.scan_iter(match=f"{prefix}*", count=500):
+                batch.append(k)
+                if len(batch) >= 500:
+                    self.client.delete(*batch)
+                    batch = []
+            if batch:
+                self.client.delete(*batch)
+        except Exception:
+            self._failed()
+
+
+@st.cache_resource(show_spinner=False)
+def _streamlit_byte_store(max_entries: int, max_bytes: int) -> MemoryLRUCache:
+    return MemoryLRUCache(max_entries, max_bytes)
+
+
+class StreamlitCache(CacheBackend):
+    """Paměťový LRU držený ve `st.cache_resource` (sdílený všemi sessions); store se hledá při každém volání,
+    takže po "Clear cache" ve Streamlitu backend pokračuje s prázdným."""
+
+    name = "streamlit"
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def _store(self) -> MemoryLRUCache:
+        return _streamlit_byte_store(self.max_entries, self.max_bytes)
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        return self._store().get(key)
+
+    def set(self, key: str, payload: bytes, ttl: Optional[float] = None) -> None:
+        self._store().set(key, payload, ttl)
+
+    def delete(self, key: str) -> None:
+        self._store().delete(key)
+
+    def clear(self, prefix: str = "") -> None:
+        self._store().clear(prefix)
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        return self._store().usage()
+
+
+class TieredCache(CacheBackend):
+    """Čte vrstvy postupně; hit v nižší vrstvě se propíše do vyšších (paměť)."""
+
+    name = "tiered"
+
+    def __init__(self, tiers: List[CacheBackend]):
+        self.tiers = tiers
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        for i, tier in enumerate(self.tiers):
+            item = tier.get(key)
+            if item is not None:
+                # Povýšení do vyšších vrstev se zbývajícím TTL (ne delším než na disku)
+                ttl = item[1] - time.time() if item[1] is not None else None
+                for upper in self.tiers[:i]:
+                    upper.set(key, item[0], ttl)
+                CACHE_STATS.tier_hit(_key_function(key), tier.name)
+                return item
         return None
 
+    def set(self, key: str, payload: bytes, ttl: Optional[float] = None) -> None:
+        for tier in self.tiers:
+            tier.set(key, payload, ttl)
 
-def _redact_apikey(url: str) -> str:
-    try:
-        return re.sub(r"(apikey=)[^&]+", r"\1***", url, flags=re.IGNORECASE)
-    except Exception:
-        return url
+    def delete(self, key: str) -> None:
+        for tier in self.tiers:
+            tier.delete(key)
 
+    def clear(self, prefix: str = "") -> None:
+        for tier in self.tiers:
+            tier.clear(prefix)
 
-@st.cache_data(show_spinner=False, ttl=1800)
-def _http_get_json(url: str, headers_items: Tuple[Tuple[str, str], ...] = ()) -> Tuple[int, Any, str]:
-    """HTTP GET helper with Streamlit cache. Returns (status_code, json_or_None, error_text_or_empty)."""
-    try:
-        headers = dict(headers_items) if headers_items else None
-        r = requests.get(url, headers=headers, timeout=25)
-        status = int(getattr(r, "status_code", 0) or 0)
+    def usage_by_tier(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        return {tier.name: tier.usage() for tier in self.tiers}
+
+
+def _build_cache_backend(kind: str) -> CacheBackend:
+    memory = MemoryLRUCache(CACHE_MEMORY_MAX_ENTRIES, CACHE_MEMORY_MAX_BYTES)
+    if kind == "memory":
+        return memory
+    if kind == "streamlit":
+        return StreamlitCache(CACHE_MEMORY_MAX_ENTRIES, CACHE_MEMORY_MAX_BYTES)
+    if kind == "redis" and REDIS_URL:
         try:
-            return status, r.json(), ""
+            return TieredCache([memory, RedisCache(url=REDIS_URL, secret=REDIS_HMAC_KEY)])
         except Exception:
-            txt = getattr(r, "text", "") or ""
-            return status, None, txt[:2000]
-    except Exception as e:
-        return 0, None, str(e)
+            pass  # bez redis balíčku / REDIS_HMAC_KEY -> lokální disk
+    return TieredCache([memory, SQLiteCache(CACHE_DB_PATH, CACHE_DISK_MAX_BYTES)])
 
 
-@st.cache_data(show_spinner=False, ttl=86400)
-def _http_get_text(url: str, headers_items: Tuple[Tuple[str, str], ...] = ()) -> Tuple[int, str, str]:
-    """HTTP GET that returns raw text (needed for XML filings)."""
-    try:
-        headers = dict(headers_items) if headers_items else None
-        r = requests.get(url, headers=headers, timeout=25)
-        status = int(getattr(r, "status_code", 0) or 0)
-        return status, (getattr(r, "text", "") or ""), ""
-    except Exception as e:
-        return 0, "", str(e)
+def get_cache_backend() -> CacheBackend:
+    return _process_state("cache_backend", lambda: _build_cache_backend(CACHE_BACKEND))
 
 
-@st.cache_data(show_spinner=False, ttl=86400)
-def _sec_ticker_to_cik_map(user_agent: str) -> Dict[str, int]:
+def set_cache_backend(backend: CacheBackend) -> None:
+    """Pro CLI/testy: vlastní backend (např. MemoryLRUCache bez disku)."""
+    with _PROCESS_STATE_LOCK:
+        _PROCESS_STATE["cache_backend"] = backend
+
+
+def _cache_key(fn: Callable, bound: inspect.BoundArguments) -> str:
+    """`ns:vN:funkce:sha256(argumentů)` (bez modulu – app i CLI sdílí disk/Redis); parametry s `_` prefixem se nehashují (jako u st.cache_data)."""
+    items = tuple((k, v) for k, v in bound.arguments.items() if not k.startswith("_"))
+    try:
+        raw = pickle.dumps(items, protocol=4)
+    except Exception:
+        raw = repr(items).encode("utf-8", "replace")
+    return f"{_cache_prefix(fn)}{hashlib.sha256(raw).hexdigest()}"
+
+
+def _cache_prefix(fn: Callable) -> str:
+    return f"{CACHE_NAMESPACE}:v{CACHE_KEY_VERSION}:{fn.__qualname__}:"
+
+
+# --- Zero-copy vrstva ----------------------------------------------------------
+# Pro funkce vracející velké DataFrame (historie, insider framy) drží proces jeden
+# sdílený objekt; hit vrátí jen mělkou kopii (nové DataFrame nad stejnými buffery).
+# Díky copy-on-write se zápis volajícího projeví jen v jeho kopii a sdílená data
+# zůstanou beze změny – rerun tak nealokuje ani nekopíruje data.
+
+def _shallow(value: Any) -> Any:
+    """Mělká kopie bez kopírování dat: nové DataFrame/Series nad stejnými (CoW) buffery."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, tuple):
+        return tuple(_shallow(v) for v in value)
+    if isinstance(value, list):
+        return [_shallow(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _shallow(v) for k, v in value.items()}
+    return value
+
+
+class _SharedObjectCache:
+    """LRU {klíč: (objekt, expires_at)} bez serializace – obdoba st.cache_resource."""
+
+    name = "shared"
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            if item[1] is not None and item[1] <= time.time():
+                del self._data[key]
+                CACHE_STATS.incr(_key_function(key), "expired")
+                return False, None
+            self._data.move_to_end(key)
+            return True, item[0]
+
+    def set(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                victim, _ = self._data.popitem(last=False)
+                CACHE_STATS.incr(_key_function(victim), "evictions")
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            for k in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[k]
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            items = list(self._data.items())
+        out: Dict[str, Dict[str, int]] = {}
+        for k, (value, _exp) in items:
+            u = out.setdefault(_key_function(k), {"entries": 0, "bytes": 0})
+            u["entries"] += 1
+            u["bytes"] += _approx_nbytes(value)
+        return out
+
+
+_SHARED_OBJECTS = _process_state("shared_objects", lambda: _SharedObjectCache(CACHE_SHARED_MAX_ENTRIES))
+
+
+def cached(ttl: Optional[float] = None, cache_if: Optional[Callable[[Any], bool]] = None, shared: bool = False) -> Callable:
+    """Dekorátor pro cachování fetch funkcí přes `get_cache_backend()` (funguje i bez Streamlitu).
+
+    `cache_if(value)` = False -> výsledek se neuloží (např. prázdná odpověď po chybě providera).
+    `shared=True` -> v procesu se drží jeden objekt a hit vrací jeho mělkou CoW kopii (bez unpicklingu).
+    `fn.clear()` smaže všechny položky funkce.
     """
-    SEC 'company_tickers.json' -> mapping {TICKER: cik_int}.
+    def decorator(fn: Callable) -> Callable:
+        sig = inspect.signature(fn)
+        prefix = _cache_prefix(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = _cache_key(fn, bound)
+            if shared:
+                hit, obj = _SHARED_OBJECTS.get(key)
+                if hit:
+                    CACHE_STATS.incr(fn.__qualname__, "hits")
+                    CACHE_STATS.tier_hit(fn.__qualname__, _SHARED_OBJECTS.name)
+                    return _shallow(obj)
+            backend = get_cache_backend()
+            item = backend.get(key)
+            if item is not None:
+                try:
+                    value = pickle.loads(zlib.decompress(item[0]))
+                    CACHE_STATS.incr(fn.__qualname__, "hits")
+                    if shared:
+                        _SHARED_OBJECTS.set(key, value, item[1])
+                        return _shallow(value)
+                    return value
+                except Exception:
+                    backend.delete(key)
+            t0 = time.perf_counter()
+            value = fn(*args, **kwargs)
+            CACHE_STATS.miss(fn.__qualname__, time.perf_counter() - t0)
+            if cache_if is not None and not cache_if(value):
+                return value
+            try:
+                payload = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+            except Exception:
+                return value  # nepicklovatelná hodnota se prostě necachuje
+            backend.set(key, payload, ttl)
+            CACHE_STATS.stored(fn.__qualname__, len(payload))
+            if shared:
+                _SHARED_OBJECTS.set(key, value, time.time() + ttl if ttl is not None else None)
+                return _shallow(value)
+            return value
+
+        def clear() -> None:
+            _SHARED_OBJECTS.clear(prefix)
+            get_cache_backend().clear(prefix)
+
+        wrapper.clear = clear  # type: ignore[attr-defined]
+        return wrapper
+    return decorator
+
+
+# ============================================================================
+# TRADING CALENDAR (NYSE/NASDAQ, PSE Praha)
+# ============================================================================
+# Cache cen a info nemá smysl obnovovat, když trh tickeru neobchoduje (noc,
+# víkend, svátek). Kalendář je předpočítaný jako seřazené pole obchodních dní
+# (datetime64[D]) na burzu; dotazy jsou np.searchsorted nad tímto polem.
+
+@dataclass(frozen=True)
+class Exchange:
+    code: str
+    tz: str
+    open_time: dt.time
+    close_time: dt.time
+    early_close_time: Optional[dt.time] = None
+
+
+EXCHANGES: Dict[str, Exchange] = {
+    "NYSE": Exchange("NYSE", "America/New_York", dt.time(9, 30), dt.time(16, 0), dt.time(13, 0)),
+    "PSE": Exchange("PSE", "Europe/Prague", dt.time(9, 0), dt.time(16, 20)),
+}
+# Suffix Yahoo tickeru -> burza (bez suffixu = US listing)
+_EXCHANGE_SUFFIXES = {".PR": "PSE"}
+_CALENDAR_YEARS = (2000, 2045)
+
+MARKET_OPEN_TTL = 900  # během obchodování: ceny/info max 15 min
+MARKET_MIN_TTL = 60
+MARKET_MAX_TTL = 4 * 86400  # horní mez i pro dlouhé víkendy se svátkem
+
+
+def _easter_sunday(year: int) -> dt.date:
+    """Gregoriánská Velikonoční neděle (anonymní algoritmus)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = ((h + l - 7 * m + 114) % 31) + 1
+    return dt.date(year, month, day)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> dt.date:
+    """n-tý (1..) den v týdnu v měsíci; n=-1 = poslední."""
+    if n > 0:
+        first = dt.date(year, month, 1)
+        return first + dt.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = dt.date(year + (month // 12), month % 12 + 1, 1) - dt.timedelta(days=1)
+    return last - dt.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(d: dt.date) -> dt.date:
+    """NYSE: svátek v sobotu -> pátek, v neděli -> pondělí."""
+    if d.weekday() == 5:
+        return d - dt.timedelta(days=1)
+    if d.weekday() == 6:
+        return d + dt.timedelta(days=1)
+    return d
+
+
+def _nyse_holidays(year: int) -> Tuple[List[dt.date], List[dt.date]]:
+    """(svátky, zkrácené dny) NYSE/NASDAQ pro daný rok."""
+    easter = _easter_sunday(year)
+    holidays = [
+        _nth_weekday(year, 1, 0, 3),   # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),   # Presidents' Day
+        easter - dt.timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),  # Memorial Day
+        _observed(dt.date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),   # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        _observed(dt.date(year, 12, 25)),
+    ]
+    new_year = dt.date(year, 1, 1)
+    if new_year.weekday() != 5:  # Nový rok v sobotu se neposouvá na pátek (NYSE pravidlo)
+        holidays.append(_observed(new_year))
+    if year >= 2022:
+        holidays.append(_observed(dt.date(year, 6, 19)))  # Juneteenth
+    early = [_nth_weekday(year, 11, 3, 4) + dt.timedelta(days=1)]  # Black Friday
+    for d in (dt.date(year, 7, 3), dt.date(year, 12, 24)):
+        if d.weekday() < 5 and d not in holidays:
+            early.append(d)
+    return holidays, early
+
+
+def _pse_holidays(year: int) -> Tuple[List[dt.date], List[dt.date]]:
+    """(svátky, zkrácené dny) Burzy cenných papírů Praha – české státní svátky + 24.–26. a 31. 12."""
+    easter = _easter_sunday(year)
+    fixed = [(1, 1), (5, 1), (5, 8), (7, 5), (7, 6), (9, 28), (10, 28), (11, 17), (12, 24), (12, 25), (12, 26), (12, 31)]
+    holidays = [dt.date(year, m, d) for m, d in fixed]
+    holidays += [easter - dt.timedelta(days=2), easter + dt.timedelta(days=1)]
+    return holidays, []
+
+
+_HOLIDAY_RULES = {"NYSE": _nyse_holidays, "PSE": _pse_holidays}
+_TRADING_DAYS: Dict[str, np.ndarray] = _process_state("trading_days", dict)
+_EARLY_CLOSES: Dict[str, np.ndarray] = _process_state("early_closes", dict)
+_TRADING_DAYS_LOCK = _process_state("trading_days_lock", threading.Lock)
+
+
+def _trading_days(code: str) -> np.ndarray:
+    """Seřazené obchodní dny burzy (datetime64[D]) pro _CALENDAR_YEARS; počítá se jednou."""
+    days = _TRADING_DAYS.get(code)
+    if days is not None:
+        return days
+    with _TRADING_DAYS_LOCK:
+        if code not in _TRADING_DAYS:
+            holidays: List[dt.date] = []
+            early: List[dt.date] = []
+            for y in range(_CALENDAR_YEARS[0], _CALENDAR_YEARS[1] + 1):
+                h, e = _HOLIDAY_RULES[code](y)
+                holidays += h
+                early += e
+            cal = np.busdaycalendar(weekmask="1111100", holidays=np.array(holidays, dtype="datetime64[D]"))
+            span = np.arange(f"{_CALENDAR_YEARS[0]}-01-01", f"{_CALENDAR_YEARS[1] + 1}-01-01", dtype="datetime64[D]")
+            _TRADING_DAYS[code] = span[np.is_busday(span, busdaycal=cal)]
+            _EARLY_CLOSES[code] = np.unique(np.array(early, dtype="datetime64[D]"))
+        return _TRADING_DAYS[code]
+
+
+def exchange_for_ticker(ticker: str) -> Optional[Exchange]:
+    """Burza tickeru podle Yahoo suffixu; None = neznámá burza (bez kalendáře)."""
+    t = str(ticker).upper().strip()
+    if "." in t:
+        return EXCHANGES.get(_EXCHANGE_SUFFIXES.get(t[t.rfind("."):], ""))
+    if t.startswith("^") or "=" in t:
+        return None  # indexy, měny, futures – jiné hodiny
+    return EXCHANGES["NYSE"]
+
+
+def is_trading_day(code: str, day: dt.date) -> bool:
+    days = _trading_days(code)
+    d = np.datetime64(day, "D")
+    i = int(np.searchsorted(days, d))
+    return i < len(days) and days[i] == d
+
+
+def _session_bounds(ex: Exchange, day: np.datetime64) -> Tuple[dt.datetime, dt.datetime]:
+    zone = ZoneInfo(ex.tz)
+    d = day.astype(dt.date)
+    early = _EARLY_CLOSES.get(ex.code)
+    close_t = ex.early_close_time if (ex.early_close_time and early is not None
+                                      and np.isin(day, early)) else ex.close_time
+    return dt.datetime.combine(d, ex.open_time, zone), dt.datetime.combine(d, close_t, zone)
+
+
+def market_session(ticker: str, now: Optional[dt.datetime] = None) -> Optional[Dict[str, Any]]:
+    """Stav trhu tickeru: {"exchange", "is_open", "next_change", "last_close"}; None = bez kalendáře.
+
+    `next_change` je konec aktuální session (trh otevřen) nebo příští otevření (zavřeno),
+    `last_close` je konec poslední ukončené session.
     """
-    url = "https://www.sec.gov/files/company_tickers.json"
-    headers = (
-        ("User-Agent", user_agent),
-        ("Accept", "application/json"),
+    ex = exchange_for_ticker(ticker)
+    if ex is None:
+        return None
+    days = _trading_days(ex.code)
+    now = (now or dt.datetime.now(dt.timezone.utc)).astimezone(ZoneInfo(ex.tz))
+    i = int(np.searchsorted(days, np.datetime64(now.date(), "D")))  # první obchodní den >= dnes
+    if i >= len(days):
+        return None
+    open_i, close_i = _session_bounds(ex, days[i])
+    if days[i].astype(dt.date) == now.date() and now >= open_i:
+        if now < close_i:
+            last_close = _session_bounds(ex, days[i - 1])[1] if i > 0 else None
+            return {"exchange": ex.code, "is_open": True, "next_change": close_i, "last_close": last_close}
+        last_close = close_i
+        nxt = _session_bounds(ex, days[i + 1])[0] if i + 1 < len(days) else None
+    else:
+        last_close = _session_bounds(ex, days[i - 1])[1] if i > 0 else None
+        nxt = open_i
+    return {"exchange": ex.code, "is_open": False, "next_change": nxt, "last_close": last_close}
+
+
+def market_ttl(ticker: str, now: Optional[dt.datetime] = None, open_ttl: int = MARKET_OPEN_TTL) -> int:
+    """TTL cache cen/info tickeru v sekundách: krátké při obchodování, jinak do příštího otevření."""
+    sess = market_session(ticker, now)
+    if sess is None or sess["next_change"] is None:
+        return open_ttl
+    now = now or dt.datetime.now(dt.timezone.utc)
+    until = (sess["next_change"] - now).total_seconds()
+    if sess["is_open"]:
+        return int(max(MARKET_MIN_TTL, min(open_ttl, until)))
+    return int(max(MARKET_MIN_TTL, min(MARKET_MAX_TTL, until)))
+
+
+def market_epoch(tickers: Any, now: Optional[dt.datetime] = None, open_ttl: int = MARKET_OPEN_TTL) -> str:
+    """Cache token pro ceny/info: mění se každých `open_ttl` s při obchodování, při zavřeném trhu
+    až s příštím otevřením (víkend/noc/svátek = jeden klíč). Pro víc tickerů spojí tokeny jejich burz."""
+    items = [tickers] if isinstance(tickers, str) else list(tickers)
+    now = now or dt.datetime.now(dt.timezone.utc)
+    tokens = set()
+    for t in items:
+        sess = market_session(t, now)
+        if sess is None:
+            tokens.add(f"na:{int(now.timestamp() // open_ttl)}")
+        elif sess["is_open"]:
+            tokens.add(f"{sess['exchange']}:open:{int(now.timestamp() // open_ttl)}")
+        else:
+            last = sess["last_close"]
+            tokens.add(f"{sess['exchange']}:closed:{last:%Y%m%d}" if last else f"{sess['exchange']}:closed")
+    return "|".join(sorted(tokens))
+
+
+# ============================================================================
+# DATA FETCHING (CACHED)
+# ============================================================================
+
+# --- Offline / record snapshoty ----------------------------------------------
+# Všechny provider cally jdou přes tři místa: `_yf_call`, `_http_get_*_raw`
+# (FMP, Alpha Vantage, Finnhub, API Ninjas, SEC) a `_gemini_generate`.
+# RECORD_MODE ukládá výsledek každého živého callu do SNAPSHOT_DIR/<provider>/,
+# OFFLINE_MODE odpovídá jen odtud (bez sítě a rate limitů), chybějící snapshot
+# = `SnapshotMiss`, který volající zpracují jako běžnou chybu providera.
+# API klíče v URL nejsou součástí klíče snapshotu (ani se neukládají).
+# Oba režimy mají vlastní STORE_DIR (DATA_DIR/offline, DATA_DIR/record), jen
+# paměťovou cache a vlastní CACHE_NAMESPACE – živé story/cache se nemíchají
+# s přehranými daty. Nahrávat je nejlepší s prázdným DATA_DIR/record:
+# OHLCV/výkazové story se pak plní plným stažením (period="max"), které
+# offline běh na čistém stroji zopakuje.
+
+class SnapshotMiss(LookupError):
+    """Offline režim: pro tento call není nahraný snapshot."""
+
+
+def _snapshot_url(url: str) -> str:
+    return re.sub(r"((?:apikey|api_key|token)=)[^&]+", r"\1***", url, flags=re.IGNORECASE)
+
+
+def _snapshot_path(provider: str, key: Any) -> str:
+    digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+    return os.path.join(SNAPSHOT_DIR, re.sub(r"[^A-Za-z0-9._-]", "_", provider), f"{digest}.pkl.z")
+
+
+_SNAPSHOT_LATENCY: Dict[str, float] = {}  # provider -> medián latence replaye v s ("*" = ostatní); plní benchmark
+
+
+def _snapshot_load(provider: str, key: Any) -> Any:
+    median = _SNAPSHOT_LATENCY.get(provider, _SNAPSHOT_LATENCY.get("*"))
+    if median:
+        time.sleep(median * random.lognormvariate(0.0, 0.35))  # pravý chvost jako u skutečných API
+    try:
+        with open(_snapshot_path(provider, key), "rb") as fh:
+            return pickle.loads(zlib.decompress(fh.read()))["value"]
+    except FileNotFoundError:
+        raise SnapshotMiss(f"{provider}: {key!r}") from None
+
+
+def _snapshot_save(provider: str, key: Any, value: Any) -> None:
+    try:
+        path = _snapshot_path(provider, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(zlib.compress(pickle.dumps({"key": repr(key), "recorded_at": time.time(), "value": value}, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def _snapshot_call(provider: str, key: Any, fn: Callable[[], Any]) -> Any:
+    """Offline: odpověď ze snapshotu; record: živý call + uložení; jinak jen `fn()`."""
+    if OFFLINE_MODE:
+        return _snapshot_load(provider, key)
+    result = fn()
+    if RECORD_MODE:
+        _snapshot_save(provider, key, result)
+    return result
+
+
+# --- Single-flight ------------------------------------------------------------
+# Souběžné identické requesty (víc sessions otevře stejný ticker naráz) čekají na
+# jeden běžící call a sdílí jeho výsledek (i výjimku). Cache tím nenahrazuje –
+# slučuje jen requesty, které běží ve stejnou chvíli.
+
+class _SingleFlight:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._calls[key] = fut
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return fut.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+_SINGLE_FLIGHT = _process_state("single_flight", _SingleFlight)
+
+
+# --- Rate limity providerů -----------------------------------------------------
+# Token bucket per host: (burst, za kolik sekund). Uplatní se na každý skutečný
+# request (za single-flight). Warming job si navíc nechává polovinu burstu volnou
+# pro interaktivní uživatele (viz `_WARMING` – ContextVar, do worker vláken se
+# předává přes `contextvars.copy_context().run`).
+# Hosty v ADAPTIVE_RATE_HOSTS (yfinance) mají rate proměnlivý (AIMD): po každém
+# úspěšném callu +AIMD_INCREASE req/s až k limitu, po 429 ×AIMD_DECREASE (max. jednou
+# za AIMD_DECREASE_WINDOW_S, bucket se vyprázdní vždy); call se pak opakuje
+# s exponenciálním backoffem a jitterem.
+
+PROVIDER_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "yfinance": (10, 1),
+    "www.sec.gov": (8, 1),  # SEC fair access: max 10 req/s
+    "data.sec.gov": (8, 1),
+    "financialmodelingprep.com": (5, 1),
+    "www.alphavantage.co": (5, 60),  # free tier: 5 req/min
+    "finnhub.io": (60, 60),
+}
+WARM_RESERVE_SHARE = 0.5  # kolik burstu warming nesmí spotřebovat
+ADAPTIVE_RATE_HOSTS: Dict[str, float] = {"yfinance": 0.2}  # host -> minimální rate (req/s)
+AIMD_INCREASE = 0.1  # req/s přidané po úspěšném callu
+AIMD_DECREASE = 0.5  # násobek rate po 429
+AIMD_COOLDOWN_S = 30  # po 429 se rate nezvyšuje aspoň tuto dobu
+AIMD_DECREASE_WINDOW_S = 1.0  # souběžné 429 v jednom okně = jedno snížení rate
+YF_MAX_RETRIES = 4  # opakování yfinance callu po 429
+YF_RETRY_BASE_S = 1.0  # backoff: base * 2^pokus, ×(0.5–1.5) jitter
+
+_WARMING: "contextvars.ContextVar[bool]" = _process_state(
+    "warming", lambda: contextvars.ContextVar("spp_warming", default=False))
+
+
+class _HostRateLimiter:
+    def __init__(self, limits: Dict[str, Tuple[float, float]], adaptive: Optional[Dict[str, float]] = None):
+        self.limits = limits
+        self.adaptive = adaptive or {}
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, List[float]] = {}  # host -> [tokens, last_refill]
+        self._rates: Dict[str, float] = {}  # aktuální rate adaptivních hostů (req/s)
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def _current(self, host: str, capacity: float, per_s: float) -> Tuple[float, float]:
+        """(rate, burst) hostu; u adaptivního se burst zmenšuje úměrně snížené rate."""
+        max_rate = capacity / per_s
+        rate = self._rates.get(host, max_rate)
+        return rate, max(1.0, capacity * rate / max_rate)
+
+    def acquire(self, host: str) -> float:
+        """Počká na token pro `host`; vrací čekání v sekundách. Neznámý host = bez limitu."""
+        limit = self.limits.get(host)
+        if limit is None:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                rate, capacity = self._current(host, *limit)
+                reserve = capacity * WARM_RESERVE_SHARE if _WARMING.get() else 0.0
+                now = time.monotonic()
+                bucket = self._buckets.setdefault(host, [capacity, now])
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                if bucket[0] >= 1.0 + reserve:
+                    bucket[0] -= 1.0
+                    return waited
+                wait = (1.0 + reserve - bucket[0]) / rate
+            time.sleep(wait)
+            waited += wait
+
+    def on_success(self, host: str) -> None:
+        """Additive increase (mimo cooldown po posledním 429)."""
+        if host not in self.adaptive or host not in self.limits:
+            return
+        with self._lock:
+            stats = self._stats.setdefault(host, {})
+            stats["ok"] = stats.get("ok", 0) + 1
+            if time.monotonic() - stats.get("throttled_mono", -math.inf) < AIMD_COOLDOWN_S:
+                return
+            capacity, per_s = self.limits[host]
+            rate, _ = self._current(host, capacity, per_s)
+            self._rates[host] = min(capacity / per_s, rate + AIMD_INCREASE)
+
+    def on_throttled(self, host: str) -> None:
+        """Multiplicative decrease po 429; vyprázdněný bucket zastaví i souběžné cally."""
+        if host not in self.limits:
+            return
+        with self._lock:
+            capacity, per_s = self.limits[host]
+            rate, _ = self._current(host, capacity, per_s)
+            stats = self._stats.setdefault(host, {})
+            if host in self.adaptive and time.monotonic() - stats.get("throttled_mono", -math.inf) >= AIMD_DECREASE_WINDOW_S:
+                self._rates[host] = max(self.adaptive[host], rate * AIMD_DECREASE)
+            bucket = self._buckets.setdefault(host, [0.0, time.monotonic()])
+            bucket[0] = 0.0
+            stats["throttled"] = stats.get("throttled", 0) + 1
+            stats["throttled_mono"] = time.monotonic()
+            stats["last_throttled_at"] = time.time()
+
+    def note_retry(self, host: str) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(host, {})
+            stats["retries"] = stats.get("retries", 0) + 1
+
+    def state(self) -> Dict[str, Dict[str, Any]]:
+        """Aktuální stav limitů per host (admin stránka)."""
+        out: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            now = time.monotonic()
+            for host, (capacity, per_s) in self.limits.items():
+                rate, burst = self._current(host, capacity, per_s)
+                bucket = self._buckets.get(host)
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate) if bucket else burst
+                stats = self._stats.get(host, {})
+                out[host] = {
+                    "adaptive": host in self.adaptive,
+                    "rate_per_s": round(rate, 3),
+                    "max_rate_per_s": round(capacity / per_s, 3),
+                    "burst": round(burst, 2),
+                    "tokens": round(tokens, 2),
+                    "ok": stats.get("ok", 0),
+                    "throttled": stats.get("throttled", 0),
+                    "retries": stats.get("retries", 0),
+                    "last_throttled_at": stats.get("last_throttled_at"),
+                }
+        return out
+
+
+_RATE_LIMITER = _process_state("rate_limiter", lambda: _HostRateLimiter(PROVIDER_RATE_LIMITS, ADAPTIVE_RATE_HOSTS))
+
+
+def _rate_limited(host: str, fn: Callable[[], Any]) -> Callable[[], Any]:
+    def run() -> Any:
+        _RATE_LIMITER.acquire(host)
+        return fn()
+    return run
+
+
+def _is_rate_limit_error(e: BaseException) -> bool:
+    rl_error = getattr(getattr(yf, "exceptions", None), "YFRateLimitError", None)
+    if rl_error is not None and isinstance(e, rl_error):
+        return True
+    response = getattr(e, "response", None)  # requests / curl_cffi HTTPError
+    status = getattr(response, "status_code", None) or getattr(e, "status_code", None)
+    if status is not None:
+        return status == 429
+    msg = str(e)  # starší yfinance: Exception("Too Many Requests. Rate limited. ...")
+    return "Too Many Requests" in msg or "Rate limited" in msg
+
+
+def _throttled(host: str, fn: Callable[[], Any]) -> Callable[[], Any]:
+    """Token bucket + AIMD + retry s jitterem po 429 (ostatní chyby se propagují hned)."""
+    def run() -> Any:
+        for attempt in range(YF_MAX_RETRIES + 1):
+            _RATE_LIMITER.acquire(host)
+            try:
+                result = fn()
+            except Exception as e:
+                if not _is_rate_limit_error(e):
+                    raise
+                _RATE_LIMITER.on_throttled(host)
+                if attempt == YF_MAX_RETRIES:
+                    raise
+                _RATE_LIMITER.note_retry(host)
+                time.sleep(YF_RETRY_BASE_S * (2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+            _RATE_LIMITER.on_success(host)
+            return result
+    return run
+
+
+def _yf_call(op: str, ticker: Any, fn: Callable[[], Any], **params: Any) -> Any:
+    """Jediný vstup do yfinance: `fn` provede request, klíč (op, ticker, params) ho identifikuje."""
+    key = ("yf", op, ticker, tuple(sorted(params.items())))
+    if OFFLINE_MODE:
+        return _snapshot_load("yfinance", key)
+    return _SINGLE_FLIGHT.do(key, lambda: _snapshot_call("yfinance", key, _throttled("yfinance", fn)))
+
+
+# yfinance period -> posun zpět od dneška (pro řezání jedné "max" historie)
+_PERIOD_OFFSETS: Dict[str, pd.DateOffset] = {
+    "1d": pd.DateOffset(days=1),
+    "5d": pd.DateOffset(days=5),
+    "1mo": pd.DateOffset(months=1),
+    "3mo": pd.DateOffset(months=3),
+    "6mo": pd.DateOffset(months=6),
+    "1y": pd.DateOffset(years=1),
+    "2y": pd.DateOffset(years=2),
+    "5y": pd.DateOffset(years=5),
+    "10y": pd.DateOffset(years=10),
+}
+
+
+def _slice_history_period(df: pd.DataFrame, period: str) -> pd.DataFrame:
+    """Vyřízne z denní historie úsek odpovídající yfinance `period` ("6mo", "1y", "ytd", "max", ...)."""
+    if df is None or df.empty or period == "max":
+        return df if df is not None else pd.DataFrame()
+    try:
+        now = pd.Timestamp.now(tz=getattr(df.index, "tz", None))
+        if period == "ytd":
+            start = now.normalize().replace(month=1, day=1)
+        else:
+            off = _PERIOD_OFFSETS.get(period)
+            if off is None:
+                return df
+            start = now.normalize() - off
+        # Index je seřazený -> iloc řez je view (bez kopie dat), ne maska
+        return df.iloc[int(df.index.searchsorted(start, side="left")):]
+    except Exception:
+        return df
+
+
+@dataclass
+class TickerBundle:
+    """Veškerá yfinance data jednoho tickeru stažená z jednoho `yf.Ticker` objektu.
+
+    Atributy se jmenují stejně jako na `yf.Ticker` (info, financials, quarterly_cashflow, ...),
+    takže bundle jde předat všude, kde se dřív stavěl vlastní `yf.Ticker`.
+    """
+    ticker: str
+    info: Dict[str, Any] = field(default_factory=dict)
+    ohlcv: pd.DataFrame = field(default_factory=pd.DataFrame)  # denní OHLCV, period="max"
+    financials: pd.DataFrame = field(default_factory=pd.DataFrame)
+    balance_sheet: pd.DataFrame = field(default_factory=pd.DataFrame)
+    cashflow: pd.DataFrame = field(default_factory=pd.DataFrame)
+    quarterly_financials: pd.DataFrame = field(default_factory=pd.DataFrame)
+    quarterly_balance_sheet: pd.DataFrame = field(default_factory=pd.DataFrame)
+    quarterly_cashflow: pd.DataFrame = field(default_factory=pd.DataFrame)
+    calendar: Any = None
+    errors: Dict[str, str] = field(default_factory=dict)
+    fetched_at: float = 0.0
+    _canonical: Dict[str, "CanonicalStatement"] = field(default_factory=dict, repr=False, compare=False)
+
+    def history(self, period: str = "1y", **_: Any) -> pd.DataFrame:
+        """Stejné rozhraní jako `yf.Ticker.history` – jen řez z už stažené denní historie."""
+        return _slice_history_period(self.ohlcv, period)
+
+    def canonical(self, kind: str) -> "CanonicalStatement":
+        """Výkaz `kind` (např. "quarterly_cashflow") v kanonickém schématu; normalizuje se jednou na bundle."""
+        cache = self.__dict__.setdefault("_canonical", {})  # bundly z pickle cache před touto verzí pole nemají
+        stmt = cache.get(kind)
+        if stmt is None:
+            stmt = cache[kind] = normalize_statement(getattr(self, kind, None))
+        return stmt
+
+
+# Části bundlu, které se stahují paralelně: název atributu -> getter nad yf.Ticker
+_BUNDLE_PARTS = {
+    "info": lambda t: _yf_call("info", t.ticker, lambda: t.info) or {},
+    "ohlcv": lambda t: update_price_store(t.ticker, yf_ticker=t),
+    "statements": lambda t: load_statements(t.ticker, yf_ticker=t),
+    "calendar": lambda t: _yf_call("calendar", t.ticker, lambda: t.calendar),
+}
+
+
+# --- Stale-while-revalidate cache --------------------------------------------
+# Po expiraci (změna `epoch` tokenu z market_epoch) vrátí poslední hodnotu hned a
+# obnovu spustí na pozadí; nová hodnota se do cache zapíše atomicky (výměna celé
+# položky pod zámkem). Blokuje jen úplně první načtení klíče. Prázdný výsledek
+# (chyba providera) bez starších dat platí jen SWR_EMPTY_RETRY_S, pak se načítá znovu.
+
+SWR_EMPTY_RETRY_S = 60
+_SWR_EXECUTOR = _process_state("swr_executor", lambda: ThreadPoolExecutor(max_workers=4, thread_name_prefix="swr"))
+_SWR_CACHES: Dict[str, "_SWRCache"] = {}
+
+
+def _swr_is_empty(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, (pd.DataFrame, dict)):
+        return len(value) == 0
+    if type(value).__name__ == "TickerBundle":  # instance z dřívějšího rerunu má jiný objekt třídy
+        return not value.info
+    return False
+
+
+class _SWRCache:
+    """LRU {klíč: (hodnota, epoch, fetched_at)} + množina klíčů, které se právě obnovují."""
+
+    def __init__(self, name: str, max_entries: int = 256):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, Tuple[Any, str, float]]" = OrderedDict()
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+    def _store(self, key: Any, value: Any, epoch: str) -> None:
+        with self._lock:
+            old = self._entries.get(key)
+            # Chybou vrácenou prázdnou hodnotou nepřepisujeme dobrá (i když stará) data
+            if old is None or not _swr_is_empty(value) or _swr_is_empty(old[0]):
+                self._entries[key] = (value, epoch, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                CACHE_STATS.incr(f"swr:{self.name}", "evictions")
+
+    def _refresh(self, key: Any, epoch: str, loader: Callable[[], Any]) -> None:
+        try:
+            self._store(key, _SINGLE_FLIGHT.do(("swr", self.name, key, epoch), loader), epoch)
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key: Any, epoch: str, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and _swr_is_empty(entry[0]) and time.time() - entry[2] > SWR_EMPTY_RETRY_S:
+                entry = None  # neúspěšný load se nedrží celý epoch (víkend) – načíst znovu
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry[1] != epoch:
+                    CACHE_STATS.incr(f"swr:{self.name}", "stale_hits")
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        _SWR_EXECUTOR.submit(contextvars.copy_context().run, self._refresh, key, epoch, loader)
+                else:
+                    CACHE_STATS.incr(f"swr:{self.name}", "hits")
+                return _shallow(entry[0])
+        # První načtení: souběžné sessions se stejným klíčem sdílí jeden load
+        t0 = time.perf_counter()
+        value = _SINGLE_FLIGHT.do(("swr", self.name, key, epoch), loader)
+        CACHE_STATS.miss(f"swr:{self.name}", time.perf_counter() - t0)
+        self._store(key, value, epoch)
+        return _shallow(value)
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return [e[0] for e in self._entries.values()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def status(self, key: Any) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            return {
+                "as_of": entry[2] if entry else None,
+                "epoch": entry[1] if entry else None,
+                "refreshing": key in self._refreshing,
+            }
+
+
+def swr_cached(max_entries: int = 256) -> Callable:
+    """Dekorátor: stale-while-revalidate cache funkce s parametrem `epoch`.
+
+    Klíč = ostatní argumenty (bez `epoch` a parametrů s `_` prefixem, stejně jako st.cache_data).
+    `fn.swr_status(*args)` vrátí {"as_of", "epoch", "refreshing"} pro hlavičku UI.
+    """
+    def decorator(fn: Callable) -> Callable:
+        sig = inspect.signature(fn)
+        cache = _process_state(f"swr:{fn.__name__}", lambda: _SWRCache(fn.__name__, max_entries))
+        _SWR_CACHES[fn.__name__] = cache
+
+        def _key_epoch(args: tuple, kwargs: dict) -> Tuple[Any, str]:
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            epoch = str(bound.arguments.get("epoch", ""))
+            key = tuple((k, v) for k, v in bound.arguments.items() if k != "epoch" and not k.startswith("_"))
+            return key, epoch
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            key, epoch = _key_epoch(args, kwargs)
+            return cache.get(key, epoch, lambda: fn(*args, **kwargs))
+
+        def swr_status(*args: Any, **kwargs: Any) -> Dict[str, Any]:
+            return cache.status(_key_epoch(args, kwargs)[0])
+
+        wrapper.swr_status = swr_status  # type: ignore[attr-defined]
+        wrapper.swr_cache = cache  # type: ignore[attr-defined]
+        return wrapper
+    return decorator
+
+
+@swr_cached()
+@cached(ttl=MARKET_MAX_TTL, cache_if=lambda v: not _swr_is_empty(v))
+def fetch_ticker_bundle(ticker: str, epoch: str = "") -> TickerBundle:
+    """Jeden `yf.Ticker` na analýzu: info, OHLCV, roční i kvartální výkazy a kalendář naráz.
+
+    Jednotlivé části se stahují souběžně; chyba jedné části nezhodí ostatní
+    (uloží se do `bundle.errors` a atribut zůstane prázdný).
+    `epoch` = `market_epoch(ticker)`: při zavřeném trhu se bundle drží až do otevření,
+    po expiraci se vrátí poslední bundle a nový se stáhne na pozadí (swr_cached).
+    """
+    bundle = TickerBundle(ticker=ticker, fetched_at=time.time())
+    try:
+        t = yf.Ticker(ticker)
+    except Exception as e:
+        bundle.errors["ticker"] = str(e)
+        return bundle
+
+    def _get(name: str) -> Any:
+        return _BUNDLE_PARTS[name](t)
+
+    with ThreadPoolExecutor(max_workers=len(_BUNDLE_PARTS)) as executor:
+        futures = {name: executor.submit(contextvars.copy_context().run, _get, name) for name in _BUNDLE_PARTS}
+        for name, future in futures.items():
+            try:
+                val = future.result()
+            except Exception as e:
+                bundle.errors[name] = str(e)
+                continue
+            if name == "calendar":
+                bundle.calendar = val
+                _record_earnings_date(ticker, _parse_earnings_date(val))
+            elif name == "statements":
+                for kind, df in val.items():
+                    setattr(bundle, kind, df)
+            elif name == "info":
+                bundle.info = val if isinstance(val, dict) else {}
+            elif isinstance(val, pd.DataFrame):
+                setattr(bundle, name, val)
+    return bundle
+
+
+@swr_cached()
+@cached(ttl=MARKET_MAX_TTL, cache_if=lambda v: not _swr_is_empty(v))
+def fetch_ticker_info(ticker: str, epoch: str = "") -> Dict[str, Any]:
+    """Fetch basic info from Yahoo Finance (`epoch` = `market_epoch(ticker)`)."""
+    try:
+        t = yf.Ticker(ticker)
+        return _yf_call("info", ticker, lambda: t.info) or {}
+    except Exception:
+        return {}
+
+
+# --- Kompaktní dtypes (schema) -------------------------------------------------
+# Ceny jako float32, kde to přesnost dovolí (chyba zaokrouhlení < půl centu),
+# objemy jako int64, opakující se texty insider tabulek jako category. Úspora
+# proti float64/object baseline se ukládá do `df.attrs["compact_saved_bytes"]`
+# (přežije řezy, mělké kopie i Parquet) a sčítá se per session (`note_memory_saved`).
+
+PRICE_FLOAT_COLUMNS = ("Open", "High", "Low", "Close", "Adj Close", "Dividends", "Stock Splits", "Capital Gains")
+PRICE_FLOAT32_ABS_TOL = 0.005
+INSIDER_CATEGORY_COLUMNS = ("Owner", "Position", "Source", "Code", "Transaction", "Security")
+
+
+def _float32_if_exact(s: pd.Series, tol: float) -> pd.Series:
+    if s.dtype != np.float64:
+        return s
+    s32 = s.astype(np.float32)
+    diff = np.abs(s32.to_numpy(dtype=np.float64) - s.to_numpy())
+    return s32 if np.nanmax(diff, initial=0.0) <= tol else s
+
+
+def compact_price_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """OHLCV frame -> float32 ceny (kde to jde), int64 objem; baseline = 8 B na hodnotu."""
+    if df is None or df.empty:
+        return df
+    out = df.copy(deep=False)
+    for col in out.columns:
+        if col in PRICE_FLOAT_COLUMNS:
+            out[col] = _float32_if_exact(out[col], PRICE_FLOAT32_ABS_TOL)
+        elif col == "Volume" and out[col].dtype != np.int64:
+            vol = out[col]
+            if vol.notna().all() and np.array_equal(vol.to_numpy(), np.round(vol.to_numpy())):
+                out[col] = vol.astype(np.int64)
+    baseline = sum(8 * len(out) for c in out.columns if pd.api.types.is_numeric_dtype(out[c]))
+    actual = sum(int(out[c].memory_usage(index=False, deep=False)) for c in out.columns if pd.api.types.is_numeric_dtype(out[c]))
+    out.attrs["compact_saved_bytes"] = max(0, baseline - actual)
+    return out
+
+
+def compact_insider_frame(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """Opakující se textové sloupce insider tabulky -> category (jen když se hodnoty opakují)."""
+    if df is None or df.empty:
+        return df
+    out = df.copy(deep=False)
+    saved = 0
+    for col in INSIDER_CATEGORY_COLUMNS:
+        if col not in out.columns or isinstance(out[col].dtype, pd.CategoricalDtype):
+            continue
+        as_obj = out[col].astype(object)
+        if as_obj.nunique(dropna=True) > len(out) // 2:
+            continue
+        cat = as_obj.astype("category")
+        saved += int(as_obj.memory_usage(index=False, deep=True)) - int(cat.memory_usage(index=False, deep=True))
+        out[col] = cat
+    out.attrs["compact_saved_bytes"] = max(0, saved)
+    return out
+
+
+def note_memory_saved(label: str, df: Optional[pd.DataFrame]) -> None:
+    """Zapíše úsporu frame do session (per label, takže rerun nic nepřičte)."""
+    try:
+        if df is not None:
+            st.session_state.setdefault("memory_saved", {})[label] = int(df.attrs.get("compact_saved_bytes", 0))
+    except Exception:
+        pass
+
+
+def session_memory_saved() -> int:
+    try:
+        return sum(st.session_state.get("memory_saved", {}).values())
+    except Exception:
+        return 0
+
+
+# --- Perzistentní OHLCV store -------------------------------------------------
+# Jeden Parquet soubor na ticker s kompletní denní historií (auto_adjust=False).
+# Při dalším dotazu se stahují jen bary od posledního uloženého data; všechny
+# period ("6mo", "1y", "5y", "max") jsou jen řezy z téhož souboru.
+
+_PRICE_STORE_LOCKS: Dict[str, threading.Lock] = _process_state("price_store_locks", dict)
+_PRICE_STORE_LOCKS_GUARD = _process_state("price_store_locks_guard", threading.Lock)
+_PRICE_STORE_OVERLAP_DAYS = 7  # kolik dní zpět znovu stáhnout kvůli kontrole korporátních akcí
+
+
+def _price_store_lock(ticker: str) -> threading.Lock:
+    with _PRICE_STORE_LOCKS_GUARD:
+        return _PRICE_STORE_LOCKS.setdefault(ticker.upper(), threading.Lock())
+
+
+def _price_store_path(ticker: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9._^=-]", "_", ticker.upper().strip())
+    return os.path.join(PRICE_STORE_DIR, f"{safe}.parquet")
+
+
+def _read_price_store(ticker: str) -> pd.DataFrame:
+    path = _price_store_path(ticker)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    try:
+        return compact_price_frame(pd.read_parquet(path))
+    except Exception:
+        return pd.DataFrame()
+
+
+def _write_price_store(ticker: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Atomický zápis (tmp + os.replace), ať souběžný čtenář nikdy nevidí půlku souboru.
+
+    Ukládá (a vrací) kompaktní verzi frame (`compact_price_frame`).
+    """
+    df = compact_price_frame(df)
+    try:
+        os.makedirs(PRICE_STORE_DIR, exist_ok=True)
+        path = _price_store_path(ticker)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp)
+        os.replace(tmp, path)
+    except Exception:
+        pass
+    return df
+
+
+def _price_store_is_fresh(ticker: str) -> bool:
+    """Při obchodování stačí PRICE_STORE_REFRESH_S; při zavřeném trhu je store čerstvý,
+    pokud byl naposledy aktualizován po konci poslední session (nové bary nepřibudou)."""
+    try:
+        mtime = os.path.getmtime(_price_store_path(ticker))
+    except OSError:
+        return False
+    sess = market_session(ticker)
+    if sess is not None and not sess["is_open"] and sess["last_close"] is not None:
+        # Yahoo finalizuje denní bar chvíli po close
+        return mtime >= sess["last_close"].timestamp() + 1800
+    return (time.time() - mtime) < PRICE_STORE_REFRESH_S
+
+
+def _corporate_action_detected(stored: pd.DataFrame, fresh: pd.DataFrame) -> bool:
+    """Split/dividenda v nových barech, nebo nesedící ceny v překryvu => historie se přepočítala."""
+    new_bars = fresh[~fresh.index.isin(stored.index)]
+    for col in ("Stock Splits", "Dividends"):
+        if col in new_bars.columns and (pd.to_numeric(new_bars[col], errors="coerce").fillna(0) != 0).any():
+            return True
+
+    # Poslední uložený bar mohl být neúplný (intraday), do porovnání ho nebereme
+    overlap = stored.index[:-1].intersection(fresh.index)
+    if len(overlap) == 0:
+        return False
+    for col in ("Close", "Adj Close"):
+        if col in stored.columns and col in fresh.columns:
+            old = pd.to_numeric(stored.loc[overlap, col], errors="coerce")
+            new = pd.to_numeric(fresh.loc[overlap, col], errors="coerce")
+            rel = (new / old.replace(0, np.nan) - 1).abs()
+            if (rel > 0.005).any():
+                return True
+    return False
+
+
+def update_price_store(ticker: str, force: bool = False, yf_ticker: Any = None) -> pd.DataFrame:
+    """Vrátí kompletní denní historii z disku a dotáhne jen chybějící bary.
+
+    - Prázdný store (nebo `force=True`) => jednorázově period="max".
+    - Jinak stáhne bary od posledního uloženého data (s malým překryvem) a připojí je.
+    - Detekovaný split/dividenda => celou historii stáhne znovu (přepočtené ceny).
+    """
+    with _price_store_lock(ticker):
+        stored = pd.DataFrame() if force else _read_price_store(ticker)
+        if not stored.empty and _price_store_is_fresh(ticker):
+            return stored
+
+        try:
+            t = yf_ticker if yf_ticker is not None else yf.Ticker(ticker)
+            if stored.empty:
+                full = _yf_call("history", ticker, lambda: t.history(period="max", interval="1d", auto_adjust=False), period="max")
+                if full is None or full.empty:
+                    return pd.DataFrame()
+                full = _write_price_store(ticker, full)
+                _ath_index_update(ticker, full, rebuild=True)
+                return full
+
+            start = (stored.index.max() - pd.Timedelta(days=_PRICE_STORE_OVERLAP_DAYS)).date()
+            fresh = _yf_call(
+                "history", ticker, lambda: t.history(start=start.isoformat(), interval="1d", auto_adjust=False),
+                start=start.isoformat(),
+            )
+            if fresh is None or fresh.empty:
+                os.utime(_price_store_path(ticker))  # nic nového, ale kontrola proběhla
+                return stored
+
+            if _corporate_action_detected(stored, fresh):
+                full = _yf_call("history", ticker, lambda: t.history(period="max", interval="1d", auto_adjust=False), period="max")
+                if full is not None and not full.empty:
+                    full = _write_price_store(ticker, full)
+                    _ath_index_update(ticker, full, rebuild=True)
+                    return full
+
+            merged = pd.concat([stored[~stored.index.isin(fresh.index)], fresh]).sort_index()
+            merged = _write_price_store(ticker, merged)
+            _ath_index_update(ticker, fresh)
+            return merged
+        except Exception:
+            return stored
+
+
+# --- Průběžný ATH / drawdown index -------------------------------------------
+# Perzistentní JSON {TICKER: {...}}; aktualizuje se inkrementálně z nových barů
+# při každém zápisu do OHLCV storu, čtení je jen lookup ve slovníku. Zápis jde
+# přes `_update_json_index` (zámek souboru + merge), repliky si záznamy nepřepisují.
+
+_ATH_INDEX_LOCK = _process_state("ath_index_lock", threading.Lock)
+
+
+def _ath_index() -> Dict[str, Dict[str, Any]]:
+    return _shared_json_index("ath_index", ATH_INDEX_PATH)
+
+
+def _ath_entry_from_bars(bars: pd.DataFrame, prev: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Spojí předchozí stav indexu s novými bary (max/min jsou idempotentní, překryv nevadí)."""
+    if bars is None or bars.empty or "Close" not in bars.columns:
+        return prev
+    if prev and prev.get("last_date"):
+        # Starší bary z překryvu už v indexu jsou; drawdown by se jinak počítal vůči pozdějšímu vrcholu
+        bars = bars[bars.index >= pd.Timestamp(prev["last_date"], tz=getattr(bars.index, "tz", None))]
+        if bars.empty:
+            return prev
+    close = pd.to_numeric(bars["Close"], errors="coerce").dropna()
+    if close.empty:
+        return prev
+    high = pd.to_numeric(bars["High"] if "High" in bars.columns else bars["Close"], errors="coerce").dropna()
+    prev = prev or {}
+
+    ath = safe_float(prev.get("ath"))
+    ath_date = prev.get("ath_date")
+    if not high.empty and (ath is None or float(high.max()) > ath):
+        ath = float(high.max())
+        ath_date = str(pd.Timestamp(high.idxmax()).date())
+
+    # Max drawdown z close vůči průběžnému maximu close
+    prev_peak = safe_float(prev.get("peak_close"))
+    run_peak = np.maximum.accumulate(close.to_numpy(dtype=float))
+    if prev_peak is not None:
+        run_peak = np.maximum(run_peak, prev_peak)
+    dd_min = float((close.to_numpy(dtype=float) / run_peak - 1.0).min())
+    prev_dd = safe_float(prev.get("max_drawdown"))
+    max_dd = min(dd_min, prev_dd) if prev_dd is not None else dd_min
+
+    last_close = float(close.iloc[-1])
+    return {
+        "ath": ath,
+        "ath_date": ath_date,
+        "peak_close": float(run_peak[-1]),
+        "last_close": last_close,
+        "last_date": str(pd.Timestamp(close.index[-1]).date()),
+        "drawdown": (last_close / ath - 1.0) if ath else None,
+        "max_drawdown": max_dd,
+        "updated_at": time.time(),
+    }
+
+
+def _ath_index_update(ticker: str, bars: pd.DataFrame, rebuild: bool = False) -> None:
+    """Zapracuje nové bary do indexu; `rebuild=True` po plném (pře)stažení historie."""
+    try:
+        key = ticker.upper()
+
+        def update(index: Dict[str, Any]) -> bool:
+            entry = _ath_entry_from_bars(bars, None if rebuild else index.get(key))
+            if entry is None:
+                return False
+            index[key] = entry
+            return True
+
+        with _ATH_INDEX_LOCK:
+            _update_json_index("ath_index", ATH_INDEX_PATH, update)
+    except Exception:
+        pass
+
+
+def get_ath_entries(tickers: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Hromadné čtení ATH indexu pro watchlist / peer list (ATH, drawdown, max drawdown).
+
+    Tickery, které v indexu ještě nejsou, se dotáhnou jedním hromadným downloadem do OHLCV storu.
+    """
+    keys = [str(t).upper().strip() for t in tickers if str(t).strip()]
+    with _ATH_INDEX_LOCK:
+        index = _ath_index()
+        out: Dict[str, Optional[Dict[str, Any]]] = {k: index.get(k) for k in keys}
+    missing = [k for k, v in out.items() if v is None]
+    if missing:
+        seed_price_stores(missing)
+        with _ATH_INDEX_LOCK:
+            index = _ath_index()
+            for k in missing:
+                out[k] = index.get(k)
+    return out
+
+
+def get_all_time_highs(tickers: List[str]) -> Dict[str, Optional[float]]:
+    """ATH pro celý seznam tickerů jedním voláním."""
+    return {k: (safe_float(v.get("ath")) if v else None) for k, v in get_ath_entries(tickers).items()}
+
+
+@swr_cached()
+@cached(ttl=MARKET_MAX_TTL, cache_if=lambda v: not _swr_is_empty(v))
+def fetch_price_history(ticker: str, period: str = "1y", epoch: str = "") -> pd.DataFrame:
+    """Fetch historical price data (řez z perzistentního OHLCV storu)."""
+    try:
+        df = _slice_history_period(update_price_store(ticker), period)
+        return df if not df.empty else pd.DataFrame()
+    except Exception:
+        return pd.DataFrame()
+
+
+# --- Hromadné stahování (watchlist, peers) -----------------------------------
+
+def _split_batch_frame(df: pd.DataFrame, tickers: List[str]) -> Dict[str, pd.DataFrame]:
+    """yf.download(group_by="ticker") -> {ticker: OHLCV frame}; zvládne i 1 ticker bez MultiIndexu."""
+    out: Dict[str, pd.DataFrame] = {}
+    if df is None or df.empty:
+        return out
+    if not isinstance(df.columns, pd.MultiIndex):
+        if len(tickers) == 1:
+            out[tickers[0]] = df.dropna(how="all")
+        return out
+    level0 = set(df.columns.get_level_values(0))
+    for t in tickers:
+        if t in level0:
+            sub = df[t].dropna(how="all")
+            if not sub.empty:
+                out[t] = sub
+    return out
+
+
+def _download_batch(tickers: List[str], period: str) -> Dict[str, pd.DataFrame]:
+    """Jeden multi-symbol request na yfinance pro všechny tickery."""
+    if not tickers:
+        return {}
+    try:
+        df = _yf_call("download", tuple(sorted(tickers)), lambda: yf.download(
+            tickers, period=period, interval="1d", auto_adjust=False, actions=True,
+            group_by="ticker", threads=True, progress=False,
+        ), period=period)
+    except Exception:
+        return {}
+    return _split_batch_frame(df, tickers)
+
+
+@cached(ttl=MARKET_MAX_TTL, cache_if=lambda df: not df.empty, shared=True)
+def fetch_batch_history(tickers: Tuple[str, ...], period: str = "1y", field: str = "Close", epoch: str = "") -> pd.DataFrame:
+    """Zarovnaná tabulka (datum × ticker) jednoho pole pro N tickerů z jednoho requestu."""
+    frames = _download_batch([str(t).upper().strip() for t in tickers if str(t).strip()], period)
+    cols = {t: f[field] for t, f in frames.items() if field in f.columns}
+    return pd.DataFrame(cols) if cols else pd.DataFrame()
+
+
+@cached(ttl=MARKET_MAX_TTL, cache_if=lambda df: not df.empty, shared=True)
+def fetch_batch_quotes(tickers: Tuple[str, ...], epoch: str = "") -> pd.DataFrame:
+    """Poslední cena + denní změna pro N tickerů jedním requestem (index = Ticker)."""
+    closes = fetch_batch_history(tickers, period="5d", field="Close", epoch=epoch)
+    rows = []
+    for t in closes.columns:
+        s = pd.to_numeric(closes[t], errors="coerce").dropna()
+        if s.empty:
+            continue
+        prev = float(s.iloc[-2]) if len(s) >= 2 else None
+        last = float(s.iloc[-1])
+        rows.append({
+            "Ticker": t,
+            "Price": last,
+            "Prev Close": prev,
+            "Change": safe_div(last - prev, prev) if prev else None,
+            "As Of": s.index[-1],
+        })
+    return pd.DataFrame(rows).set_index("Ticker") if rows else pd.DataFrame()
+
+
+def seed_price_stores(tickers: List[str]) -> None:
+    """Naplní OHLCV store (a ATH index) tickerů, které ho ještě nemají, jedním downloadem period="max"."""
+    missing = [t for t in (str(x).upper().strip() for x in tickers) if t and _read_price_store(t).empty]
+    for t, frame in _download_batch(missing, "max").items():
+        with _price_store_lock(t):
+            if _read_price_store(t).empty:
+                _write_price_store(t, frame)
+                _ath_index_update(t, frame, rebuild=True)
+
+
+# --- Universe matice (memmap, sdílená mezi procesy) --------------------------
+# Zarovnané close/volume (datum × ticker) pro celý warm_universe jako .npy soubory.
+# Čtenář je mapuje přes np.load(mmap_mode="r"), takže všechny worker procesy sdílí
+# tytéž stránky z page cache místo vlastní kopie. Soubory mají rezervu řádků
+# (`capacity`), nový obchodní den se jen dopíše do dalšího řádku; meta JSON
+# (tickery, `rows`, `capacity`, `version`) se přepíše atomicky až po zápisu dat.
+# Přestavba (jiný seznam tickerů, plná kapacita, split) zapisuje novou `version`
+# do nových souborů, takže již namapovaná stará verze zůstane konzistentní.
+
+UNIVERSE_FIELDS = {"close": np.float32, "volume": np.float64}
+
+_UNIVERSE_LOCK = _process_state("universe_lock", threading.Lock)
+_UNIVERSE_MAPS: Dict[str, Any] = _process_state("universe_maps", dict)
+
+
+def _universe_meta_path() -> str:
+    return os.path.join(UNIVERSE_DIR, "meta.json")
+
+
+def _universe_array_path(name: str, version: int) -> str:
+    return os.path.join(UNIVERSE_DIR, f"{name}.v{version}.npy")
+
+
+@contextmanager
+def _universe_write_lock():
+    """Jeden zapisovatel napříč vlákny i procesy (warming běží v každém workeru)."""
+    with _UNIVERSE_LOCK:
+        os.makedirs(UNIVERSE_DIR, exist_ok=True)
+        if _fcntl is None:
+            yield
+            return
+        with open(os.path.join(UNIVERSE_DIR, ".lock"), "a") as fh:
+            _fcntl.flock(fh, _fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                _fcntl.flock(fh, _fcntl.LOCK_UN)
+
+
+def _universe_meta() -> Dict[str, Any]:
+    meta = load_json(_universe_meta_path(), {})
+    return meta if isinstance(meta, dict) and meta.get("tickers") else {}
+
+
+def _daily_bars(ticker: str, since: np.datetime64) -> pd.DataFrame:
+    """Close/Volume z OHLCV storu s indexem datetime64[D] (bez časové zóny burzy)."""
+    df = _read_price_store(ticker)
+    if df.empty or "Close" not in df.columns:
+        return pd.DataFrame()
+    idx = df.index.tz_localize(None) if getattr(df.index, "tz", None) is not None else df.index
+    out = pd.DataFrame({
+        "close": pd.to_numeric(df["Close"], errors="coerce").to_numpy(),
+        "volume": pd.to_numeric(df["Volume"], errors="coerce").to_numpy(dtype=float) if "Volume" in df.columns else np.nan,
+    }, index=idx.normalize().to_numpy().astype("datetime64[D]"))
+    out = out[~out.index.duplicated(keep="last")]
+    return out[out.index >= since]
+
+
+def build_universe_matrix(tickers: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Postaví matici znovu z OHLCV storů (chybějící tickery se dotáhnou jedním downloadem)."""
+    tickers = list(dict.fromkeys(str(t).upper().strip() for t in (tickers or warm_universe()) if str(t).strip()))
+    seed_price_stores(tickers)
+    since = np.datetime64(dt.date.today(), "D") - np.timedelta64(int(UNIVERSE_HISTORY_YEARS * 365.25), "D")
+    bars = {t: _daily_bars(t, since) for t in tickers}
+    dates = np.unique(np.concatenate([b.index.to_numpy() for b in bars.values() if not b.empty] or [np.array([], "datetime64[D]")]))
+    rows = len(dates)
+    capacity = rows + UNIVERSE_HEADROOM_ROWS
+
+    with _universe_write_lock():
+        old = _universe_meta()
+        version = int(old.get("version", 0)) + 1
+        arrays = {
+            name: np.lib.format.open_memmap(_universe_array_path(name, version), mode="w+", dtype=dtype, shape=(capacity, len(tickers)))
+            for name, dtype in UNIVERSE_FIELDS.items()
+        }
+        date_arr = np.lib.format.open_memmap(_universe_array_path("dates", version), mode="w+", dtype="datetime64[D]", shape=(capacity,))
+        date_arr[:rows] = dates
+        for arr in arrays.values():
+            arr[:] = np.nan
+        for j, t in enumerate(tickers):
+            b = bars[t]
+            if b.empty:
+                continue
+            pos = np.searchsorted(dates, b.index.to_numpy())
+            for name, arr in arrays.items():
+                arr[pos, j] = b[name].to_numpy()
+        for arr in (*arrays.values(), date_arr):
+            arr.flush()
+        del arrays, date_arr
+
+        meta = {"version": version, "tickers": tickers, "rows": rows, "capacity": capacity, "updated_at": time.time()}
+        _save_json_atomic(_universe_meta_path(), meta)
+        # Staré verze pryč; procesy, které je mají namapované, je vidí dál (POSIX unlink)
+        if old:
+            for name in (*UNIVERSE_FIELDS, "dates"):
+                try:
+                    os.remove(_universe_array_path(name, int(old["version"])))
+                except OSError:
+                    pass
+    return meta
+
+
+def _append_universe_rows(tickers: List[str]) -> Optional[Dict[str, Any]]:
+    """Dopíše nové dny do volných řádků; None => je potřeba přestavba (volá se pod zámkem)."""
+    meta = _universe_meta()
+    if meta.get("tickers") != tickers or int(meta.get("rows", 0)) < 2:
+        return None
+    version, rows, capacity = int(meta["version"]), int(meta["rows"]), int(meta["capacity"])
+    dates = np.load(_universe_array_path("dates", version), mmap_mode="r+")
+    arrays = {name: np.load(_universe_array_path(name, version), mmap_mode="r+") for name in UNIVERSE_FIELDS}
+    check_day = dates[rows - 2]
+    bars = {t: _daily_bars(t, check_day) for t in tickers}
+
+    # Kontrolní (předposlední) řádek musí sedět se storem, jinak se historie přepočítala
+    for j, t in enumerate(tickers):
+        b = bars[t]
+        if check_day in b.index:
+            old, new = float(arrays["close"][rows - 2, j]), float(b.at[check_day, "close"])
+            if np.isfinite(old) and np.isfinite(new) and abs(new / old - 1.0) > 0.005:
+                return None
+
+    last_day = dates[rows - 1]
+    new_dates = np.unique(np.concatenate([b.index.to_numpy() for b in bars.values() if not b.empty] or [np.array([], "datetime64[D]")]))
+    new_dates = new_dates[new_dates >= last_day]
+    if len(new_dates) == 0:
+        return meta
+    # Poslední řádek se přepisuje také (mohl vzniknout z neúplného intraday baru)
+    start = rows - 1 if new_dates[0] == last_day else rows
+    end = start + len(new_dates)
+    if end > capacity:
+        return None
+
+    dates[start:end] = new_dates
+    for arr in arrays.values():
+        arr[start:end] = np.nan
+    for j, t in enumerate(tickers):
+        b = bars[t]
+        b = b[b.index >= new_dates[0]]
+        if b.empty:
+            continue
+        pos = start + np.searchsorted(new_dates, b.index.to_numpy())
+        for name, arr in arrays.items():
+            arr[pos, j] = b[name].to_numpy()
+    for arr in (*arrays.values(), dates):
+        arr.flush()
+
+    meta.update(rows=end, updated_at=time.time())
+    _save_json_atomic(_universe_meta_path(), meta)
+    return meta
+
+
+def update_universe_matrix(tickers: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Inkrementální update po stažení nových barů do OHLCV storů (volá ho warming job).
+
+    Jiný seznam tickerů, došlá kapacita nebo přepočtená historie (split/dividenda) => přestavba.
+    """
+    tickers = list(dict.fromkeys(str(t).upper().strip() for t in (tickers or warm_universe()) if str(t).strip()))
+    with _universe_write_lock():
+        meta = _append_universe_rows(tickers)
+    return meta if meta is not None else build_universe_matrix(tickers)
+
+
+@dataclass
+class UniverseMatrix:
+    """Read-only pohled na namapované soubory (řádky = obchodní dny, sloupce = tickery)."""
+    version: int
+    tickers: List[str]
+    dates: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def frame(self, field: str = "close", tickers: Optional[List[str]] = None, start: Optional[Any] = None) -> pd.DataFrame:
+        """DataFrame nad memmapou; všechny tickery = bez kopie, výběr sloupců kopíruje jen je."""
+        arr = getattr(self, field)
+        lo = int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start).date(), "D"))) if start is not None else 0
+        if tickers is None:
+            return pd.DataFrame(arr[lo:], index=pd.DatetimeIndex(self.dates[lo:]), columns=self.tickers, copy=False)
+        cols = [self.tickers.index(t) for t in tickers]
+        return pd.DataFrame(arr[lo:, cols], index=pd.DatetimeIndex(self.dates[lo:]), columns=list(tickers))
+
+
+def open_universe_matrix() -> Optional[UniverseMatrix]:
+    """Namapuje aktuální verzi matice (mapy se v procesu drží per verze, `rows` se čte z meta)."""
+    meta = _universe_meta()
+    if not meta:
+        return None
+    version, rows = int(meta["version"]), int(meta["rows"])
+    try:
+        maps = _UNIVERSE_MAPS.get(version)
+        if maps is None:
+            maps = {name: np.load(_universe_array_path(name, version), mmap_mode="r") for name in (*UNIVERSE_FIELDS, "dates")}
+            _UNIVERSE_MAPS.clear()
+            _UNIVERSE_MAPS[version] = maps
+    except (OSError, ValueError):
+        return None
+    return UniverseMatrix(
+        version=version,
+        tickers=list(meta["tickers"]),
+        dates=maps["dates"][:rows],
+        close=maps["close"][:rows],
+        volume=maps["volume"][:rows],
+    )
+
+
+def universe_close_frame(tickers: List[str], start: Optional[Any] = None) -> Optional[pd.DataFrame]:
+    """Close (datum × ticker) z universe matice; None, pokud v ní některý ticker chybí."""
+    m = open_universe_matrix()
+    keys = [str(t).upper().strip() for t in tickers]
+    if m is None or any(k not in m.tickers for k in keys):
+        return None
+    df = m.frame("close", keys, start)
+    return df.dropna(how="all")
+
+
+# --- Intraday store (1m / 5m / 1h) -------------------------------------------
+# Parquet per ticker a interval. Z yfinance se průběžně stahují jen 1m bary od
+# posledního uloženého; minutové bary za retencí se sloučí do 5m, 5m za retencí
+# do 1h a 1h za retencí se zahodí. 5m/1h se od Yahoo stahují jen jako backfill,
+# když mezi nimi a jemnějším storem vznikne díra (první běh, dlouhá pauza).
+
+INTRADAY_INTERVALS = ("1m", "5m", "1h")
+_INTRADAY_BACKFILL = {"1m": "7d", "5m": "60d", "1h": "730d"}  # nejdelší period, kterou Yahoo pro interval vrátí
+_INTRADAY_FREQ = {"1m": "1min", "5m": "5min", "1h": "1h"}
+_INTRADAY_OVERLAP = pd.Timedelta(minutes=5)  # poslední minuty znovu (bar mohl být neúplný)
+_INTRADAY_GAP_TOLERANCE = pd.Timedelta(days=4)  # víkend se svátkem není díra
+INTRADAY_SPANS = {"1d": ("1m", 1), "5d": ("5m", 5)}  # span grafu -> (interval, počet sessions)
+_OHLCV_AGG = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+
+def _intraday_store_path(ticker: str, interval: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9._^=-]", "_", ticker.upper().strip())
+    return os.path.join(INTRADAY_STORE_DIR, f"{safe}_{interval}.parquet")
+
+
+def _read_intraday_store(ticker: str, interval: str) -> pd.DataFrame:
+    path = _intraday_store_path(ticker, interval)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    try:
+        return compact_price_frame(pd.read_parquet(path))
+    except Exception:
+        return pd.DataFrame()
+
+
+def _write_intraday_store(ticker: str, interval: str, df: pd.DataFrame) -> pd.DataFrame:
+    df = compact_price_frame(df)
+    try:
+        os.makedirs(INTRADAY_STORE_DIR, exist_ok=True)
+        path = _intraday_store_path(ticker, interval)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp)
+        os.replace(tmp, path)
+    except Exception:
+        pass
+    return df
+
+
+def _intraday_is_fresh(ticker: str) -> bool:
+    try:
+        mtime = os.path.getmtime(_intraday_store_path(ticker, "1m"))
+    except OSError:
+        return False
+    sess = market_session(ticker)
+    if sess is not None and not sess["is_open"] and sess["last_close"] is not None:
+        return mtime >= sess["last_close"].timestamp() + 300
+    return (time.time() - mtime) < INTRADAY_REFRESH_S
+
+
+def _merge_bars(old: pd.DataFrame, new: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Spojí bary; v překryvu vyhrává `new`."""
+    if new is None or new.empty:
+        return old
+    if old.empty:
+        return new.sort_index()
+    return pd.concat([old[~old.index.isin(new.index)], new]).sort_index()
+
+
+def _resample_bars(bars: pd.DataFrame, interval: str, ticker: str) -> pd.DataFrame:
+    """OHLCV do hrubšího intervalu; hodinové koše začínají v minutě otevření burzy (NYSE 9:30)."""
+    if bars.empty:
+        return bars
+    ex = exchange_for_ticker(ticker)
+    offset = pd.Timedelta(minutes=ex.open_time.minute) if ex is not None and interval == "1h" else None
+    agg = {c: f for c, f in _OHLCV_AGG.items() if c in bars.columns}
+    out = bars[list(agg)].resample(_INTRADAY_FREQ[interval], origin="start_day", offset=offset).agg(agg)
+    return out.dropna(subset=["Close"])
+
+
+def _compact_intraday(ticker: str, stores: Dict[str, pd.DataFrame], now: pd.Timestamp) -> Dict[str, pd.DataFrame]:
+    """Bary za retencí jemného intervalu sloučí do hrubšího; hranice je půlnoc (koš nikdy nepřekročí den)."""
+    for fine, coarse in (("1m", "5m"), ("5m", "1h")):
+        df = stores[fine]
+        if df.empty:
+            continue
+        cutoff = (now - pd.Timedelta(days=INTRADAY_RETENTION_DAYS[fine])).normalize()
+        old = df[df.index < cutoff]
+        if old.empty:
+            continue
+        rolled = _resample_bars(old, coarse, ticker)
+        # Bary hrubšího intervalu přímo z Yahoo mají přednost (minutová data mívají mezery)
+        stores[coarse] = _merge_bars(rolled, stores[coarse])
+        stores[fine] = df[df.index >= cutoff]
+    h = stores["1h"]
+    if not h.empty:
+        stores["1h"] = h[h.index >= (now - pd.Timedelta(days=INTRADAY_RETENTION_DAYS["1h"])).normalize()]
+    return stores
+
+
+def update_intraday_store(ticker: str, force: bool = False) -> Dict[str, pd.DataFrame]:
+    """Vrátí {interval: bary} z disku a dotáhne jen nové minutové bary (viz výše)."""
+    ticker = ticker.upper().strip()
+    with _price_store_lock(f"{ticker}@intraday"):
+        stores = {iv: _read_intraday_store(ticker, iv) for iv in INTRADAY_INTERVALS}
+        if not force and not stores["1m"].empty and _intraday_is_fresh(ticker):
+            return stores
+
+        try:
+            t = yf.Ticker(ticker)
+            m = stores["1m"]
+            tz = getattr(m.index, "tz", None)
+            now = pd.Timestamp.now(tz=tz)
+            if m.empty or m.index.max() < now - pd.Timedelta(days=INTRADAY_RETENTION_DAYS["1m"]):
+                fresh = _yf_call("history", ticker, lambda: t.history(period=_INTRADAY_BACKFILL["1m"], interval="1m"),
+                                 period=_INTRADAY_BACKFILL["1m"], interval="1m")
+            else:
+                start = m.index.max() - _INTRADAY_OVERLAP
+                fresh = _yf_call("history", ticker, lambda: t.history(start=start, interval="1m"),
+                                 start=start.isoformat(), interval="1m")
+            stores["1m"] = _merge_bars(m, fresh)
+
+            for fine, coarse in (("1m", "5m"), ("5m", "1h")):
+                f, c = stores[fine], stores[coarse]
+                if not f.empty and (c.empty or c.index.max() < f.index.min() - _INTRADAY_GAP_TOLERANCE):
+                    back = _yf_call("history", ticker, lambda iv=coarse: t.history(period=_INTRADAY_BACKFILL[iv], interval=iv),
+                                    period=_INTRADAY_BACKFILL[coarse], interval=coarse)
+                    stores[coarse] = _merge_bars(c, back)
+
+            if stores["1m"].empty:
+                return stores
+            stores = _compact_intraday(ticker, stores, pd.Timestamp.now(tz=stores["1m"].index.tz))
+            for iv, df in stores.items():
+                if not df.empty:
+                    stores[iv] = _write_intraday_store(ticker, iv, df)
+        except Exception:
+            pass
+        return stores
+
+
+@cached(ttl=2 * INTRADAY_REFRESH_S, shared=True)  # epoch se při obchodování mění každou minutu
+def fetch_intraday_bars(ticker: str, span: str = "1d", epoch: str = "") -> pd.DataFrame:
+    """Bary pro intraday graf: "1d" = 1m bary poslední session, "5d" = 5m bary posledních 5 sessions.
+
+    `epoch` = `market_epoch(ticker, open_ttl=INTRADAY_REFRESH_S)`.
+    """
+    interval, sessions = INTRADAY_SPANS.get(span, INTRADAY_SPANS["1d"])
+    stores = update_intraday_store(ticker)
+    bars = stores[interval]
+    if interval != "1m":
+        # Poslední dny 5m storu vznikají až kompakcí -> doplnit z minutových barů
+        bars = _merge_bars(bars, _resample_bars(stores["1m"], interval, ticker))
+    if bars.empty:
+        return pd.DataFrame()
+    days = bars.index.normalize().unique()
+    return bars[bars.index >= days[-min(sessions, len(days))]]
+
+
+# --- Perzistentní store finančních výkazů ------------------------------------
+# Jeden Parquet na ticker v long formátu (statement, period_end, line_item, value).
+# Výkazy se mění jen při reportu, takže yfinance se znovu ptáme až po očekávaném
+# termínu dalšího reportu (konec posledního kvartálu + kvartál + report lag).
+# Do té doby jde opakovaná analýza tickeru bez jediného requestu na výkazy.
+
+STATEMENT_KINDS = (
+    "financials", "balance_sheet", "cashflow",
+    "quarterly_financials", "quarterly_balance_sheet", "quarterly_cashflow",
+)
+_STATEMENT_INDEX_LOCK = _process_state("statement_index_lock", threading.Lock)
+
+
+def _statement_index() -> Dict[str, Dict[str, Any]]:
+    return _shared_json_index("statement_index", STATEMENT_INDEX_PATH)
+
+
+def _statement_store_path(ticker: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9._^=-]", "_", ticker.upper().strip())
+    return os.path.join(STATEMENT_STORE_DIR, f"{safe}.parquet")
+
+
+def _statement_to_long(kind: str, df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Wide výkaz z yfinance (řádky = položky, sloupce = konce období) -> long řádky."""
+    if df is None or not isinstance(df, pd.DataFrame) or df.empty:
+        return pd.DataFrame(columns=["statement", "period_end", "line_item", "value"])
+    wide = df.copy()
+    wide.columns = pd.to_datetime(wide.columns, errors="coerce")
+    wide = wide.loc[:, wide.columns.notna()]
+    wide.index = wide.index.map(str)
+    long = wide.rename_axis(index="line_item", columns="period_end").stack(future_stack=True).reset_index(name="value")
+    long["value"] = pd.to_numeric(long["value"], errors="coerce")
+    long.insert(0, "statement", kind)
+    return long
+
+
+def _statement_from_long(long: pd.DataFrame, kind: str) -> pd.DataFrame:
+    """Zpět na tvar `yf.Ticker.<kind>`: položky × období, nejnovější období vlevo."""
+    if long is None or long.empty:
+        return pd.DataFrame()
+    part = long[long["statement"] == kind]
+    if part.empty:
+        return pd.DataFrame()
+    wide = part.pivot_table(index="line_item", columns="period_end", values="value", aggfunc="last", dropna=False)
+    wide = wide.reindex(columns=sorted(wide.columns, reverse=True))
+    wide.index.name = None
+    wide.columns.name = None
+    return wide
+
+
+def _read_statement_store(ticker: str) -> pd.DataFrame:
+    path = _statement_store_path(ticker)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    try:
+        return pd.read_parquet(path)
+    except Exception:
+        return pd.DataFrame()
+
+
+def _write_statement_store(ticker: str, long: pd.DataFrame) -> None:
+    try:
+        os.makedirs(STATEMENT_STORE_DIR, exist_ok=True)
+        path = _statement_store_path(ticker)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        long.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def _statement_next_check(long: pd.DataFrame, ticker: Optional[str] = None) -> float:
+    """Unix čas, kdy má smysl se znovu ptát: po očekávaném reportu dalšího kvartálu.
+
+    Známe-li datum příštích earnings, ptáme se den po nich (výkazy do yfinance dorazí s reportem).
+    """
+    now = time.time()
+    next_earnings = _known_earnings_dates(ticker).get("next") if ticker else None
+    if next_earnings:
+        after = pd.Timestamp(next_earnings) + pd.Timedelta(days=1)
+        if after.timestamp() > now:
+            return after.timestamp()
+    if long is None or long.empty:
+        return now + STATEMENT_RECHECK_S
+    q = long[long["statement"].str.startswith("quarterly_")]
+    last_end = pd.Timestamp((q if not q.empty else long)["period_end"].max())
+    step = pd.Timedelta(days=91 if not q.empty else 365)
+    expected = (last_end + step + pd.Timedelta(days=STATEMENT_REPORT_LAG_DAYS)).timestamp()
+    # Termín už minul a nový kvartál pořád není -> zkoušet denně
+    return max(expected, now + STATEMENT_RECHECK_S) if expected <= now else expected
+
+
+def _statement_index_set(ticker: str, entry: Dict[str, Any]) -> None:
+    try:
+        def update(index: Dict[str, Any]) -> bool:
+            index[ticker.upper()] = entry
+            return True
+
+        with _STATEMENT_INDEX_LOCK:
+            _update_json_index("statement_index", STATEMENT_INDEX_PATH, update)
+    except Exception:
+        pass
+
+
+def load_statements(ticker: str, force: bool = False, yf_ticker: Any = None) -> Dict[str, pd.DataFrame]:
+    """Všech 6 výkazů tickeru (roční + kvartální) ze storu; yfinance jen když čekáme nový report.
+
+    Nová období se do storu přidávají, stará zůstávají (yfinance vrací jen posledních
+    ~4-5 období, store tak časem drží delší historii). Hodnoty období, která yfinance
+    vrátí znovu, se přepíšou (restatement).
+    """
+    key = ticker.upper().strip()
+    with _price_store_lock(f"statements:{key}"):
+        stored = _read_statement_store(key)
+        with _STATEMENT_INDEX_LOCK:
+            entry = dict(_statement_index().get(key) or {})
+        due = force or stored.empty or time.time() >= float(entry.get("next_check") or 0)
+
+        if due:
+            t = yf_ticker if yf_ticker is not None else yf.Ticker(key)
+            parts = []
+            for kind in STATEMENT_KINDS:
+                try:
+                    parts.append(_statement_to_long(kind, _yf_call(kind, key, lambda: getattr(t, kind))))
+                except Exception:
+                    continue
+            fresh = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+            if not fresh.empty:
+                merged = pd.concat([stored, fresh], ignore_index=True) if not stored.empty else fresh
+                merged = merged.drop_duplicates(["statement", "period_end", "line_item"], keep="last")
+                merged = merged.sort_values(["statement", "period_end", "line_item"]).reset_index(drop=True)
+                if stored.empty or not merged.equals(stored):
+                    _write_statement_store(key, merged)
+                stored = merged
+            # I při chybě/prázdné odpovědi posuneme next_check, ať se neptáme při každé analýze
+            _statement_index_set(key, {
+                "fetched_at": time.time(),
+                "next_check": _statement_next_check(stored, key),
+                "periods": int(len(stored.drop_duplicates(["statement", "period_end"]))) if not stored.empty else 0,
+            })
+
+    return {kind: _statement_from_long(stored, kind) for kind in STATEMENT_KINDS}
+
+
+# --- Kanonické výkazy (normalizer) ---
+# Providery pojmenovávají řádky výkazů různě (starší / novější yfinance API, a store
+# po jejich sloučení drží oba názvy pro různá období). normalize_statement řádky jednou
+# namapuje na kanonická pole a vrátí hustou float64 matici (pole × období, nejnovější
+# vlevo); výpočty (Piotroski, Altman, FCF TTM) pak čtou hodnoty O(1) lookupem
+# `stmt.row("total_assets")` místo lineárního hledání labelů.
+
+CANONICAL_STATEMENT_FIELDS: Dict[str, Tuple[str, ...]] = {
+    # pole -> labely řádků v pořadí priority (hodnota období = první ne-NaN z nich)
+    "revenue": ("Total Revenue", "Operating Revenue"),
+    "ebit": ("Ebit", "EBIT", "Operating Income"),
+    "net_income": ("Net Income", "Net Income Applicable To Common Shares"),
+    "total_assets": ("Total Assets",),
+    "current_assets": ("Total Current Assets", "Current Assets"),
+    "current_liabilities": ("Total Current Liabilities", "Current Liabilities"),
+    "total_liabilities": ("Total Liab", "Total Liabilities Net Minority Interest", "Total Liabilities"),
+    "total_equity": ("Total Stockholder Equity", "Stockholders Equity", "Total Equity Gross Minority Interest", "Total Equity"),
+    "retained_earnings": ("Retained Earnings", "Retained Earnings (Accumulated Deficit)"),
+    "free_cash_flow": ("Free Cash Flow", "FreeCashFlow", "Free cash flow"),
+    "operating_cash_flow": (
+        "Operating Cash Flow",
+        "Total Cash From Operating Activities",
+        "Total Cash From Operating Activities (Continuing Operations)",
+        "Cash Flow From Continuing Operating Activities",
+        "Net Cash Provided By Operating Activities",
+    ),
+    "capex": (
+        "Capital Expenditures",
+        "Capital Expenditure",
+        "CapitalExpenditures",
+        "Purchase Of PPE",
+        "Purchase of Property Plant Equipment",
+    ),
+}
+_CANONICAL_ROW = {name: i for i, name in enumerate(CANONICAL_STATEMENT_FIELDS)}
+
+
+@dataclass(frozen=True)
+class CanonicalStatement:
+    """Výkaz v kanonickém schématu: `values[řádek pole, období]`, období od nejnovějšího, NaN = chybí."""
+    columns: Tuple[Any, ...]  # původní labely období (stejné pořadí jako sloupce `values`)
+    values: np.ndarray  # float64, tvar (len(CANONICAL_STATEMENT_FIELDS), len(columns))
+    labels: Dict[str, str]  # pole -> label řádku providera, ze kterého pole pochází (pro debug)
+
+    @property
+    def empty(self) -> bool:
+        return not self.columns or not self.labels
+
+    def row(self, name: str) -> Optional[np.ndarray]:
+        """Hodnoty pole přes všechna období (None = výkaz pole nemá)."""
+        return self.values[_CANONICAL_ROW[name]] if name in self.labels else None
+
+    def value(self, name: str, period: int = 0) -> Optional[float]:
+        """Hodnota pole v `period`-tém nejnovějším období (None = chybí / NaN)."""
+        if name not in self.labels or period >= len(self.columns):
+            return None
+        return safe_float(self.values[_CANONICAL_ROW[name], period])
+
+
+StatementLike = Union[pd.DataFrame, CanonicalStatement, None]
+
+
+def _sorted_period_columns(df: pd.DataFrame) -> List[Any]:
+    """Sloupce výkazu od nejnovějšího období (nedatumové sloupce zůstanou v původním pořadí)."""
+    cols = list(df.columns)
+    dts = pd.to_datetime(pd.Index(cols), errors="coerce")
+    if not dts.notna().any():
+        return cols
+    order = sorted(range(len(cols)), key=lambda i: (pd.isna(dts[i]), -dts[i].value if not pd.isna(dts[i]) else 0))
+    return [cols[i] for i in order]
+
+
+def normalize_statement(df: StatementLike) -> CanonicalStatement:
+    """yfinance / store výkaz (položky × období) -> CanonicalStatement; labely se hledají přesně, pak bez ohledu na velikost písmen."""
+    if isinstance(df, CanonicalStatement):
+        return df
+    n_fields = len(CANONICAL_STATEMENT_FIELDS)
+    if df is None or not isinstance(df, pd.DataFrame) or df.empty:
+        return CanonicalStatement((), np.full((n_fields, 0), np.nan), {})
+    cols = _sorted_period_columns(df)
+    raw = df.reindex(columns=cols).apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    by_label = {str(label): i for i, label in enumerate(df.index)}
+    by_lower: Dict[str, int] = {}
+    for label, i in by_label.items():
+        by_lower.setdefault(label.strip().lower(), i)
+    values = np.full((n_fields, len(cols)), np.nan)
+    labels: Dict[str, str] = {}
+    for name, candidates in CANONICAL_STATEMENT_FIELDS.items():
+        hits = [by_label.get(c) for c in candidates]
+        hits += [by_lower.get(c.strip().lower()) for c in candidates]
+        hits = list(dict.fromkeys(i for i in hits if i is not None))
+        if not hits:
+            continue
+        labels[name] = str(df.index[hits[0]])
+        out = values[_CANONICAL_ROW[name]]
+        for i in hits:  # první ne-NaN hodnota podle priority labelů
+            fill = np.isnan(out)
+            if not fill.any():
+                break
+            out[fill] = raw[i, fill]
+    return CanonicalStatement(tuple(cols), values, labels)
+
+
+# --- TTM engine (trailing součty pro všechny položky najednou) ---
+# Kvartální výkaz v kanonickém tvaru je matice pole × kvartál, takže TTM, předchozí
+# TTM a YoY růst jdou spočítat pro všechny řádky jedním vektorovým průchodem
+# (okno 2 × `quarters` sloupců). yfinance dává obvykle jen ~5 kvartálů, takže bez
+# dvou úplných oken se YoY bere jako poslední kvartál vs. stejný kvartál o rok dřív.
+# Dávková verze skládá řádky víc tickerů do jedné matice.
+
+TTM_STATEMENTS = ("quarterly_financials", "quarterly_cashflow")  # odkud se berou kvartální položky (v pořadí priority)
+TTM_COLUMNS = ("ttm", "quarters", "annualized", "prev_ttm", "yoy", "yoy_quarter", "as_of")
+
+
+def ttm_engine(values: np.ndarray, quarters: int = 4) -> Dict[str, np.ndarray]:
+    """Trailing hodnoty pro každý řádek matice (řádky × kvartály, nejnovější vlevo).
+
+    - `ttm`: součet posledních `quarters` kvartálů; chybí-li některé (NaN), průměr dostupných × `quarters`
+    - `quarters`: kolik kvartálů okna je k dispozici, `annualized`: True = ttm je extrapolace
+    - `prev_ttm`: totéž pro předchozích `quarters` kvartálů, `yoy`: růst proti `prev_ttm` (jen z úplných oken),
+      jinak růst posledního kvartálu proti stejnému kvartálu o rok dřív (`yoy_quarter` = True)
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    width = 2 * quarters
+    if values.shape[1] < width:
+        values = np.pad(values, ((0, 0), (0, width - values.shape[1])), constant_values=np.nan)
+    windows = values[:, :width].reshape(len(values), 2, quarters)
+    finite = np.isfinite(windows)
+    n = finite.sum(axis=2)
+    sums = np.where(finite, windows, 0.0).sum(axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        annual = np.where(n >= quarters, sums, np.where(n > 0, sums / n * quarters, np.nan))
+        full = n >= quarters
+        ttm_basis = full[:, 0] & full[:, 1] & (annual[:, 1] != 0)
+        last, year_ago = values[:, 0], values[:, quarters]
+        quarter_yoy = np.where(np.isfinite(last) & np.isfinite(year_ago) & (year_ago != 0),
+                               (last - year_ago) / np.abs(year_ago), np.nan)
+        yoy = np.where(ttm_basis, (annual[:, 0] - annual[:, 1]) / np.abs(annual[:, 1]), quarter_yoy)
+    return {
+        "ttm": annual[:, 0],
+        "quarters": n[:, 0],
+        "annualized": (n[:, 0] > 0) & (n[:, 0] < quarters),
+        "prev_ttm": annual[:, 1],
+        "yoy": yoy,
+        "yoy_quarter": ~ttm_basis & np.isfinite(quarter_yoy),
+    }
+
+
+def _ttm_rows(statements: Dict[str, "StatementLike"]) -> List[Tuple[str, CanonicalStatement]]:
+    """(pole, výkaz) pro každé kanonické pole kvartálních výkazů; pole z více výkazů bere první podle TTM_STATEMENTS."""
+    rows: Dict[str, CanonicalStatement] = {}
+    for kind in TTM_STATEMENTS:
+        stmt = normalize_statement(statements.get(kind))
+        for name in stmt.labels:
+            if stmt.columns:
+                rows.setdefault(name, stmt)
+    return list(rows.items())
+
+
+def _ttm_frame(index: Any, rows: List[Tuple[str, CanonicalStatement]], quarters: int) -> pd.DataFrame:
+    if not rows:
+        return pd.DataFrame(columns=list(TTM_COLUMNS), index=index)
+    width = 2 * quarters
+    matrix = np.full((len(rows), width), np.nan)
+    for r, (name, stmt) in enumerate(rows):
+        row = stmt.values[_CANONICAL_ROW[name], :width]
+        matrix[r, :len(row)] = row
+    out = pd.DataFrame(ttm_engine(matrix, quarters), index=index)
+    out["as_of"] = [pd.to_datetime(stmt.columns[0], errors="coerce") for _, stmt in rows]
+    return out
+
+
+def statement_ttm(statements: Any, quarters: int = 4) -> pd.DataFrame:
+    """TTM tabulka tickeru (řádek = kanonické pole): ttm, quarters, annualized, prev_ttm, yoy, as_of.
+
+    `statements` = TickerBundle nebo dict výkazů (např. z `load_statements`).
+    """
+    if isinstance(statements, dict):
+        rows = _ttm_rows(statements)
+    else:
+        rows = _ttm_rows({kind: statements.canonical(kind) for kind in TTM_STATEMENTS})
+    return _ttm_frame(pd.Index([name for name, _ in rows], name="field"), rows, quarters)
+
+
+@cached(ttl=FUNDAMENTALS_MAX_TTL, cache_if=lambda v: not v.empty)
+def batch_statement_ttm(tickers: Tuple[str, ...], quarters: int = 4, epoch: str = "") -> pd.DataFrame:
+    """TTM tabulka pro víc tickerů najednou (MultiIndex ticker × pole), jeden průchod enginem.
+
+    Výkazy se čtou ze statement storu; `epoch` = earnings_epoch tickerů spojené `|`.
+    """
+    rows: List[Tuple[str, CanonicalStatement]] = []
+    keys: List[Tuple[str, str]] = []
+    for t in tickers:
+        try:
+            per_ticker = _ttm_rows(load_statements(t))
+        except Exception:
+            continue
+        rows += per_ticker
+        keys += [(t, name) for name, _ in per_ticker]
+    return _ttm_frame(pd.MultiIndex.from_tuples(keys, names=["ticker", "field"]), rows, quarters)
+
+
+@cached(ttl=3600, shared=True)
+def fetch_financials(ticker: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Fetch income statement, balance sheet, and cash flow (ze statement storu)."""
+    try:
+        st_ = load_statements(ticker)
+        return st_["financials"], st_["balance_sheet"], st_["cashflow"]
+    except Exception:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+
+
+@cached(ttl=FUNDAMENTALS_MAX_TTL, cache_if=lambda v: v[0] is not None)
+def get_fcf_ttm_yfinance(ticker: str, market_cap: Optional[float] = None, _bundle: Optional[TickerBundle] = None, epoch: str = "") -> Tuple[Optional[float], List[str]]:
+    """Robustně spočítá roční Free Cash Flow (TTM) z yfinance quarterly_cashflow.
+
+    Pravidla:
+    - Primárně sečte poslední 4 dostupné kvartály (TTM).
+    - Když chybí řádek 'Free Cash Flow', spočítá FCF jako Operating Cash Flow - |CapEx|.
+    - Pokud jsou dostupná jen 1-3 kvartální čísla, annualizuje průměrem ×4.
+    - Sanity check: pro obří firmy (MarketCap > $1T) a podezřele nízké FCF (< $30B)
+      aplikuje pojistku násobení 4× (typicky když provider vrátí jen 1 kvartál).
+    - Vrací (fcf_ttm, dbg) kde dbg je list informativních zpráv.
+    - `_bundle` (nehashuje se do cache klíče): už stažený TickerBundle, pak se nic nestahuje.
+    - `epoch` = `earnings_epoch(ticker)`; výsledek drží v cache do dalších earnings.
+    """
+    dbg: List[str] = []
+    try:
+        t = _bundle if _bundle is not None else TickerBundle(ticker=ticker, **load_statements(ticker))
+        qcf = t.canonical("quarterly_cashflow")
+        if not qcf.columns:
+            dbg.append("FCF: quarterly_cashflow není k dispozici (prázdné). Zkouším fallback.")
+
+        # 1) vyber poslední dostupné kvartály (normalizer je seřadil od nejnovějšího)
+        cols_sel = list(qcf.columns[:4])
+        if cols_sel:
+            dbg.append(f"FCF: Načítám kvartály: {', '.join([str(c) for c in cols_sel])}")
+        else:
+            dbg.append("FCF: Nenalezeny žádné kvartální sloupce v quarterly_cashflow.")
+
+        # 2) primárně: přímý řádek Free Cash Flow
+        fcf_row = qcf.row("free_cash_flow")
+        used_method = None
+
+        fcf_quarters = None
+        non_null = 0
+
+        if fcf_row is not None and cols_sel:
+            s = fcf_row[:len(cols_sel)]
+            non_null = int(np.isfinite(s).sum())
+            if non_null > 0:
+                fcf_quarters = s
+                used_method = f"quarterly row '{qcf.labels['free_cash_flow']}'"
+        # 3) fallback: OCF - |CapEx|
+        if fcf_quarters is None and cols_sel:
+            ocf, capex = qcf.row("operating_cash_flow"), qcf.row("capex")
+            if ocf is not None and capex is not None:
+                ocf, capex = ocf[:len(cols_sel)], capex[:len(cols_sel)]
+                non_null = int((np.isfinite(ocf) & np.isfinite(capex)).sum())
+                if non_null > 0:
+                    # CapEx bývá záporný; chceme: FCF = OCF - |CapEx|
+                    fcf_quarters = ocf - np.abs(capex)
+                    used_method = f"computed: '{qcf.labels['operating_cash_flow']}' - |'{qcf.labels['capex']}'|"
+
+        # 4) pokud pořád nic, fallback na annual cashflow / info
+        if fcf_quarters is None:
+            # annual cashflow (nejnovější rok)
+            v = t.canonical("cashflow").value("free_cash_flow")
+            if v is not None:
+                dbg.append("FCF: Používám annual cashflow (nejnovější rok) – řádek Free Cash Flow.")
+                used_method = "annual row 'Free Cash Flow'"
+                fcf_ttm = float(v)
+                msg = f"Použité roční FCF (TTM): ${fcf_ttm/1e9:.1f} miliard ({used_method})"
+                dbg.append(msg)
+                return fcf_ttm, dbg
+
+            # last resort: info['freeCashflow']
+            try:
+                info = getattr(t, "info", None) or fetch_ticker_info(ticker, market_epoch(ticker))
+            except Exception:
+                info = {}
+            v = safe_float(info.get("freeCashflow"))
+            if v is not None:
+                used_method = "info['freeCashflow'] (fallback)"
+                fcf_ttm = float(v)
+                msg = f"Použité roční FCF (TTM): ${fcf_ttm/1e9:.1f} miliard ({used_method})"
+                dbg.append(msg)
+                return fcf_ttm, dbg
+
+            dbg.append("FCF: Nepodařilo se získat FCF ani z quarterly ani z annual ani z info.")
+            return None, dbg
+
+        # 5) TTM / extrapolace (součet 4 kvartálů, jinak průměr ×4) přes ttm_engine
+        ttm = ttm_engine(fcf_quarters, quarters=4)
+        n = int(ttm["quarters"][0])
+        if n == 0:
+            dbg.append("FCF: kvartální hodnoty jsou všechny NaN.")
+            return None, dbg
+        fcf_ttm = float(ttm["ttm"][0])
+        applied_extrap = bool(ttm["annualized"][0])
+        used_sum4 = n >= 4
+
+        # 6) Sanity check (market cap > 1T & FCF < 30B) -> 4×
+        mc = safe_float(market_cap)
+        if (not applied_extrap) and used_sum4 and mc and mc > 1e12 and fcf_ttm < 30e9:
+            fcf_ttm *= 4.0
+            dbg.append("FCF: Sanity check aktivován (MarketCap > $1T a FCF < $30B) -> násobím 4× (podezření na 1 kvartál).")
+
+        # 7) Debug zprávy
+        if used_method:
+            dbg.append(f"FCF metoda: {used_method}. Kvartály použity: {n}.")
+        if applied_extrap:
+            dbg.append(f"FCF: Extrapolace do roční báze (k dispozici {n} kvartály) -> průměr ×4.")
+        if used_sum4:
+            dbg.append("FCF: TTM = součet posledních 4 kvartálů.")
+
+        msg = f"Použité roční FCF (TTM): ${fcf_ttm/1e9:.1f} miliard"
+        dbg.append(msg)
+
+        return fcf_ttm, dbg
+    except Exception as e:
+        dbg.append(f"FCF: chyba při výpočtu TTM: {e}")
+        return None, dbg
+def get_all_time_high(ticker: str, _bundle: Optional[TickerBundle] = None) -> Optional[float]:
+    """Get all-time high price – O(1) čtení z ATH indexu.
+
+    Index se plní z OHLCV storu; chybí-li záznam, postaví se jednou z `_bundle` (bez requestu)
+    nebo ze storu.
+    """
+    try:
+        key = ticker.upper()
+        with _ATH_INDEX_LOCK:
+            entry = _ath_index().get(key)
+        if entry is None:
+            bars = _bundle.ohlcv if _bundle is not None else update_price_store(ticker)
+            _ath_index_update(ticker, bars, rebuild=True)
+            with _ATH_INDEX_LOCK:
+                entry = _ath_index().get(key)
+        return safe_float(entry.get("ath")) if entry else None
+    except Exception:
+        return None
+
+
+def _redact_apikey(url: str) -> str:
+    try:
+        return re.sub(r"(apikey=)[^&]+", r"\1***", url, flags=re.IGNORECASE)
+    except Exception:
+        return url
+
+
+@cached(ttl=1800)
+def _http_get_json(url: str, headers_items: Tuple[Tuple[str, str], ...] = ()) -> Tuple[int, Any, str]:
+    """HTTP GET helper with Streamlit cache. Returns (status_code, json_or_None, error_text_or_empty)."""
+    host = urlsplit(url).hostname or ""
+    if OFFLINE_MODE:
+        return _http_get_json_raw(url, headers_items)
+    return _SINGLE_FLIGHT.do(
+        ("GET json", url, headers_items),
+        _rate_limited(host, lambda: _http_get_json_raw(url, headers_items)),
+    )
+
+
+def _http_get_json_raw(url: str, headers_items: Tuple[Tuple[str, str], ...] = ()) -> Tuple[int, Any, str]:
+    try:
+        return _snapshot_call(urlsplit(url).hostname or "http", ("GET json", _snapshot_url(url)),
+                              lambda: _http_get_json_live(url, headers_items))
+    except SnapshotMiss as e:
+        return 0, None, f"offline: chybí snapshot ({e})"
+
+
+def _http_get_json_live(url: str, headers_items: Tuple[Tuple[str, str], ...] = ()) -> Tuple[int, Any, str]:
+    try:
+        headers = dict(headers_items) if headers_items else None
+        r = requests.get(url, headers=headers, timeout=25)
+        status = int(getattr(r, "status_code", 0) or 0)
+        try:
+            return status, r.json(), ""
+        except Exception:
+            txt = getattr(r, "text", "") or ""
+            return status, None, txt[:2000]
+    except Exception as e:
+        return 0, None, str(e)
+
+
+@cached(ttl=86400)
+def _http_get_text(url: str, headers_items: Tuple[Tuple[str, str], ...] = ()) -> Tuple[int, str, str]:
+    """HTTP GET that returns raw text (needed for XML filings)."""
+    host = urlsplit(url).hostname or ""
+    if OFFLINE_MODE:
+        return _http_get_text_raw(url, headers_items)
+    return _SINGLE_FLIGHT.do(
+        ("GET text", url, headers_items),
+        _rate_limited(host, lambda: _http_get_text_raw(url, headers_items)),
+    )
+
+
+def _http_get_text_raw(url: str, headers_items: Tuple[Tuple[str, str], ...] = ()) -> Tuple[int, str, str]:
+    try:
+        return _snapshot_call(urlsplit(url).hostname or "http", ("GET text", _snapshot_url(url)),
+                              lambda: _http_get_text_live(url, headers_items))
+    except SnapshotMiss as e:
+        return 0, "", f"offline: chybí snapshot ({e})"
+
+
+def _http_get_text_live(url: str, headers_items: Tuple[Tuple[str, str], ...] = ()) -> Tuple[int, str, str]:
+    try:
+        headers = dict(headers_items) if headers_items else None
+        r = requests.get(url, headers=headers, timeout=25)
+        status = int(getattr(r, "status_code", 0) or 0)
+        return status, (getattr(r, "text", "") or ""), ""
+    except Exception as e:
+        return 0, "", str(e)
+
+
+@cached(ttl=86400, cache_if=bool)
+def _sec_company_tickers(user_agent: str) -> List[Tuple[str, int, str]]:
+    """
+    SEC 'company_tickers.json' -> [(TICKER, cik_int, název firmy)] v pořadí souboru (zhruba podle velikosti).
+    """
+    url = "https://www.sec.gov/files/company_tickers.json"
+    headers = (
+        ("User-Agent", user_agent),
+        ("Accept", "application/json"),
         ("Accept-Encoding", "gzip, deflate"),
     )
     status, data, err = _http_get_json(url, headers)
     if status != 200 or not isinstance(data, dict):
-        return {}
-    out: Dict[str, int] = {}
+        return []
+    out: List[Tuple[str, int, str]] = []
     for _, v in data.items():
         try:
             t = str(v.get("ticker", "")).upper().strip()
             cik = int(v.get("cik_str"))
             if t:
-                out[t] = cik
+                out.append((t, cik, str(v.get("title") or "").strip()))
         except Exception:
             continue
     return out
 
 
+def _sec_ticker_to_cik_map(user_agent: str) -> Dict[str, int]:
+    """
+    SEC 'company_tickers.json' -> mapping {TICKER: cik_int}.
+    """
+    return {t: cik for t, cik, _ in _sec_company_tickers(user_agent)}
+
+
+# --- Vyhledávání tickerů (trie + trigramy) ---
+# company_tickers.json obsahuje i názvy firem. Z něj se staví index uložený v
+# TICKER_INDEX_PATH: prefixová trie nad tickery a nad slovy názvů (každý uzel drží
+# TICKER_TRIE_TOP nejvýznamnějších kandidátů, dotaz je jen průchod pár uzly) plus
+# trigramový index pro překlepy. Vstup ze sidebaru se tak ověří lokálně ještě před
+# prvním voláním yfinance. Index se staví na pozadí (při startu procesu a když je
+# starší než TICKER_INDEX_MAX_AGE_S); dokud žádný není (první start, offline, SEC
+# nedostupná), se vstup neověřuje.
+
+TICKER_INDEX_VERSION = 1
+TICKER_TRIE_TOP = 8  # kandidátů uložených v každém uzlu trie
+TICKER_TRIE_MAX_DEPTH = 12  # slova názvů se do trie vkládají jen do této délky
+TICKER_INDEX_RETRY_S = 600  # po neúspěšném stažení SEC souboru se to znovu zkusí nejdřív za 10 min
+TICKER_FUZZY_MIN = {"ticker": 0.4, "name": 0.6}  # min. podobnost trigramů (ticker: Dice, název: pokrytí dotazu)
+_NAME_STOPWORDS = frozenset({"INC", "CORP", "CORPORATION", "CO", "LTD", "PLC", "THE", "OF", "AND", "LLC", "LP",
+                             "SA", "NV", "AG", "DE", "CLASS"})
+_TICKER_OUTSIDE_INDEX = re.compile(r"[.^=]|-USD$")  # burzovní suffixy, indexy, měny, krypto – SEC je nezná
+
+
+def _norm_name(text: str) -> str:
+    return " ".join(re.sub(r"[^A-Z0-9]+", " ", str(text).upper()).split())
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TickerSearchIndex:
+    """Trie (tickery + slova názvů) a trigramy nad `entries` = [(ticker, název)] seřazenými podle významu."""
+
+    def __init__(self, entries: List[Tuple[str, str]], built_at: float = 0.0, state: Optional[Dict[str, Any]] = None):
+        self.entries = entries
+        self.built_at = built_at
+        self.ids = {t: i for i, (t, _) in enumerate(entries)}
+        if state is not None:
+            self._children, self._top, self._name_root = state["children"], state["top"], state["name_root"]
+            self._grams, self._gram_counts = state["grams"], state["gram_counts"]
+            return
+        self._children: List[Dict[str, int]] = [{}]
+        self._top: List[List[int]] = [[]]
+        self._name_root = self._new_node()
+        grams: Dict[str, Dict[str, List[int]]] = {"ticker": {}, "name": {}}
+        counts: Dict[str, List[int]] = {"ticker": [], "name": []}
+        for i, (ticker, name) in enumerate(entries):
+            norm = _norm_name(name)
+            self._insert(0, ticker, i)
+            for word in dict.fromkeys(norm.split()):
+                if len(word) > 1 and word not in _NAME_STOPWORDS:
+                    self._insert(self._name_root, word[:TICKER_TRIE_MAX_DEPTH], i)
+            for kind, text in (("ticker", ticker), ("name", norm)):
+                tri = _trigrams(text)
+                counts[kind].append(len(tri))
+                for g in tri:
+                    grams[kind].setdefault(g, []).append(i)
+        self._grams = {k: {g: np.array(ids, dtype=np.int32) for g, ids in v.items()} for k, v in grams.items()}
+        self._gram_counts = {k: np.array(v, dtype=np.int32) for k, v in counts.items()}
+
+    def _new_node(self) -> int:
+        self._children.append({})
+        self._top.append([])
+        return len(self._children) - 1
+
+    def _insert(self, node: int, key: str, i: int) -> None:
+        # entries se vkládají v pořadí významu -> prvních TICKER_TRIE_TOP v uzlu je zároveň top
+        for ch in key:
+            child = self._children[node].get(ch)
+            if child is None:
+                child = self._children[node][ch] = self._new_node()
+            node = child
+            if len(self._top[node]) < TICKER_TRIE_TOP and (not self._top[node] or self._top[node][-1] != i):
+                self._top[node].append(i)
+
+    def _walk(self, node: int, key: str) -> List[int]:
+        for ch in key:
+            node = self._children[node].get(ch)
+            if node is None:
+                return []
+        return self._top[node] if key else []
+
+    def _fuzzy(self, kind: str, text: str, limit: int) -> List[Tuple[float, int]]:
+        query = _trigrams(text)
+        hits = [self._grams[kind][g] for g in query if g in self._grams[kind]]
+        if not hits or not self.entries:
+            return []
+        common = np.bincount(np.concatenate(hits), minlength=len(self.entries))
+        if kind == "ticker":
+            score = 2.0 * common / (len(query) + self._gram_counts[kind])
+        else:
+            score = common / len(query)
+        top = np.argpartition(-score, min(limit, len(score) - 1))[:limit]
+        return [(float(score[i]), int(i)) for i in top if score[i] >= TICKER_FUZZY_MIN[kind]]
+
+    def search(self, query: str, limit: int = 8) -> List[Tuple[str, str]]:
+        """Našeptávač: přesný ticker, prefix tickeru, prefix slov názvu, pak překlepy (trigramy)."""
+        ticker = str(query).upper().strip()
+        words = [w for w in _norm_name(query).split() if w not in _NAME_STOPWORDS] or _norm_name(query).split()
+        if not ticker:
+            return []
+        ids: List[int] = [self.ids[ticker]] if ticker in self.ids else []
+        ids += self._walk(0, ticker)
+        if words:
+            for i in self._walk(self._name_root, words[0][:TICKER_TRIE_MAX_DEPTH]):
+                name_words = _norm_name(self.entries[i][1]).split()
+                if all(any(nw.startswith(w) for nw in name_words) for w in words):
+                    ids.append(i)
+        if len(dict.fromkeys(ids)) < limit:
+            fuzzy = self._fuzzy("ticker", ticker, limit) + self._fuzzy("name", " ".join(words), limit)
+            ids += [i for _, i in sorted(fuzzy, key=lambda x: (-x[0], x[1]))]
+        return [self.entries[i] for i in list(dict.fromkeys(ids))[:limit]]
+
+    def state(self) -> Dict[str, Any]:
+        return {"version": TICKER_INDEX_VERSION, "built_at": self.built_at, "entries": self.entries,
+                "children": self._children, "top": self._top, "name_root": self._name_root,
+                "grams": self._grams, "gram_counts": self._gram_counts}
+
+
+@dataclass
+class TickerLookup:
+    """Výsledek ověření vstupu: `ticker` = co analyzovat (None = v indexu není), `suggestions` = [(ticker, název)]."""
+    query: str
+    ticker: Optional[str]
+    suggestions: List[Tuple[str, str]] = field(default_factory=list)
+
+
+_TICKER_INDEX_LOCK = _process_state("ticker_index_lock", threading.Lock)
+
+
+def build_ticker_index() -> TickerSearchIndex:
+    rows = _sec_company_tickers((SEC_USER_AGENT or "").strip() or "StockPickerPro/1.0")
+    entries = list({t: (t, title) for t, _, title in rows}.values())
+    return TickerSearchIndex(entries, built_at=time.time() if entries else 0.0)
+
+
+def _load_ticker_index() -> Optional[TickerSearchIndex]:
+    try:
+        with open(TICKER_INDEX_PATH, "rb") as fh:
+            state = pickle.loads(zlib.decompress(fh.read()))
+        if state.get("version") != TICKER_INDEX_VERSION:
+            return None
+        return TickerSearchIndex(state["entries"], state["built_at"], state=state)
+    except Exception:
+        return None
+
+
+def _save_ticker_index(index: TickerSearchIndex) -> None:
+    try:
+        os.makedirs(os.path.dirname(TICKER_INDEX_PATH), exist_ok=True)
+        tmp = f"{TICKER_INDEX_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(zlib.compress(pickle.dumps(index.state(), protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp, TICKER_INDEX_PATH)
+    except Exception:
+        pass
+
+
+def _refresh_ticker_index() -> None:
+    index = build_ticker_index()
+    if index.entries:
+        _save_ticker_index(index)
+        _PROCESS_STATE["ticker_index"] = index
+
+
+def ticker_search_index() -> TickerSearchIndex:
+    """Index z paměti / disku; chybějící nebo zastaralý se staví na pozadí (do té doby prázdný = bez validace)."""
+    index = _PROCESS_STATE.get("ticker_index")
+    if index is None:
+        with _TICKER_INDEX_LOCK:
+            index = _PROCESS_STATE.get("ticker_index")
+            if index is None:
+                index = _PROCESS_STATE["ticker_index"] = _load_ticker_index() or TickerSearchIndex([], built_at=0.0)
+    if time.time() - index.built_at > TICKER_INDEX_MAX_AGE_S:
+        with _TICKER_INDEX_LOCK:
+            if time.time() - _PROCESS_STATE.get("ticker_index_attempt", 0.0) > TICKER_INDEX_RETRY_S:
+                _PROCESS_STATE["ticker_index_attempt"] = time.time()
+                threading.Thread(target=_refresh_ticker_index, name="ticker-index", daemon=True).start()
+    return index
+
+
+def search_tickers(query: str, limit: int = 8) -> List[Tuple[str, str]]:
+    return ticker_search_index().search(query, limit)
+
+
+def validate_ticker(query: str) -> TickerLookup:
+    """Ověří vstup lokálně (bez yfinance): známý ticker projde, jinak vrátí návrhy z indexu."""
+    ticker = str(query).upper().strip()
+    index = ticker_search_index()
+    if not ticker:
+        return TickerLookup(query, None)
+    if not index.entries or ticker in index.ids:
+        return TickerLookup(query, ticker)
+    if ticker.replace(".", "-") in index.ids:  # BRK.B -> BRK-B (zápis SEC i Yahoo)
+        return TickerLookup(query, ticker.replace(".", "-"))
+    if _TICKER_OUTSIDE_INDEX.search(ticker) or ticker in warm_universe():  # SAP.DE, ^GSPC, SECTOR_PEERS, watchlist
+        return TickerLookup(query, ticker)
+    return TickerLookup(query, None, index.search(query, limit=6))
+
+
 def _coerce_dt(x: Any) -> Optional[pd.Timestamp]:
     try:
         if x is None or (isinstance(x, float) and math.isnan(x)):
@@ -1522,7 +4265,7 @@ def _payload_to_records(payload: Any) -> Optional[List[Dict[str, Any]]]:
     return None
 
 
-@st.cache_data(show_spinner=False, ttl=43200)
+@cached(ttl=43200, shared=True)
 def _fetch_insider_from_alpha_vantage(ticker: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
     """
     Free-ish alternative: Alpha Vantage Insider Transactions.
@@ -1562,7 +4305,7 @@ def _fetch_insider_from_alpha_vantage(ticker: str) -> Tuple[pd.DataFrame, Dict[s
     return df, meta
 
 
-@st.cache_data(show_spinner=False, ttl=43200)
+@cached(ttl=43200, shared=True)
 def _fetch_insider_from_finnhub(ticker: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
     """
     Alternative: Finnhub insider transactions.
@@ -1601,7 +4344,7 @@ def _fetch_insider_from_finnhub(ticker: str) -> Tuple[pd.DataFrame, Dict[str, An
 
 
 
-@st.cache_data(show_spinner=False, ttl=43200)
+@cached(ttl=43200, shared=True)
 def _fetch_insider_from_api_ninjas(ticker: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
     """
     Alternative: API Ninjas insider transactions.
@@ -1680,7 +4423,7 @@ def _sec_pick_xml_from_index(index_payload: Any) -> Optional[str]:
     return sorted(xmls, key=score)[0]
 
 
-@st.cache_data(show_spinner=False, ttl=43200)
+@cached(ttl=43200, shared=True)
 def _fetch_insider_from_sec(ticker: str, max_filings: int = 12, max_transactions: int = 250) -> Tuple[pd.DataFrame, Dict[str, Any]]:
     """
     Free fallback: SEC EDGAR Form 4 parsing via:
@@ -1854,6 +4597,7 @@ def _fetch_insider_from_sec(ticker: str, max_filings: int = 12, max_transactions
     return df, meta
 
 
+@cached(ttl=43200, shared=True, cache_if=lambda v: not v[1].get("partial"))
 def fetch_insider_transactions_multi(ticker: str) -> Tuple[Optional[pd.DataFrame], Dict[str, Any]]:
     """
     Multi-source insider fetch with rich debug.
@@ -1934,12 +4678,15 @@ def fetch_insider_transactions_multi(ticker: str) -> Tuple[Optional[pd.DataFrame
         dfs.append(df_nj)
         sources_used.append("API Ninjas")
 
-    # 4) Alpha Vantage
-    df_av, av_meta = _fetch_insider_from_alpha_vantage(ticker)
-    add_attempt(av_meta)
-    if df_av is not None and not df_av.empty:
-        dfs.append(df_av)
-        sources_used.append("Alpha Vantage")
+    # 4) Alpha Vantage (free tier 25 req/den – warming ho nečerpá; neúplný výsledek se necachuje)
+    if _WARMING.get():
+        meta["partial"] = "Alpha Vantage přeskočen (warming)"
+    else:
+        df_av, av_meta = _fetch_insider_from_alpha_vantage(ticker)
+        add_attempt(av_meta)
+        if df_av is not None and not df_av.empty:
+            dfs.append(df_av)
+            sources_used.append("Alpha Vantage")
 
     # 5) Finnhub
     df_fh, fh_meta = _fetch_insider_from_finnhub(ticker)
@@ -1973,7 +4720,7 @@ def fetch_insider_transactions_multi(ticker: str) -> Tuple[Optional[pd.DataFrame
         pass
 
     # Robust dedupe across providers (also aggregates Source so you keep provenance)
-    merged = _dedupe_insider_df(merged)
+    merged = compact_insider_frame(_dedupe_insider_df(merged))
 
 
     if len(sources_used) == 1:
@@ -2010,7 +4757,7 @@ class Metric:
     source: str = "yfinance"
 
 
-def extract_metrics(info: Dict[str, Any], ticker: str) -> Dict[str, Metric]:
+def extract_metrics(info: Dict[str, Any], ticker: str, bundle: Optional[TickerBundle] = None) -> Dict[str, Metric]:
     """Extract comprehensive metrics from Yahoo Finance info."""
     
     # Price metrics
@@ -2060,7 +4807,7 @@ def extract_metrics(info: Dict[str, Any], ticker: str) -> Dict[str, Metric]:
     # Cash flow
     operating_cashflow = safe_float(info.get("operatingCashflow"))
     market_cap = safe_float(info.get('marketCap'))
-    fcf, _fcf_dbg = get_fcf_ttm_yfinance(ticker, market_cap)
+    fcf, _fcf_dbg = get_fcf_ttm_yfinance(ticker, market_cap, _bundle=bundle, epoch=earnings_epoch(ticker))
     fcf_yield = safe_div(fcf, market_cap) if fcf and market_cap else None
     
     # Analyst targets
@@ -2125,8 +4872,8 @@ def _first_present(d: Dict[str, Any], keys: List[str]) -> Optional[float]:
                 return v
     return None
 
-@st.cache_data(show_spinner=False, ttl=86400)
-def _fetch_fmp_ratios_ttm(ticker: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+@cached(ttl=FUNDAMENTALS_MAX_TTL, cache_if=lambda v: v[0] is not None)
+def _fetch_fmp_ratios_ttm(ticker: str, epoch: str = "") -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
     """FMP stable Ratios TTM.
 
     Docs (stable): /stable/ratios-ttm?symbol=...
@@ -2160,8 +4907,8 @@ def _fetch_fmp_ratios_ttm(ticker: str) -> Tuple[Optional[Dict[str, Any]], Dict[s
 
     return None, meta
 
-@st.cache_data(show_spinner=False, ttl=86400)
-def _fetch_fmp_key_metrics_ttm(ticker: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+@cached(ttl=FUNDAMENTALS_MAX_TTL, cache_if=lambda v: v[0] is not None)
+def _fetch_fmp_key_metrics_ttm(ticker: str, epoch: str = "") -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
     """FMP stable Key Metrics TTM.
 
     Docs (stable): /stable/key-metrics-ttm?symbol=...
@@ -2193,8 +4940,8 @@ def _fetch_fmp_key_metrics_ttm(ticker: str) -> Tuple[Optional[Dict[str, Any]], D
 
     return None, meta
 
-@st.cache_data(show_spinner=False, ttl=21600)  # 6 hodin – rate limity AV
-def _fetch_alpha_overview(ticker: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+@cached(ttl=FUNDAMENTALS_MAX_TTL, cache_if=lambda v: v[0] is not None)  # do dalších earnings (epoch) – rate limity AV
+def _fetch_alpha_overview(ticker: str, epoch: str = "") -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
     meta = {"provider": "AlphaVantage", "endpoint": "query?function=OVERVIEW", "status": None, "error": None, "url": None}
     if not ALPHAVANTAGE_API_KEY:
         meta["error"] = "ALPHAVANTAGE_API_KEY není nastaven."
@@ -2212,8 +4959,8 @@ def _fetch_alpha_overview(ticker: str) -> Tuple[Optional[Dict[str, Any]], Dict[s
         return None, meta
     return payload, meta
 
-@st.cache_data(show_spinner=False, ttl=21600)  # 6 hodin – rate limity Finnhub
-def _fetch_finnhub_metric(ticker: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+@cached(ttl=FUNDAMENTALS_MAX_TTL, cache_if=lambda v: v[0] is not None)  # do dalších earnings (epoch) – rate limity Finnhub
+def _fetch_finnhub_metric(ticker: str, epoch: str = "") -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
     meta = {"provider": "Finnhub", "endpoint": "api/v1/stock/metric?metric=all", "status": None, "error": None, "url": None}
     if not FINNHUB_API_KEY:
         meta["error"] = "FINNHUB_API_KEY není nastaven."
@@ -2275,12 +5022,16 @@ def enrich_metrics_multisource(ticker: str, metrics: Dict[str, Metric], info: Di
         debug["steps"].append("yfinance ok (no enrichment needed)")
         return metrics, debug
 
+    # Fundamenty providerů se mění jen s reportem -> cache klíč = earnings epoch
+    epoch = earnings_epoch(ticker)
+    debug["earnings_epoch"] = epoch
+
     # --- Step 2: FMP TTM ---
     fmp_ratios, fmp_ratios_meta = (None, {})
     fmp_km, fmp_km_meta = (None, {})
     if FMP_API_KEY:
-        fmp_ratios, fmp_ratios_meta = _fetch_fmp_ratios_ttm(ticker)
-        fmp_km, fmp_km_meta = _fetch_fmp_key_metrics_ttm(ticker)
+        fmp_ratios, fmp_ratios_meta = _fetch_fmp_ratios_ttm(ticker, epoch)
+        fmp_km, fmp_km_meta = _fetch_fmp_key_metrics_ttm(ticker, epoch)
         debug["steps"].append({"FMP_ratios_ttm": fmp_ratios_meta})
         debug["steps"].append({"FMP_key_metrics_ttm": fmp_km_meta})
 
@@ -2320,7 +5071,7 @@ def enrich_metrics_multisource(ticker: str, metrics: Dict[str, Metric], info: Di
 
     # --- Step 3: Alpha Vantage OVERVIEW ---
     if any(_is_missing(k) for k in wanted) and ALPHAVANTAGE_API_KEY:
-        av, av_meta = _fetch_alpha_overview(ticker)
+        av, av_meta = _fetch_alpha_overview(ticker, epoch)
         debug["steps"].append({"AlphaVantage_overview": av_meta})
         if isinstance(av, dict) and av:
             if _is_missing("pe"):
@@ -2371,7 +5122,7 @@ def enrich_metrics_multisource(ticker: str, metrics: Dict[str, Metric], info: Di
 
     # --- Step 4: Finnhub metric ---
     if any(_is_missing(k) for k in wanted) and FINNHUB_API_KEY:
-        fh, fh_meta = _fetch_finnhub_metric(ticker)
+        fh, fh_meta = _fetch_finnhub_metric(ticker, epoch)
         debug["steps"].append({"Finnhub_metric": fh_meta})
         if isinstance(fh, dict) and fh:
             if _is_missing("pe"):
@@ -2795,11 +5546,17 @@ def get_auto_peers(ticker: str, sector: str, info: Dict[str, Any]) -> List[str]:
     return []
 
 
-@st.cache_data(show_spinner=False, ttl=3600)
-def fetch_peer_comparison(ticker: str, peers: List[str]) -> pd.DataFrame:
+def _peer_frame_complete(df: pd.DataFrame) -> bool:
+    """Cachovat jen srovnání, které obsahuje řádek hlavního tickeru (jinak chyba providera)."""
+    return not df.empty and df.attrs.get("ticker") in set(df["Ticker"])
+
+
+@cached(ttl=MARKET_MAX_TTL, cache_if=_peer_frame_complete, shared=True)
+def fetch_peer_comparison(ticker: str, peers: List[str], epoch: str = "") -> pd.DataFrame:
     """
     Fetch comparison metrics for ticker and its peers.
     Používá paralelní fetching pro rychlost (ThreadPoolExecutor).
+    `epoch` = `market_epoch` tickeru a peerů (obnova jen při obchodování).
     """
     from concurrent.futures import ThreadPoolExecutor, as_completed
 
@@ -2807,11 +5564,11 @@ def fetch_peer_comparison(ticker: str, peers: List[str]) -> pd.DataFrame:
 
     def _fetch_one(t: str) -> Optional[Dict]:
         try:
-            info = fetch_ticker_info(t)
+            info = fetch_ticker_info(t, market_epoch(t))
             if not info:
                 return None
             mc = safe_float(info.get('marketCap'))
-            fcf_ttm_peer, _ = get_fcf_ttm_yfinance(t, mc)
+            fcf_ttm_peer, _ = get_fcf_ttm_yfinance(t, mc, epoch=earnings_epoch(t))
             fcf_yield_peer = safe_div(fcf_ttm_peer, mc) if fcf_ttm_peer and mc else None
             return {
                 "Ticker": t,
@@ -2841,16 +5598,47 @@ def fetch_peer_comparison(ticker: str, peers: List[str]) -> pd.DataFrame:
     df = pd.DataFrame(rows)
     main = df[df["Ticker"] == ticker]
     rest = df[df["Ticker"] != ticker].sort_values("Market Cap", ascending=False)
-    return pd.concat([main, rest], ignore_index=True)
+    out = pd.concat([main, rest], ignore_index=True)
+    out.attrs["ticker"] = ticker
+    return out
+
+
+def fetch_peer_tab(ticker: str, peers: List[str], epoch: str = "") -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Data tabu konkurence jako jeden job pod deadlinem: (peer comparison, TTM tabulka tickeru a peerů)."""
+    peer_df = fetch_peer_comparison(ticker, peers, epoch)
+    tickers = [ticker] + list(peers)
+    ttm = batch_statement_ttm(tuple(tickers), epoch="|".join(earnings_epoch(t) for t in tickers))
+    return peer_df, ttm
 
 
 # ============================================================================
 # AI ANALYST (GEMINI)
 # ============================================================================
 
+def _gemini_generate(prompt: str) -> str:
+    """Jediný vstup do Gemini (nové google-genai SDK, fallback na google.generativeai).
+
+    Offline / record režim viz `_snapshot_call` (klíč = model + prompt).
+    """
+    def live() -> str:
+        try:
+            from google import genai as genai_new
+            client = genai_new.Client(api_key=GEMINI_API_KEY)
+            resp = client.models.generate_content(model=GEMINI_MODEL, contents=prompt)
+        except ImportError:
+            import google.generativeai as genai_legacy
+            genai_legacy.configure(api_key=GEMINI_API_KEY)
+            model = genai_legacy.GenerativeModel(GEMINI_MODEL)
+            resp = model.generate_content(prompt)
+        return getattr(resp, "text", None) or str(resp)
+
+    return _snapshot_call("gemini", ("generate", GEMINI_MODEL, prompt), live)
+
+
 def generate_ai_analyst_report_with_retry(ticker: str, company: str, info: Dict, metrics: Dict, 
                              dcf_fair_value: float, current_price: float, 
-                             scorecard: float, macro_events: List[Dict], insider_signal: Any = None) -> Dict:
+                             scorecard: float, macro_events: List[Dict], insider_signal: Any = None,
+                             bundle: Optional[TickerBundle] = None) -> Dict:
     """
     Wrapper s retry logikou pro Free Tier Gemini 2.5 Flash Lite.
     Zkusí max MAX_AI_RETRIES pokusů s RETRY_DELAY sekundami mezi pokusy.
@@ -2859,7 +5647,7 @@ def generate_ai_analyst_report_with_retry(ticker: str, company: str, info: Dict,
         try:
             result = generate_ai_analyst_report(ticker, company, info, metrics, 
                                               dcf_fair_value, current_price, 
-                                              scorecard, macro_events, insider_signal)
+                                              scorecard, macro_events, insider_signal, bundle)
             
             # Check if result indicates an error that should trigger retry
             if "Chyba AI analýzy" in result.get("market_situation", ""):
@@ -2918,7 +5706,8 @@ def generate_ai_analyst_report_with_retry(ticker: str, company: str, info: Dict,
 
 def generate_ai_analyst_report(ticker: str, company: str, info: Dict, metrics: Dict, 
                                dcf_fair_value: float, current_price: float, 
-                               scorecard: float, macro_events: List[Dict], insider_signal: Any = None) -> Dict:
+                               scorecard: float, macro_events: List[Dict], insider_signal: Any = None,
+                               bundle: Optional[TickerBundle] = None) -> Dict:
     """
     Generuje hloubkovou asymetrickou analýzu pomocí Gemini.
     """
@@ -2930,7 +5719,8 @@ def generate_ai_analyst_report(ticker: str, company: str, info: Dict, metrics: D
 
     # 2. PŘÍPRAVA DAT
     roic_val = calculate_roic(info) 
-    regime = detect_market_regime(fetch_price_history(ticker, "6mo"))
+    hist_6mo = bundle.history("6mo") if bundle is not None else fetch_price_history(ticker, "6mo", market_epoch(ticker))
+    regime = detect_market_regime(hist_6mo)
     debt_ebitda = safe_div(info.get("totalDebt"), info.get("ebitda"))
     fcf_yield_val = metrics.get("fcf_yield").value if metrics.get("fcf_yield") else 0
 
@@ -2980,19 +5770,7 @@ VÝSTUP POUZE JSON:
 
     # 5. VOLÁNÍ API
     try:
-        raw_text = ""
-        try:
-            from google import genai as genai_new
-            client = genai_new.Client(api_key=GEMINI_API_KEY)
-            resp = client.models.generate_content(model=GEMINI_MODEL, contents=context)
-            raw_text = getattr(resp, "text", None) or str(resp)
-        except Exception:
-            import google.generativeai as genai_legacy
-            genai_legacy.configure(api_key=GEMINI_API_KEY)
-            model = genai_legacy.GenerativeModel(GEMINI_MODEL)
-            resp = model.generate_content(context)
-            raw_text = getattr(resp, "text", None) or str(resp)
-
+        raw_text = _gemini_generate(context)
         return _extract_json(raw_text)
 
     except Exception as e:
@@ -3002,25 +5780,46 @@ VÝSTUP POUZE JSON:
             "verdict": "HOLD", "wait_for_price": current_price
         }
 
-def get_earnings_calendar_estimate(ticker: str, info: Dict[str, Any]) -> Optional[dt.date]:
+def _parse_earnings_date(calendar: Any) -> Optional[dt.date]:
+    """Vytáhne "Earnings Date" z yfinance kalendáře (novější verze vrací dict, starší DataFrame)."""
+    if calendar is None:
+        return None
+    if isinstance(calendar, dict):
+        val = calendar.get("Earnings Date")
+        if isinstance(val, (list, tuple)):
+            val = val[0] if val else None
+    elif isinstance(calendar, pd.DataFrame):
+        if calendar.empty or "Earnings Date" not in calendar.index:
+            return None
+        val = calendar.loc["Earnings Date"].iloc[0]
+    else:
+        return None
+    if val is None or pd.isna(val):
+        return None
+    return pd.to_datetime(val).date()
+
+
+def get_earnings_calendar_estimate(ticker: str, info: Dict[str, Any], bundle: Optional[TickerBundle] = None) -> Optional[dt.date]:
     """
     Estimate next earnings date based on historical pattern.
     Most companies report quarterly, roughly same time each quarter.
+    S `bundle` se použije už stažený kalendář (žádný další request).
     """
     try:
-        t = yf.Ticker(ticker)
-        calendar = getattr(t, "calendar", None)
-        if calendar is not None and not calendar.empty:
-            # Look for "Earnings Date" row
-            if "Earnings Date" in calendar.index:
-                next_earnings = calendar.loc["Earnings Date"].iloc[0]
-                if pd.notna(next_earnings):
-                    return pd.to_datetime(next_earnings).date()
+        calendar = bundle.calendar if bundle is not None else _yf_call(
+            "calendar", ticker, lambda: getattr(yf.Ticker(ticker), "calendar", None)
+        )
+        next_earnings = _parse_earnings_date(calendar)
+        if next_earnings is not None:
+            _record_earnings_date(ticker, next_earnings)
+            return next_earnings
     except Exception:
         pass
-    
-    # Fallback: Estimate based on common patterns (most tech companies: late Jan, late Apr, late Jul, late Oct)
-    today = dt.date.today()
+    return _heuristic_next_earnings(dt.date.today())
+
+
+def _heuristic_next_earnings(today: dt.date) -> dt.date:
+    """Fallback: Estimate based on common patterns (most tech companies: late Jan, late Apr, late Jul, late Oct)"""
     # Simple heuristic: next month-end
     if today.month < 4:
         return dt.date(today.year, 4, 25)
@@ -3032,6 +5831,79 @@ def get_earnings_calendar_estimate(ticker: str, info: Dict[str, Any]) -> Optiona
         return dt.date(today.year + 1, 1, 25)
 
 
+# --- Earnings-aware invalidace cache -----------------------------------------
+# Fundamenty (FMP ratios/key-metrics TTM, AV overview, Finnhub metric, FCF TTM) se
+# mění jen s reportem. Místo pevného TTL dostanou cachované funkce argument `epoch`:
+#   - před earnings:           "last:<poslední earnings>"  -> stejný klíč až do reportu
+#   - EARNINGS_HOT_DAYS po nich: "hot:<earnings>:<hodina>" -> obnova každou hodinu
+#   - pak:                     "last:<earnings>"           -> zase klid do dalšího reportu
+# Data earnings se ukládají do EARNINGS_DATES_PATH ({"next": ..., "last": ...}).
+
+_EARNINGS_DATES_LOCK = _process_state("earnings_dates_lock", threading.Lock)
+
+
+def _earnings_dates() -> Dict[str, Dict[str, Any]]:
+    return _shared_json_index("earnings_dates", EARNINGS_DATES_PATH)
+
+
+def _known_earnings_dates(ticker: str) -> Dict[str, Any]:
+    with _EARNINGS_DATES_LOCK:
+        return dict(_earnings_dates().get(str(ticker).upper().strip()) or {})
+
+
+def _record_earnings_date(ticker: str, date: Optional[dt.date]) -> None:
+    """Uloží datum příštích earnings z kalendáře; proběhlé "next" se posune do "last"."""
+    if date is None:
+        return
+    try:
+        key = str(ticker).upper().strip()
+        iso = date.isoformat()
+
+        def update(dates: Dict[str, Any]) -> bool:
+            entry = dict(dates.get(key) or {})
+            if entry.get("next") == iso:
+                return False
+            prev_next = entry.get("next")
+            if prev_next and prev_next < iso and prev_next <= dt.date.today().isoformat():
+                entry["last"] = prev_next
+            entry["next"] = iso
+            dates[key] = entry
+            return True
+
+        with _EARNINGS_DATES_LOCK:
+            if (_earnings_dates().get(key) or {}).get("next") == iso:
+                return  # častý případ: beze změny, bez zámku souboru
+            _update_json_index("earnings_dates", EARNINGS_DATES_PATH, update)
+    except Exception:
+        pass
+
+
+def earnings_epoch(ticker: str, now: Optional[dt.datetime] = None) -> str:
+    """Cache token fundamentů tickeru; mění se jen kolem earnings (viz výše). Bez síťového requestu."""
+    now = now or dt.datetime.now()
+    today = now.date()
+    entry = _known_earnings_dates(ticker)
+    try:
+        nxt = dt.date.fromisoformat(entry["next"]) if entry.get("next") else None
+    except ValueError:
+        nxt = None
+    last = entry.get("last") or ""
+
+    if nxt is None:
+        # Kalendář neznáme: hranice = odhadované earnings (25. ledna/dubna/července/října)
+        nxt = max(
+            dt.date(y, m, 25) for y in (today.year - 1, today.year) for m in (1, 4, 7, 10)
+            if dt.date(y, m, 25) <= today
+        )
+        if today >= nxt + dt.timedelta(days=EARNINGS_HOT_DAYS):
+            return f"est:{nxt.isoformat()}"
+    if today < nxt:
+        return f"last:{last}"
+    if today < nxt + dt.timedelta(days=EARNINGS_HOT_DAYS):
+        return f"hot:{nxt.isoformat()}:{now:%Y%m%d%H}"
+    return f"last:{nxt.isoformat()}"
+
+
 # ============================================================================
 # WATCHLIST & MEMOS
 # ============================================================================
@@ -3224,6 +6096,281 @@ def get_advanced_verdict(
     return base, color, warnings
 
 
+# ============================================================================
+# CACHE WARMING (watchlist, SECTOR_PEERS, uvítací tickery)
+# ============================================================================
+# Po startu procesu a pak každých WARM_INTERVAL_S předem stáhne data populárních
+# tickerů se stejnými cache klíči (epoch tokeny), jaké použije analýza, takže
+# první uživatel po deployi / expiraci nečeká na providery.
+
+_WARM_STATUS: Dict[str, Any] = _process_state("warm_status", dict)
+_WARMER_LOCK = _process_state("warmer_lock", threading.Lock)
+
+
+def warm_universe() -> List[str]:
+    """Watchlist + všechny tickery ze SECTOR_PEERS + uvítací ukázky (bez duplicit)."""
+    tickers: List[str] = list(WELCOME_SAMPLE_TICKERS)
+    tickers += list((get_watchlist().get("items") or {}).keys())
+    for sector in SECTOR_PEERS.values():
+        for main_ticker, peers in sector.items():
+            tickers.append(main_ticker)
+            tickers += list(peers)
+    return list(dict.fromkeys(str(t).upper().strip() for t in tickers if str(t).strip()))
+
+
+def _warm_ticker(ticker: str, current: Callable[[], bool] = lambda: True, insider: bool = WARM_INSIDER) -> bool:
+    """Předehřeje jeden ticker (stejné cache klíče jako analýza); vrací False, pokud ho `current()` mezi kroky zrušil."""
+    token = _WARMING.set(True)
+    try:
+        bundle = fetch_ticker_bundle(ticker, market_epoch(ticker))  # info, OHLCV store, výkazy, kalendář
+        if not current():
+            return False
+        fetch_ticker_info(ticker, market_epoch(ticker))  # peer comparison čte info zvlášť
+        if not current():
+            return False
+        market_cap = safe_float(bundle.info.get("marketCap"))
+        get_fcf_ttm_yfinance(ticker, market_cap, _bundle=bundle, epoch=earnings_epoch(ticker))
+        if insider:
+            if not current():
+                return False
+            fetch_insider_transactions_multi(ticker)
+        return True
+    finally:
+        _WARMING.reset(token)
+
+
+def warm_caches(tickers: Optional[List[str]] = None, concurrency: int = WARM_CONCURRENCY) -> Dict[str, Any]:
+    """Jeden běh warmingu; rate limity hlídá `_RATE_LIMITER`, souběh `concurrency`.
+
+    Běh nad celým universe na konci dopíše nové bary do universe matice (memmap).
+    """
+    full_universe = tickers is None
+    tickers = tickers if tickers is not None else warm_universe()
+    status: Dict[str, Any] = {"started_at": time.time(), "tickers": len(tickers), "ok": 0, "failed": {}}
+    _WARM_STATUS.update(status, running=True)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="warm") as executor:
+        futures = {executor.submit(_warm_ticker, t): t for t in tickers}
+        for future, t in futures.items():
+            try:
+                future.result()
+                status["ok"] += 1
+            except Exception as e:
+                status["failed"][t] = str(e)[:200]
+    if full_universe:
+        try:
+            status["universe_rows"] = update_universe_matrix(tickers).get("rows")
+        except Exception as e:
+            status["failed"]["universe_matrix"] = str(e)[:200]
+    status["duration_s"] = round(time.time() - status["started_at"], 1)
+    _WARM_STATUS.clear()
+    _WARM_STATUS.update(status, running=False, finished_at=time.time())
+    return status
+
+
+def _warmer_loop() -> None:
+    while True:
+        try:
+            warm_caches()
+        except Exception:
+            pass
+        time.sleep(WARM_INTERVAL_S)
+
+
+def start_cache_warmer() -> None:
+    """Spustí warming job jednou za proces (daemon vlákno); volá se z main()."""
+    if not WARM_CACHES or OFFLINE_MODE:
+        return
+    with _WARMER_LOCK:
+        thread = _PROCESS_STATE.get("warmer_thread")
+        if thread is None or not thread.is_alive():
+            thread = _PROCESS_STATE["warmer_thread"] = threading.Thread(
+                target=_warmer_loop, name="cache-warmer", daemon=True)
+            thread.start()
+
+
+# --- Spekulativní prefetch (pravděpodobné další tickery) ---
+# Po doběhnutí analýzy se na pozadí předehřejí peerové aktuálního tickeru a první
+# položky watchlistu (info, historie, výkazy, FCF TTM – stejné cache klíče jako analýza).
+# Běží v jednom vlákně s rezervou rate limitu pro interaktivní cally (`_WARMING`).
+# Každý interaktivní request zvýší generaci a prefetch se po dokončení aktuálního
+# kroku zastaví; rozběhnutý HTTP call nepřerušuje – pokud ho interaktivní request
+# potřebuje, připojí se k němu přes single-flight. Další rerun se stejným tickerem
+# a peery frontu jen doplní o tickery, které ještě nedoběhly.
+
+class _Prefetcher:
+    """Fronta tickerů pro jedno nízkoprioritní vlákno; `schedule` frontu nahradí (stejný klíč: jen nedoběhlé tickery), `cancel` zahodí."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._queue: List[str] = []
+        self._active: Optional[str] = None
+        self._key: Any = None  # co je naplánováno (ticker, peerové, watchlist)
+        self._warmed: set = set()  # tickery klíče `_key`, které už doběhly (i neúspěšně)
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"scheduled": 0, "warmed": 0, "cancelled": 0, "failed": 0}
+
+    def schedule(self, key: Any, tickers: List[str]) -> None:
+        with self._cond:
+            if key != self._key:
+                self._key, self._warmed = key, set()
+                self._generation += 1
+            queue = [t for t in tickers if t not in self._warmed and t != self._active]
+            if queue == self._queue:
+                return
+            self._queue = queue
+            self.stats["scheduled"] += len(queue)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self) -> None:
+        with self._cond:
+            self._generation += 1
+            self.stats["cancelled"] += len(self._queue)
+            self._queue = []
+
+    def state(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self.stats, "queued": len(self._queue), "active": self._active}
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                ticker = self._active = self._queue.pop(0)
+                generation = self._generation
+            try:
+                done = _warm_ticker(ticker, lambda: self._generation == generation, insider=False)
+                outcome = "warmed" if done else None
+            except Exception:
+                outcome = "failed"
+            with self._cond:
+                self._active = None
+                if outcome:
+                    self.stats[outcome] += 1
+                if outcome and self._generation == generation:
+                    self._warmed.add(ticker)
+
+
+_PREFETCHER: _Prefetcher = _process_state("prefetcher", _Prefetcher)
+
+
+def prefetch_likely_next(ticker: str, peers: List[str]) -> None:
+    """Naplánuje prefetch peerů `ticker` a prvních PREFETCH_WATCHLIST_TOP tickerů z watchlistu."""
+    if not PREFETCH or OFFLINE_MODE:
+        return
+    watch = list((get_watchlist().get("items") or {}).keys())[:PREFETCH_WATCHLIST_TOP]
+    current = str(ticker).upper().strip()
+    tickers = [t for t in dict.fromkeys(str(t).upper().strip() for t in list(peers) + watch) if t and t != current]
+    if tickers:
+        _PREFETCHER.schedule((current, tuple(tickers)), tickers)
+
+
+def cancel_prefetch() -> None:
+    """Interaktivní request má přednost: zahodí frontu prefetchu (běžící krok doběhne)."""
+    _PREFETCHER.cancel()
+
+
+# ============================================================================
+# ADMIN: CACHE METRIKY (?admin=<ADMIN_TOKEN>)
+# ============================================================================
+
+def _admin_authorized() -> bool:
+    """Query parametr `admin` musí odpovídat ADMIN_TOKEN (porovnání v konstantním čase)."""
+    token = st.query_params.get("admin") or ""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+def _approx_nbytes(value: Any) -> int:
+    """Hrubý odhad paměti hodnoty v SWR cache (DataFrame přes memory_usage, bundle sečte své framy)."""
+    try:
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(index=True, deep=False).sum())
+        if type(value).__name__ == "TickerBundle":
+            frames = [getattr(value, k) for k in ("ohlcv",) + STATEMENT_KINDS]
+            return sum(_approx_nbytes(f) for f in frames) + len(pickle.dumps(value.info))
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def cache_report() -> Dict[str, Any]:
+    """Snapshot všech cache metrik (per funkce) pro admin stránku a JSON export."""
+    backend = get_cache_backend()
+    usage: Dict[str, Dict[str, Dict[str, int]]] = {}
+    if hasattr(backend, "usage_by_tier"):  # backend mohl vzniknout v dřívějším rerunu (jiný objekt třídy)
+        usage = backend.usage_by_tier()
+    else:
+        usage = {backend.name: backend.usage()}
+    usage["shared"] = _SHARED_OBJECTS.usage()
+    for name, cache in _SWR_CACHES.items():
+        entries = cache.values()
+        usage.setdefault("swr", {})[f"swr:{name}"] = {
+            "entries": len(entries),
+            "bytes": sum(_approx_nbytes(v) for v in entries),
+        }
+
+    functions = CACHE_STATS.snapshot()
+    for tier, per_fn in usage.items():
+        for fn, u in per_fn.items():
+            row = functions.setdefault(fn, {})
+            row[f"{tier}_entries"] = u["entries"]
+            row[f"{tier}_bytes"] = u["bytes"]
+    return {
+        "generated_at": dt.datetime.now().isoformat(timespec="seconds"),
+        "uptime_s": round(time.time() - CACHE_STATS.started_at, 1),
+        "backend": CACHE_BACKEND,
+        "limits": {
+            "memory_max_entries": CACHE_MEMORY_MAX_ENTRIES,
+            "memory_max_bytes": CACHE_MEMORY_MAX_BYTES,
+            "disk_max_bytes": CACHE_DISK_MAX_BYTES,
+        },
+        "single_flight": {"calls": _SINGLE_FLIGHT.calls, "coalesced": _SINGLE_FLIGHT.coalesced},
+        "rate_limits": _RATE_LIMITER.state(),
+        "warming": dict(_WARM_STATUS),
+        "prefetch": _PREFETCHER.state(),
+        "functions": functions,
+    }
+
+
+def render_cache_admin() -> None:
+    """Skrytá admin stránka: tabulka metrik per funkce + export JSON."""
+    st.title("🛠️ Cache metriky")
+    report = cache_report()
+    st.caption(
+        f"Backend: **{report['backend']}** | uptime {report['uptime_s'] / 3600:.1f} h | "
+        f"single-flight: {report['single_flight']['calls']} callů, {report['single_flight']['coalesced']} sloučeno | "
+        f"prefetch: {report['prefetch']['warmed']} předehřáto, {report['prefetch']['cancelled']} zrušeno"
+    )
+    rows = [{"Funkce": fn, **{k: v for k, v in d.items() if k != "tier_hits"},
+             "tier_hits": ", ".join(f"{t}={n}" for t, n in (d.get("tier_hits") or {}).items())}
+            for fn, d in sorted(report["functions"].items())]
+    if rows:
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    else:
+        st.info("Zatím žádná data – spusť pár analýz.")
+    st.markdown("#### Rate limity providerů")
+    limits = [{"Host": host, **{k: v for k, v in d.items() if k != "last_throttled_at"},
+               "poslední 429": dt.datetime.fromtimestamp(d["last_throttled_at"]).strftime("%H:%M:%S") if d["last_throttled_at"] else "—"}
+              for host, d in report["rate_limits"].items()]
+    st.dataframe(pd.DataFrame(limits), use_container_width=True, hide_index=True)
+    c1, c2 = st.columns(2)
+    with c1:
+        st.download_button(
+            "⬇️ Export JSON",
+            data=json.dumps(report, ensure_ascii=False, indent=2, default=str),
+            file_name=f"cache_metrics_{dt.datetime.now():%Y%m%d_%H%M}.json",
+            mime="application/json",
+        )
+    with c2:
+        if st.button("Vynulovat počítadla"):
+            CACHE_STATS.reset()
+            st.rerun()
+
+
 # End of Part 1
 # ============================================================================
 # MAIN APPLICATION
@@ -3259,22 +6406,7 @@ TEXT:
 """
 
     try:
-        # Try new google-genai SDK first
-        try:
-            from google import genai
-            client = genai.Client(api_key=GEMINI_API_KEY)
-            response = client.models.generate_content(
-                model=GEMINI_MODEL,
-                contents=prompt
-            )
-            return (response.text or "").strip()
-        except ImportError:
-            # Fallback to old SDK
-            import google.generativeai as genai
-            genai.configure(api_key=GEMINI_API_KEY)
-            model = genai.GenerativeModel(GEMINI_MODEL)
-            response = model.generate_content(prompt)
-            return (getattr(response, "text", "") or "").strip()
+        return _gemini_generate(prompt).strip()
     except Exception as e:
         return f"Chyba při volání Gemini: {e}"
 
@@ -3408,8 +6540,484 @@ def estimate_smart_params(info: Dict[str, Any], metrics: Dict[str, "Metric"]) ->
     }
 
 
+# ============================================================================
+# ANALÝZA (bez UI)
+# ============================================================================
+# Celý výpočet jedné analýzy bez Streamlit volání: main() z něj kreslí taby,
+# benchmark (`--benchmark`) ho pouští headless a měří časy jednotlivých fází.
+
+# --- Deadline (rozpočet latence jedné analýzy) ------------------------------
+# Pomalé externí providery (insider z FMP/AV/Finnhub/Ninjas/SEC, multi-source
+# metriky, peer comparison) běží ve vlastním executoru. Analýza na ně čeká jen
+# do ANALYSIS_DEADLINE_S od startu; co nestihne, se vykreslí bez nich (označené
+# ⏳) a běží dál na pozadí. Fragment `_rerun_when_loaded` pak appku přerenderuje,
+# jakmile výsledky doběhnou – rerun si je vyzvedne z `_DEADLINE_PENDING`
+# (dokončený Future) nebo z cache dané funkce. Klíče nesou epoch; dokončené
+# Future, které si nikdo nevyzvedl, se po DEADLINE_RESULT_TTL_S zahodí.
+
+ANALYSIS_DEADLINE_S = 4.0
+ANALYSIS_POLL_S = 1.0  # jak často UI kontroluje, jestli opožděné providery doběhly
+ANALYSIS_MIN_WAIT_S = 0.1  # i po vyčerpání rozpočtu počkat chvilku (výsledek z cache je hned)
+DEADLINE_RESULT_TTL_S = 300  # jak dlouho čeká nevyzvednutý výsledek na rerun
+INSIDER_EPOCH_S = 43200  # insider data nemají earnings/market epoch -> časové okno (= TTL cache)
+PENDING_LABELS = {
+    "insider": "insider transakce",
+    "enrichment": "metriky z FMP / Alpha Vantage / Finnhub",
+    "peers": "srovnání s konkurencí",
+}
+
+_DEADLINE_EXECUTOR = _process_state("deadline_executor", lambda: ThreadPoolExecutor(max_workers=8, thread_name_prefix="deadline"))
+_DEADLINE_PENDING: Dict[Any, Tuple[Future, float]] = _process_state("deadline_futures", dict)  # key -> (Future, kdy spuštěn)
+_DEADLINE_LOCK = _process_state("deadline_lock", threading.Lock)
+
+
+def _deadline_submit(key: Any, fn: Callable[[], Any]) -> Future:
+    """Spustí `fn` na pozadí, pokud pro `key` už neběží (rerun se připojí k běžícímu)."""
+    with _DEADLINE_LOCK:
+        now = time.monotonic()
+        for k in [k for k, (f, t) in _DEADLINE_PENDING.items() if f.done() and now - t > DEADLINE_RESULT_TTL_S]:
+            del _DEADLINE_PENDING[k]
+        fut = _DEADLINE_PENDING.get(key, (None, 0.0))[0]
+        if fut is None:
+            fut = _DEADLINE_EXECUTOR.submit(fn)
+            _DEADLINE_PENDING[key] = (fut, now)
+        return fut
+
+
+def _deadline_result(key: Any, fn: Callable[[], Any], deadline: Optional[float]) -> Tuple[bool, Any]:
+    """(hotovo, výsledek): čeká nejdéle do `deadline` (time.monotonic; None = bez limitu)."""
+    fut = _deadline_submit(key, fn)
+    try:
+        value = fut.result(timeout=None if deadline is None else max(ANALYSIS_MIN_WAIT_S, deadline - time.monotonic()))
+    except FuturesTimeout:
+        return False, None
+    finally:
+        if fut.done():
+            with _DEADLINE_LOCK:
+                if _DEADLINE_PENDING.get(key, (None, 0.0))[0] is fut:
+                    del _DEADLINE_PENDING[key]
+    return True, value
+
+
+def _deadline_done(key: Any) -> bool:
+    with _DEADLINE_LOCK:
+        fut = _DEADLINE_PENDING.get(key, (None, 0.0))[0]
+    return fut is None or fut.done()
+
+
+def _rerun_when_loaded(keys: List[Any]) -> None:
+    """Fragment, který každých ANALYSIS_POLL_S zkontroluje opožděné providery a po doběhnutí přerenderuje appku."""
+    @st.fragment(run_every=ANALYSIS_POLL_S)
+    def _poll() -> None:
+        if all(_deadline_done(k) for k in keys):
+            st.rerun(scope="app")
+
+    _poll()
+
+
+class _StageTimer:
+    """`lap(name)` zapíše do `timings[name]` čas od předchozího lapu (v sekundách)."""
+
+    def __init__(self, timings: Optional[Dict[str, float]]):
+        self.timings = timings if timings is not None else {}
+        self._t = time.perf_counter()
+
+    def __call__(self, name: str) -> None:
+        now = time.perf_counter()
+        self.timings[name] = self.timings.get(name, 0.0) + (now - self._t)
+        self._t = now
+
+
+def run_analysis(
+    ticker: str,
+    smart_dcf: bool = True,
+    dcf_growth: float = 0.10,
+    dcf_terminal: float = 0.03,
+    dcf_wacc: float = 0.10,
+    dcf_years: int = 5,
+    dcf_exit_multiple: float = 25.0,
+    timings: Optional[Dict[str, float]] = None,
+    deadline_s: Optional[float] = ANALYSIS_DEADLINE_S,
+) -> Optional[Dict[str, Any]]:
+    """Data + všechny výpočty analýzy tickeru; vrací slovník mezivýsledků (None = bez dat).
+
+    `timings` (pokud je předán) se naplní časy fází: bundle, metrics, insider, fcf,
+    valuation, analytics, earnings.
+    `deadline_s` = rozpočet na externí providery (None = čekat na vše, např. benchmark);
+    co ho nestihne, je v `pending` (klíče PENDING_LABELS) a `pending_keys` (pro rerun).
+    """
+    lap = _StageTimer(timings)
+    deadline = None if deadline_s is None else time.monotonic() + deadline_s
+    pending: List[str] = []
+    pending_keys: List[Any] = []
+    # Insider nezávisí na yfinance -> startuje hned, souběžně s bundlem
+    insider_key = ("insider", ticker, int(time.time() // INSIDER_EPOCH_S))
+    _deadline_submit(insider_key, lambda: fetch_insider_transactions_multi(ticker))
+
+    # Jeden bundle (jeden yf.Ticker, paralelní stahování) pro celou analýzu
+    bundle = fetch_ticker_bundle(ticker, market_epoch(ticker))
+    info = bundle.info
+    lap("bundle")
+
+    if not info:
+        return None
+
+    company = info.get("longName") or info.get("shortName") or ticker
+    metrics = extract_metrics(info, ticker, bundle=bundle)
+    # Multi-source enrichment for core fundamentals (fills missing values + tracks sources)
+    # Enrichment mění Metric in-place -> na pozadí pracuje s kopiemi
+    base_metrics = {k: copy.copy(m) for k, m in metrics.items()}
+    enrich_key = ("enrichment", ticker, market_epoch(ticker))
+    done, enriched = _deadline_result(enrich_key, lambda: enrich_metrics_multisource(ticker, base_metrics, info), deadline)
+    if done:
+        metrics, metrics_enrich_dbg = enriched
+    else:
+        metrics_enrich_dbg = {"ticker": ticker, "pending": True}
+        pending.append("enrichment")
+        pending_keys.append(enrich_key)
+    lap("metrics")
+
+    price_history = bundle.history("1y")
+    income, balance, cashflow = (bundle.canonical(k) for k in ("financials", "balance_sheet", "cashflow"))
+    
+    # Advanced data
+    ath = get_all_time_high(ticker, _bundle=bundle)
+    done, insider_res = _deadline_result(insider_key, lambda: fetch_insider_transactions_multi(ticker), deadline)
+    insider_df, insider_meta = insider_res if done else (None, {"pending": True})
+    if not done:
+        pending.append("insider")
+        pending_keys.append(insider_key)
+    insider_signal = compute_insider_pro_signal(insider_df)
+    lap("insider")
+
+    # DCF calculations
+    market_cap_for_fcf = safe_float(info.get('marketCap'))
+    fcf, fcf_dbg = get_fcf_ttm_yfinance(ticker, market_cap_for_fcf, _bundle=bundle, epoch=earnings_epoch(ticker))
+    lap("fcf")
+    # FCF debug suppressed in UI
+    shares = safe_float(info.get("sharesOutstanding"))
+    current_price = metrics.get("price").value if metrics.get("price") else None
+
+    # Decide DCF inputs (Smart vs Manual)
+    used_dcf_growth = float(dcf_growth)
+    used_dcf_wacc = float(dcf_wacc)
+    used_exit_multiple = float(dcf_exit_multiple)
+    used_mode_label = "Manual"
+
+    if smart_dcf:
+        smart = estimate_smart_params(info, metrics)
+        used_dcf_growth = float(smart["growth"])
+        used_dcf_wacc = float(smart["wacc"])
+        used_exit_multiple = float(smart["exit_multiple"])
+        used_mode_label = "Smart"
+
+    
+    # --- Amazon-style reinvestment heavy adjustment (Adjusted FCF) ---
+    # If FCF is unusually low relative to Operating Cash Flow, treat it as heavy reinvestment and
+    # use an adjusted cash-flow proxy for DCF (maintenance earnings proxy).
+    dcf_fcf_used = fcf
+    reinvestment_adjusted = False
+    try:
+        operating_cashflow = safe_float(info.get("operatingCashflow"))
+    except Exception:
+        operating_cashflow = None
+
+    if operating_cashflow and dcf_fcf_used and dcf_fcf_used > 0 and operating_cashflow > 0:
+        if dcf_fcf_used < (0.3 * operating_cashflow):
+            dcf_fcf_used = operating_cashflow * 0.6
+            reinvestment_adjusted = True
+    fair_value_dcf = None
+    mos_dcf = None
+    implied_growth = None
+    
+    if dcf_fcf_used and shares and dcf_fcf_used > 0:
+        # --- NOVÝ VÝPOČET DCF (Exit Multiple Metoda) ---
+        # 1. Spočítáme budoucí FCF pro každý rok
+        future_fcf = []
+        current_fcf = dcf_fcf_used
+        
+        # Diskontní faktor
+        discount_factors = [(1 + used_dcf_wacc) ** i for i in range(1, dcf_years + 1)]
+        
+        for i in range(dcf_years):
+            current_fcf = current_fcf * (1 + used_dcf_growth)
+            future_fcf.append(current_fcf)
+        
+        # 2. Terminal Value (Hodnota na konci 5. roku)
+        # Použijeme Exit Multiple (pro Big Tech standardně 25x, ne konzervativní Gordon)
+        exit_multiple = float(used_exit_multiple)
+        terminal_value = future_fcf[-1] * exit_multiple
+        
+        # 3. Diskontování na dnešní hodnotu (PV)
+        pv_cash_flows = sum([f / d for f, d in zip(future_fcf, discount_factors)])
+        pv_terminal_value = terminal_value / ((1 + used_dcf_wacc) ** dcf_years)
+        
+        enterprise_value = pv_cash_flows + pv_terminal_value
+        
+        # 4. Equity Value (EV + Cash - Debt)
+        total_cash = safe_float(info.get("totalCash")) or 0
+        total_debt = safe_float(info.get("totalDebt")) or 0
+        equity_value = enterprise_value + total_cash - total_debt
+        
+        fair_value_dcf = equity_value / shares
+        
+        # Přepočet MOS a Implied Growth
+        if current_price:
+            mos_dcf = (fair_value_dcf / current_price) - 1.0
+            implied_growth = reverse_dcf_implied_growth(
+                current_price, fcf, dcf_terminal, dcf_wacc, dcf_years, shares
+            )
+    
+    # Analyst fair value
+    analyst_target = metrics.get("target_mean").value if metrics.get("target_mean") else None
+    mos_analyst = None
+    if analyst_target and current_price:
+        mos_analyst = (analyst_target / current_price) - 1.0
+    
+    # Scorecard
+    scorecard, category_scores, individual_scores = build_scorecard_advanced(metrics, info)
+    
+    # Verdict
+    verdict, verdict_color, verdict_warnings = get_advanced_verdict(
+        scorecard, mos_dcf, mos_analyst, insider_signal.get("signal", 0), implied_growth
+    )
+    
+    lap("valuation")
+
+    # Peers
+    sector = info.get("sector", "")
+    auto_peers = get_auto_peers(ticker, sector, info)
+
+    # === NOVÉ ANALYTICKÉ VÝPOČTY v6.0 ===
+    # Technické indikátory
+    price_history_1y = price_history
+    tech_signals = calculate_technical_signals(price_history_1y)
+
+    # Piotroski F-Score
+    piotroski_score, piotroski_breakdown = calculate_piotroski_fscore(info, income, balance, cashflow)
+
+    # Altman Z-Score
+    altman_z, altman_zone = calculate_altman_zscore(info, income=income, balance=balance)
+
+    # Graham Number
+    graham_number = calculate_graham_number(info)
+
+    # Earnings Quality
+    earnings_quality_ratio, earnings_quality_label = calculate_earnings_quality(info)
+
+    # Short Interest
+    short_interest = get_short_interest(info)
+
+    # Monte Carlo DCF
+    mc_dcf = {}
+    if fcf and shares and fcf > 0 and shares > 0:
+        mc_dcf = monte_carlo_dcf(fcf, used_dcf_growth, dcf_terminal, used_dcf_wacc, dcf_years, shares)
+
+    # Value Trap detection (nyní funguje správně)
+    is_value_trap, value_trap_msg = detect_value_trap(info, metrics)
+
+    lap("analytics")
+
+    # Earnings countdown
+    next_earnings = get_earnings_calendar_estimate(ticker, info, bundle=bundle)
+    earnings_countdown = None
+    if next_earnings:
+        earnings_countdown = (next_earnings - dt.date.today()).days
+    lap("earnings")
+
+    return {k: v for k, v in locals().items() if k not in ("lap", "timings", "base_metrics", "enriched", "insider_res")}
+
+
+# --- Benchmark (python stock_analyser.py --benchmark) -------------------------
+# Přehrává nahrané odpovědi providerů (kaseta = snapshot adresář z RECORD módu)
+# s uměle přidanou latencí per host a měří run_analysis + peer comparison pro
+# pevnou sadu tickerů. Každý běh začíná se studenou cache i prázdnými story
+# (dočasný DATA_DIR), takže měří celou cestu přes providery. Výsledek (p50/p95
+# per fáze a celkem) se ukládá jako JSON do BENCHMARK_DIR a porovná s předchozím.
+#
+#   python stock_analyser.py --benchmark --record      # nahraje kasetu (živá síť)
+#   python stock_analyser.py --benchmark --runs 5      # replay + měření
+
+BENCHMARK_TICKERS = ("AAPL", "MSFT", "NVDA", "JPM", "KO")
+BENCHMARK_RUNS = 5
+BENCHMARK_DIR = os.path.join(DATA_DIR, "benchmarks")
+BENCHMARK_CASSETTE_DIR = os.path.join(DATA_DIR, "cassettes", "benchmark")
+BENCHMARK_HOST_LATENCY = {  # medián latence odpovědi v s (změřeno z produkce, řádově)
+    "yfinance": 0.35,
+    "financialmodelingprep.com": 0.25,
+    "www.alphavantage.co": 0.45,
+    "finnhub.io": 0.20,
+    "api.api-ninjas.com": 0.30,
+    "www.sec.gov": 0.30,
+    "data.sec.gov": 0.30,
+    "gemini": 4.0,
+    "*": 0.25,
+}
+
+
+def _reset_benchmark_state(data_dir: str) -> None:
+    """Studený start: prázdné story v `data_dir`, nová paměťová cache, žádné sdílené/SWR objekty."""
+    global PRICE_STORE_DIR, ATH_INDEX_PATH, STATEMENT_STORE_DIR, STATEMENT_INDEX_PATH, EARNINGS_DATES_PATH
+    global INTRADAY_STORE_DIR, UNIVERSE_DIR
+    PRICE_STORE_DIR = os.path.join(data_dir, "prices")
+    ATH_INDEX_PATH = os.path.join(data_dir, "ath_index.json")
+    STATEMENT_STORE_DIR = os.path.join(data_dir, "statements")
+    STATEMENT_INDEX_PATH = os.path.join(data_dir, "statement_index.json")
+    EARNINGS_DATES_PATH = os.path.join(data_dir, "earnings_dates.json")
+    INTRADAY_STORE_DIR = os.path.join(data_dir, "intraday")
+    UNIVERSE_DIR = os.path.join(data_dir, "universe")
+    for name in ("ath_index", "statement_index", "earnings_dates"):
+        _PROCESS_STATE.pop(name, None)
+    set_cache_backend(MemoryLRUCache(CACHE_MEMORY_MAX_ENTRIES, CACHE_MEMORY_MAX_BYTES))
+    _SHARED_OBJECTS.clear()
+    for swr in _SWR_CACHES.values():
+        swr.clear()
+
+
+def _git_revision() -> str:
+    import subprocess
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def run_benchmark(
+    tickers: Tuple[str, ...] = BENCHMARK_TICKERS,
+    runs: int = BENCHMARK_RUNS,
+    cassette_dir: str = BENCHMARK_CASSETTE_DIR,
+    record: bool = False,
+    latency: bool = True,
+) -> Dict[str, Any]:
+    """Změří analýzu `tickers` v `runs` bězích (record = jeden živý běh, který kasetu nahraje)."""
+    import tempfile
+    global OFFLINE_MODE, RECORD_MODE, SNAPSHOT_DIR
+    OFFLINE_MODE, RECORD_MODE, SNAPSHOT_DIR = not record, record, cassette_dir
+    if OFFLINE_MODE:
+        _use_offline_keys()
+    _SNAPSHOT_LATENCY.clear()
+    if latency and OFFLINE_MODE:
+        _SNAPSHOT_LATENCY.update(BENCHMARK_HOST_LATENCY)
+
+    samples: Dict[str, List[float]] = {}
+    failed: List[str] = []
+    for _ in range(1 if record else max(1, runs)):
+        with tempfile.TemporaryDirectory(prefix="spp-bench-") as tmp:
+            _reset_benchmark_state(tmp)
+            for t in tickers:
+                timings: Dict[str, float] = {}
+                t0 = time.perf_counter()
+                analysis = run_analysis(t, timings=timings, deadline_s=None)
+                if analysis is None:
+                    failed.append(t)
+                    continue
+                lap = _StageTimer(timings)
+                peers = list(analysis["auto_peers"])
+                if peers:
+                    fetch_peer_tab(t, peers, market_epoch([t] + peers))
+                lap("peers")
+                timings["total"] = time.perf_counter() - t0
+                for stage, sec in timings.items():
+                    samples.setdefault(stage, []).append(sec)
+
+    stages = {
+        stage: {
+            "p50": float(np.percentile(vals, 50)),
+            "p95": float(np.percentile(vals, 95)),
+            "n": len(vals),
+        }
+        for stage, vals in samples.items()
+    }
+    result = {
+        "app_version": APP_VERSION,
+        "git": _git_revision(),
+        "created_at": dt.datetime.now().isoformat(timespec="seconds"),
+        "mode": "record" if record else "replay",
+        "tickers": list(tickers),
+        "runs": 1 if record else runs,
+        "cassette": cassette_dir,
+        "latency": dict(_SNAPSHOT_LATENCY),
+        "failed": failed,
+        "stages": stages,
+        "samples": samples,
+    }
+    if not record:
+        os.makedirs(BENCHMARK_DIR, exist_ok=True)
+        path = os.path.join(BENCHMARK_DIR, f"bench-{dt.datetime.now():%Y%m%d-%H%M%S}-{result['git']}.json")
+        _save_json_atomic(path, result)
+        result["path"] = path
+    return result
+
+
+def _previous_benchmark(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Poslední uložený replay se stejnými tickery (kromě `result`)."""
+    try:
+        names = sorted(f for f in os.listdir(BENCHMARK_DIR) if f.startswith("bench-") and f.endswith(".json"))
+    except OSError:
+        return None
+    for name in reversed(names):
+        path = os.path.join(BENCHMARK_DIR, name)
+        if path == result.get("path"):
+            continue
+        prev = load_json(path, {})
+        if prev.get("tickers") == result["tickers"]:
+            return prev
+    return None
+
+
+def format_benchmark(result: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> str:
+    lines = [f"{'fáze':<12}{'p50 [s]':>10}{'p95 [s]':>10}" + (f"{'Δp50':>10}{'Δp95':>10}" if previous else "")]
+    for stage, st_ in sorted(result["stages"].items(), key=lambda kv: kv[0] == "total"):
+        row = f"{stage:<12}{st_['p50']:>10.3f}{st_['p95']:>10.3f}"
+        old = (previous or {}).get("stages", {}).get(stage)
+        if old:
+            row += f"{st_['p50'] - old['p50']:>+10.3f}{st_['p95'] - old['p95']:>+10.3f}"
+        lines.append(row)
+    if previous:
+        lines.append(f"(porovnáno s {previous.get('git')} z {previous.get('created_at')})")
+    if result.get("failed"):
+        lines.append(f"bez dat: {', '.join(result['failed'])}")
+    return "\n".join(lines)
+
+
+def _benchmark_cli(argv: List[str]) -> None:
+    import argparse
+    parser = argparse.ArgumentParser(prog="stock_analyser.py --benchmark", description="Latence analýzy nad nahranou kasetou.")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--tickers", default=",".join(BENCHMARK_TICKERS))
+    parser.add_argument("--runs", type=int, default=BENCHMARK_RUNS)
+    parser.add_argument("--cassette", default=BENCHMARK_CASSETTE_DIR)
+    parser.add_argument("--record", action="store_true", help="nahraje kasetu živými cally")
+    parser.add_argument("--no-latency", action="store_true", help="replay bez umělé latence")
+    args, _ = parser.parse_known_args(argv)
+    tickers = tuple(t.strip().upper() for t in args.tickers.split(",") if t.strip())
+    result = run_benchmark(tickers, args.runs, args.cassette, record=args.record, latency=not args.no_latency)
+    if args.record:
+        print(f"Kaseta nahrána do {args.cassette} ({len(tickers)} tickerů, bez dat: {result['failed'] or '—'})")
+        return
+    print(format_benchmark(result, _previous_benchmark(result)))
+    print(f"Uloženo: {result['path']}")
+
+
 # Pouze čeština – překladový systém odstraněn
 
+def _open_analysis(ticker: str) -> None:
+    """Přepne do výsledků pro `ticker` (zavře sidebar na mobilu); volá se i jako on_click callback."""
+    st.session_state.close_sidebar_js = True
+    st.session_state.sidebar_hidden = True
+    st.session_state.ui_mode = "RESULTS"
+    st.session_state.selected_ticker = ticker
+    st.session_state["last_ticker"] = ticker
+    st.session_state.pop("ticker_suggestions", None)
+
+
+def _pick_suggested_ticker(ticker: str) -> None:
+    st.session_state["ticker_input"] = ticker  # callback běží před vykreslením formuláře
+    _open_analysis(ticker)
+
+
 def main():
     # Session state initialization
     if "force_tab_label" not in st.session_state:
@@ -3425,6 +7033,14 @@ def main():
     
     """Main application entry point."""
 
+    start_cache_warmer()
+    ticker_search_index()  # při prvním startu se index tickerů začne stavět na pozadí
+
+    # Skrytá admin stránka s cache metrikami: ?admin=<ADMIN_TOKEN>
+    if _admin_authorized():
+        render_cache_admin()
+        return
+
     # --- UI mode state (picker vs results) ---
     if "ui_mode" not in st.session_state:
         st.session_state.ui_mode = "PICKER"
@@ -3581,10 +7197,10 @@ def main():
                 value=str(default_ticker),
 
         
-                help="Zadej ticker (např. AAPL, MSFT, GOOGL) a potvrď Enterem",
+                help="Zadej ticker (např. AAPL, MSFT, GOOGL) nebo název firmy a potvrď Enterem",
 
         
-                max_chars=10,
+                max_chars=40,
 
         
                 key="ticker_input",
@@ -3603,25 +7219,24 @@ def main():
 
         
         if analyze_btn:
-
-        
-            # Request sidebar close (mobile drawer) and rerun into RESULTS mode.
-
-        
-            st.session_state.close_sidebar_js = True
-
-        
-            st.session_state.sidebar_hidden = True
-            st.session_state.ui_mode = "RESULTS"
-
-        
-            st.session_state.selected_ticker = ticker_input
-
-        
-            st.session_state["last_ticker"] = ticker_input
-
-        
-            st.rerun()
+            # Ověření proti lokálnímu indexu (SEC tickery + názvy) ještě před voláním yfinance
+            lookup = validate_ticker(ticker_input)
+            if lookup.ticker:
+                st.session_state.pop("ticker_suggestions", None)
+                _open_analysis(lookup.ticker)
+                st.rerun()
+            st.session_state["ticker_suggestions"] = (ticker_input, lookup.suggestions)
+            analyze_btn = False
+
+        if st.session_state.get("ticker_suggestions"):
+            query, suggestions = st.session_state["ticker_suggestions"]
+            st.warning(f"Ticker „{query}“ nenalezen." + (" Mysleli jste:" if suggestions else ""))
+            for t, name in suggestions:
+                st.button(f"{t} · {name}" if name else t, key=f"suggest_{t}", use_container_width=True,
+                          on_click=_pick_suggested_ticker, args=(t,))
+            if query:
+                st.button(f"Přesto analyzovat {query}", key="suggest_force", use_container_width=True,
+                          on_click=_pick_suggested_ticker, args=(query,))
         st.markdown("---")
         
         # DCF Settings
@@ -3707,155 +7322,41 @@ def main():
     ticker = ticker_input if analyze_btn else st.session_state.get("last_ticker", "AAPL")
     st.session_state["last_ticker"] = ticker
     
-    # Fetch data
+    # Fetch data (interaktivní request -> spekulativní prefetch ustoupí)
+    cancel_prefetch()
     with st.spinner(f"📊 Načítám data pro {ticker}..."):
-        info = fetch_ticker_info(ticker)
-        
-        if not info:
-            st.error(f"❌ Nepodařilo se načíst data pro {ticker}. Zkontroluj ticker.")
-            st.stop()
-        
-        company = info.get("longName") or info.get("shortName") or ticker
-        metrics = extract_metrics(info, ticker)
-        # Multi-source enrichment for core fundamentals (fills missing values + tracks sources)
-        metrics, metrics_enrich_dbg = enrich_metrics_multisource(ticker, metrics, info)
-        st.session_state["metrics_enrich_debug"] = metrics_enrich_dbg
-
-        price_history = fetch_price_history(ticker, period="1y")
-        income, balance, cashflow = fetch_financials(ticker)
-        
-        # Advanced data
-        ath = get_all_time_high(ticker)
-        insider_df = fetch_insider_transactions_fmp(ticker)
-        insider_signal = compute_insider_pro_signal(insider_df)
-        
-        # DCF calculations
-        market_cap_for_fcf = safe_float(info.get('marketCap'))
-        fcf, fcf_dbg = get_fcf_ttm_yfinance(ticker, market_cap_for_fcf)
-        # FCF debug suppressed in UI
-        shares = safe_float(info.get("sharesOutstanding"))
-        current_price = metrics.get("price").value if metrics.get("price") else None
-
-        # Decide DCF inputs (Smart vs Manual)
-        used_dcf_growth = float(dcf_growth)
-        used_dcf_wacc = float(dcf_wacc)
-        used_exit_multiple = float(dcf_exit_multiple)
-        used_mode_label = "Manual"
-
-        if st.session_state.get("smart_dcf", True):
-            smart = estimate_smart_params(info, metrics)
-            used_dcf_growth = float(smart["growth"])
-            used_dcf_wacc = float(smart["wacc"])
-            used_exit_multiple = float(smart["exit_multiple"])
-            used_mode_label = "Smart"
-
-        
-        # --- Amazon-style reinvestment heavy adjustment (Adjusted FCF) ---
-        # If FCF is unusually low relative to Operating Cash Flow, treat it as heavy reinvestment and
-        # use an adjusted cash-flow proxy for DCF (maintenance earnings proxy).
-        dcf_fcf_used = fcf
-        try:
-            operating_cashflow = safe_float(info.get("operatingCashflow"))
-        except Exception:
-            operating_cashflow = None
-
-        if operating_cashflow and dcf_fcf_used and dcf_fcf_used > 0 and operating_cashflow > 0:
-            if dcf_fcf_used < (0.3 * operating_cashflow):
-                dcf_fcf_used = operating_cashflow * 0.6
-                st.warning("⚠️ Detekováno vysoké reinvestování (Amazon style). Použito upravené OCF místo FCF.")
-        fair_value_dcf = None
-        mos_dcf = None
-        implied_growth = None
-        
-        if dcf_fcf_used and shares and dcf_fcf_used > 0:
-            # --- NOVÝ VÝPOČET DCF (Exit Multiple Metoda) ---
-            # 1. Spočítáme budoucí FCF pro každý rok
-            future_fcf = []
-            current_fcf = dcf_fcf_used
-            
-            # Diskontní faktor
-            discount_factors = [(1 + used_dcf_wacc) ** i for i in range(1, dcf_years + 1)]
-            
-            for i in range(dcf_years):
-                current_fcf = current_fcf * (1 + used_dcf_growth)
-                future_fcf.append(current_fcf)
-            
-            # 2. Terminal Value (Hodnota na konci 5. roku)
-            # Použijeme Exit Multiple (pro Big Tech standardně 25x, ne konzervativní Gordon)
-            exit_multiple = float(used_exit_multiple)
-            terminal_value = future_fcf[-1] * exit_multiple
-            
-            # 3. Diskontování na dnešní hodnotu (PV)
-            pv_cash_flows = sum([f / d for f, d in zip(future_fcf, discount_factors)])
-            pv_terminal_value = terminal_value / ((1 + used_dcf_wacc) ** dcf_years)
-            
-            enterprise_value = pv_cash_flows + pv_terminal_value
-            
-            # 4. Equity Value (EV + Cash - Debt)
-            total_cash = safe_float(info.get("totalCash")) or 0
-            total_debt = safe_float(info.get("totalDebt")) or 0
-            equity_value = enterprise_value + total_cash - total_debt
-            
-            fair_value_dcf = equity_value / shares
-            
-            # Přepočet MOS a Implied Growth
-            if current_price:
-                mos_dcf = (fair_value_dcf / current_price) - 1.0
-                implied_growth = reverse_dcf_implied_growth(
-                    current_price, fcf, dcf_terminal, dcf_wacc, dcf_years, shares
-                )
-        
-        # Analyst fair value
-        analyst_target = metrics.get("target_mean").value if metrics.get("target_mean") else None
-        mos_analyst = None
-        if analyst_target and current_price:
-            mos_analyst = (analyst_target / current_price) - 1.0
-        
-        # Scorecard
-        scorecard, category_scores, individual_scores = build_scorecard_advanced(metrics, info)
-        
-        # Verdict
-        verdict, verdict_color, verdict_warnings = get_advanced_verdict(
-            scorecard, mos_dcf, mos_analyst, insider_signal.get("signal", 0), implied_growth
+        analysis = run_analysis(
+            ticker, smart_dcf=st.session_state.get("smart_dcf", True), dcf_growth=dcf_growth,
+            dcf_terminal=dcf_terminal, dcf_wacc=dcf_wacc, dcf_years=dcf_years, dcf_exit_multiple=dcf_exit_multiple,
         )
-        
-        # Peers
-        sector = info.get("sector", "")
-        auto_peers = get_auto_peers(ticker, sector, info)
-
-        # === NOVÉ ANALYTICKÉ VÝPOČTY v6.0 ===
-        # Technické indikátory
-        price_history_1y = fetch_price_history(ticker, "1y")
-        tech_signals = calculate_technical_signals(price_history_1y)
-
-        # Piotroski F-Score
-        piotroski_score, piotroski_breakdown = calculate_piotroski_fscore(info, income, balance, cashflow)
-
-        # Altman Z-Score
-        altman_z, altman_zone = calculate_altman_zscore(info, income=income, balance=balance)
-
-        # Graham Number
-        graham_number = calculate_graham_number(info)
-
-        # Earnings Quality
-        earnings_quality_ratio, earnings_quality_label = calculate_earnings_quality(info)
-
-        # Short Interest
-        short_interest = get_short_interest(info)
-
-        # Monte Carlo DCF
-        mc_dcf = {}
-        if fcf and shares and fcf > 0 and shares > 0:
-            mc_dcf = monte_carlo_dcf(fcf, used_dcf_growth, dcf_terminal, used_dcf_wacc, dcf_years, shares)
-
-        # Value Trap detection (nyní funguje správně)
-        is_value_trap, value_trap_msg = detect_value_trap(info, metrics)
+    if analysis is None:
+        st.error(f"❌ Nepodařilo se načíst data pro {ticker}. Zkontroluj ticker.")
+        st.stop()
 
-        # Earnings countdown
-        next_earnings = get_earnings_calendar_estimate(ticker, info)
-        earnings_countdown = None
-        if next_earnings:
-            earnings_countdown = (next_earnings - dt.date.today()).days
+    a = analysis
+    bundle, info, company, metrics, sector = a["bundle"], a["info"], a["company"], a["metrics"], a["sector"]
+    st.session_state["metrics_enrich_debug"] = a["metrics_enrich_dbg"]
+    st.session_state["insider_debug"] = a["insider_meta"]
+    pending, pending_keys, analysis_deadline = list(a["pending"]), list(a["pending_keys"]), a["deadline"]
+    price_history, price_history_1y = a["price_history"], a["price_history_1y"]
+    ath, insider_signal = a["ath"], a["insider_signal"]
+    note_memory_saved("insider", a["insider_df"])
+    note_memory_saved("ohlcv", bundle.ohlcv)
+    fcf, shares, current_price, analyst_target = a["fcf"], a["shares"], a["current_price"], a["analyst_target"]
+    used_dcf_growth, used_dcf_wacc, used_exit_multiple, used_mode_label = (
+        a["used_dcf_growth"], a["used_dcf_wacc"], a["used_exit_multiple"], a["used_mode_label"]
+    )
+    if a["reinvestment_adjusted"]:
+        st.warning("⚠️ Detekováno vysoké reinvestování (Amazon style). Použito upravené OCF místo FCF.")
+    fair_value_dcf, mos_dcf, implied_growth, mc_dcf = a["fair_value_dcf"], a["mos_dcf"], a["implied_growth"], a["mc_dcf"]
+    scorecard, category_scores, individual_scores = a["scorecard"], a["category_scores"], a["individual_scores"]
+    verdict, verdict_color, verdict_warnings = a["verdict"], a["verdict_color"], a["verdict_warnings"]
+    auto_peers, tech_signals = a["auto_peers"], a["tech_signals"]
+    piotroski_score, piotroski_breakdown = a["piotroski_score"], a["piotroski_breakdown"]
+    altman_z, altman_zone, graham_number = a["altman_z"], a["altman_zone"], a["graham_number"]
+    earnings_quality_ratio, earnings_quality_label = a["earnings_quality_ratio"], a["earnings_quality_label"]
+    short_interest, is_value_trap, value_trap_msg = a["short_interest"], a["is_value_trap"], a["value_trap_msg"]
+    next_earnings, earnings_countdown = a["next_earnings"], a["earnings_countdown"]
     
     # ========================================================================
     # SMART HEADER (5 cards)
@@ -3863,6 +7364,11 @@ def main():
     
     st.title(f"{company} ({ticker})")
     st.caption(f"📊 {sector} | Market Cap: {fmt_money(info.get('marketCap'), 0) if info.get('marketCap') else '—'}")
+    data_as_of = dt.datetime.fromtimestamp(bundle.fetched_at).strftime("%d.%m. %H:%M") if bundle.fetched_at else "—"
+    if fetch_ticker_bundle.swr_status(ticker)["refreshing"]:
+        data_as_of += " · obnovuje se…"
+    if pending:
+        st.info(f"⏳ Ještě se načítá: {', '.join(PENDING_LABELS[p] for p in pending)} – hodnoty označené ⏳ se doplní automaticky.")
 
     # Value Trap warning (nyní funkční)
     if is_value_trap:
@@ -3876,6 +7382,7 @@ def main():
         <div class="metric-card">
             <div class="metric-label">Aktuální cena</div>
             <div class="metric-value">{fmt_money(current_price)}</div>
+            <div class="metric-delta" style="color: #888;">k {data_as_of}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -3936,7 +7443,7 @@ def main():
         <div class="metric-card" style="border: 2px solid {verdict_color};">
             <div class="metric-label">Sektor</div>
             <div class="metric-value" style="font-size: 1.1rem;">{sector[:18]}</div>
-            <div class="metric-delta" style="color: {verdict_color}; font-weight: 700;">{verdict}</div>
+            <div class="metric-delta" style="color: {verdict_color}; font-weight: 700;">{verdict}{" ⏳" if pending else ""}</div>
         </div>
         """, unsafe_allow_html=True)
     
@@ -3969,6 +7476,8 @@ def main():
     # ------------------------------------------------------------------------
     with tabs[0]:
         st.markdown('<div class="section-header">📊 Rychlý přehled</div>', unsafe_allow_html=True)
+        if "enrichment" in pending:
+            st.caption(f"⏳ Chybějící metriky se ještě doplňují ({PENDING_LABELS['enrichment']}).")
         
         # Two columns
         left, right = st.columns([1, 1])
@@ -4058,6 +7567,8 @@ def main():
         # Insider signal
         st.markdown("---")
         st.markdown("#### 🔐 Insider Trading Signal")
+        if "insider" in pending:
+            st.info("⏳ Insider transakce se ještě načítají – signál níže je zatím neutrální.")
         
         ins1, ins2, ins3 = st.columns(3)
         with ins1:
@@ -4161,9 +7672,10 @@ def main():
         if auto_peers:
             st.markdown("#### Earnings konkurence")
             peer_earnings = []
-            for peer in auto_peers[:3]:
-                peer_info = fetch_ticker_info(peer)
-                peer_date = get_earnings_calendar_estimate(peer, peer_info)
+            # Kalendáře peerů souběžně (info se pro odhad data nepoužívá, nestahujeme ho)
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                peer_dates = list(executor.map(lambda p: get_earnings_calendar_estimate(p, {}), auto_peers[:3]))
+            for peer, peer_date in zip(auto_peers[:3], peer_dates):
                 if peer_date:
                     peer_earnings.append({
                         "Ticker": peer,
@@ -4222,7 +7734,8 @@ def main():
                         current_price=current_price,
                         scorecard=scorecard,
                         macro_events=MACRO_CALENDAR,
-                        insider_signal=insider_signal
+                        insider_signal=insider_signal,
+                        bundle=bundle,
                     )
                     
                     # Uložení výsledku do session_state
@@ -4302,10 +7815,19 @@ def main():
         else:
             st.success(f"🔍 Nalezeno {len(auto_peers)} konkurentů: {', '.join(auto_peers)}")
             
+            peer_epoch = market_epoch([ticker] + list(auto_peers))
+            peers_key = ("peers", ticker, tuple(auto_peers), peer_epoch)
             with st.spinner("Načítám data konkurence..."):
-                peer_df = fetch_peer_comparison(ticker, auto_peers)
+                peers_done, peers_res = _deadline_result(
+                    peers_key, lambda: fetch_peer_tab(ticker, auto_peers, peer_epoch), analysis_deadline
+                )
+            peer_df, ttm_all = peers_res if peers_done else (None, None)
+            if not peers_done:
+                pending.append("peers")
+                pending_keys.append(peers_key)
+                st.info(f"⏳ Ještě se načítá {PENDING_LABELS['peers']} – doplní se automaticky.")
             
-            if not peer_df.empty:
+            if peers_done and not peer_df.empty:
                 # Format for display
                 display_df = peer_df.copy()
                 display_df['P/E'] = display_df['P/E'].apply(lambda x: fmt_num(x))
@@ -4353,7 +7875,42 @@ def main():
                         
                         for insight in insights:
                             st.write(f"• {insight}")
-            else:
+
+                # Cenová výkonnost a korelace denních výnosů (universe matice, jinak hromadný download)
+                peer_tickers = [ticker] + list(auto_peers)
+                closes = universe_close_frame(peer_tickers, start=pd.Timestamp.today() - pd.DateOffset(years=1))
+                if closes is None:
+                    closes = fetch_batch_history(tuple(sorted(peer_tickers)), "1y", "Close", market_epoch(peer_tickers))
+                if closes is not None and ticker in getattr(closes, "columns", []) and len(closes) > 20:
+                    rets = closes.astype(float).pct_change(fill_method=None)
+                    perf = pd.DataFrame({
+                        "Výnos 1R": closes.astype(float).apply(lambda s: s.dropna().iloc[-1] / s.dropna().iloc[0] - 1 if s.notna().sum() > 1 else np.nan),
+                        f"Korelace s {ticker}": rets.corrwith(rets[ticker]),
+                    }).reindex([t for t in peer_tickers if t in closes.columns])
+                    st.markdown("#### 📈 Výkonnost a korelace (1 rok)")
+                    st.dataframe(
+                        perf.style.format({"Výnos 1R": lambda x: fmt_pct(x), f"Korelace s {ticker}": lambda x: fmt_num(x)}),
+                        use_container_width=True,
+                    )
+
+                # TTM fundamenty z kvartálních výkazů (jeden dávkový průchod TTM enginem, součást peers jobu)
+                ttm_fields = {"revenue": "Tržby", "ebit": "EBIT", "net_income": "Čistý zisk", "operating_cash_flow": "OCF"}
+                if not ttm_all.empty:
+                    ttm_view = ttm_all.reset_index()
+                    ttm_view = ttm_view[ttm_view["field"].isin(list(ttm_fields))]
+                    shown = [f for f in ttm_fields if f in set(ttm_view["field"])]
+                    ttm_table = pd.concat([
+                        (ttm_view.pivot(index="ticker", columns="field", values="ttm")[shown] / 1e9).rename(columns=lambda f: f"{ttm_fields[f]} TTM ($B)"),
+                        ttm_view.pivot(index="ticker", columns="field", values="yoy")[shown].rename(columns=lambda f: f"{ttm_fields[f]} YoY"),
+                    ], axis=1).reindex([t for t in peer_tickers if t in set(ttm_view["ticker"])])
+                    st.markdown("#### 🧾 TTM fundamenty (kvartální výkazy)")
+                    st.dataframe(
+                        ttm_table.style.format({c: (fmt_pct if c.endswith("YoY") else fmt_num) for c in ttm_table.columns}),
+                        use_container_width=True,
+                    )
+                    if ttm_view[ttm_view["field"].isin(shown)]["yoy_quarter"].astype(bool).any():
+                        st.caption("YoY: kde chybí dva celé TTM roky, jde o poslední kvartál vs. stejný kvartál o rok dřív.")
+            elif peers_done:
                 st.warning("Nepodařilo se načíst data konkurence")
     
     # ------------------------------------------------------------------------
@@ -4763,6 +8320,24 @@ def main():
                 )
                 st.plotly_chart(fig_ta, use_container_width=True)
 
+            # --- Intraday (lokální 1m/5m store) ---
+            st.markdown("### ⏱️ Intraday")
+            intraday_span = st.radio("Rozsah", ["1d", "5d"], horizontal=True, key="intraday_span",
+                                     format_func=lambda x: {"1d": "Dnes (1m)", "5d": "Týden (5m)"}[x])
+            intraday = fetch_intraday_bars(ticker, intraday_span, market_epoch(ticker, open_ttl=INTRADAY_REFRESH_S))
+            if not intraday.empty and "Close" in intraday.columns:
+                fig_id = go.Figure(go.Scatter(x=intraday.index, y=intraday["Close"], name="Cena",
+                                              line=dict(color="#4fc3f7", width=1.5)))
+                fig_id.update_layout(
+                    height=260, margin=dict(l=10, r=10, t=10, b=10),
+                    paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font={"color": "white"},
+                    xaxis=dict(gridcolor="rgba(255,255,255,0.1)", rangebreaks=[dict(bounds=["sat", "mon"])]),
+                    yaxis=dict(gridcolor="rgba(255,255,255,0.1)")
+                )
+                st.plotly_chart(fig_id, use_container_width=True)
+            else:
+                st.caption("Intraday data nejsou k dispozici.")
+
             # --- Volume trend ---
             vol_trend = tech_signals.get("vol_trend")
             if vol_trend is not None:
@@ -4914,10 +8489,14 @@ def main():
         
         if items:
             rows = []
+            # Jeden hromadný request na ceny celé watchlistu místo fetch_ticker_info pro každý ticker
+            quotes = fetch_batch_quotes(tuple(sorted(items)), market_epoch(items))
             for tkr, item in items.items():
-                inf = fetch_ticker_info(tkr)
-                # OPRAVA: správně čteme currentPrice, ne marketCap
-                price_now = safe_float(inf.get("currentPrice") or inf.get("regularMarketPrice"))
+                if not quotes.empty and tkr in quotes.index:
+                    price_now = safe_float(quotes.at[tkr, "Price"])
+                else:
+                    inf = fetch_ticker_info(tkr, market_epoch(tkr))
+                    price_now = safe_float(inf.get("currentPrice") or inf.get("regularMarketPrice"))
                 tgt = safe_float(item.get("target_buy"))  # OPRAVA: čteme target_buy, ne marketCap
                 
                 if price_now is not None and tgt is not None and tgt > 0:
@@ -5043,9 +8622,18 @@ def main():
                     st.markdown(result)
 
 
+    # Opožděné providery (deadline) -> rerun, jakmile doběhnou; teprve kompletní analýza spustí prefetch
+    if pending_keys:
+        _rerun_when_loaded(pending_keys)
+    else:
+        prefetch_likely_next(ticker, auto_peers)
+
     # Footer
     st.markdown("---")
-    st.caption(f"📊 Data: Yahoo Finance | {APP_NAME} v6.0 | Toto není investiční doporučení")
+    st.caption(
+        f"📊 Data: Yahoo Finance | {APP_NAME} v6.0 | Toto není investiční doporučení"
+        f" | 🧮 kompaktní dtypes: −{session_memory_saved() / 1e6:.1f} MB v této session"
+    )
 
 
 def display_welcome_screen():
@@ -5078,7 +8666,7 @@ def display_welcome_screen():
     # Sample tickers
     st.markdown("### 💡 Populární tickery na vyzkoušení")
     cols = st.columns(4)
-    samples = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "META", "NFLX"]
+    samples = WELCOME_SAMPLE_TICKERS
     
     for i, ticker in enumerate(samples):
         with cols[i % 4]:
@@ -5091,4 +8679,7 @@ def display_welcome_screen():
 
 
 if __name__ == "__main__":
-    main()
+    if "--benchmark" in sys.argv:
+        _benchmark_cli(sys.argv[1:])
+    else:
+        main()